@@ -0,0 +1,441 @@
+"""
+Streaming analyzer for the JSON-lines event logs written by backend.event_log.
+
+Every log file, including rotated (`orders.log.1`, `orders.log.2024-05-01`)
+and gzip-compressed ones, is read exactly once, line by line, so memory use
+does not grow with the size of the logs. The report contains per-domain event
+counts and error rates, and per-endpoint request counts, error rates and
+latency percentiles from the REQUEST_COMPLETED events in `http.log`.
+Sampled `*_STARTED` events are scaled back up by their sample rate.
+
+    python -m backend.analyze_logs                      # today
+    python -m backend.analyze_logs --since 6h --bucket 30m
+    python -m backend.analyze_logs --since 2024-05-01 --until 2024-05-02 --json
+    python -m backend.analyze_logs --state backend/logs/.analyze_state.json
+
+With --state only the lines appended since the previous run are analysed and
+the read offsets are saved for the next run, which makes it cheap to run
+from cron.
+"""
+import argparse
+import glob
+import gzip
+import json
+import math
+import os
+import re
+import sys
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+LOG_DIR = os.getenv('LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs'))
+DOMAINS = ("orders", "drivers", "users", "consumers", "sellers", "http", "db", "app")
+REQUEST_EVENT = "REQUEST_COMPLETED"
+STARTED_SUFFIX = "_STARTED"
+ERROR_SUFFIXES = ("_ERROR", "_FAILED")
+RECENT_ERRORS = 5
+
+_RELATIVE = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+_TIMESTAMP_PREFIX = b'{"timestamp": "'
+
+
+def parse_time(value: str, now: datetime = None) -> datetime:
+    """
+    Parse "today", "yesterday", a relative age such as "90m" / "24h" / "7d", or an ISO timestamp.
+    """
+    now = now or datetime.now()
+    if value == "now":
+        return now
+    if value == "today":
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if value == "yesterday":
+        return now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    match = _RELATIVE.match(value)
+    if match:
+        return now - timedelta(**{_UNITS[match.group(2)]: float(match.group(1))})
+    return datetime.fromisoformat(value)
+
+
+def parse_duration(value: str) -> timedelta:
+    match = _RELATIVE.match(value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value}")
+    return timedelta(**{_UNITS[match.group(2)]: float(match.group(1))})
+
+
+class LatencyDigest:
+    """
+    Fixed-memory latency distribution with logarithmic buckets.
+
+    Percentiles are accurate to within RATIO (2%) of the true value, no matter
+    how many samples are added.
+    """
+    RATIO = 1.02
+    _LOG_RATIO = math.log(RATIO)
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        index = math.ceil(math.log(value) / self._LOG_RATIO) if value > 0 else None
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        # None holds the zero samples and sorts before every real bucket.
+        for index in sorted(self.buckets, key=lambda i: -math.inf if i is None else i):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return 0.0 if index is None else min(self.max, self.RATIO ** index)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class DomainStats:
+    """
+    Event counts of one log domain.
+    """
+
+    def __init__(self):
+        self.events = defaultdict(float)
+        self.records = 0
+        self.errors = 0.0
+        self.outcomes = 0.0
+        self.recent_errors = deque(maxlen=RECENT_ERRORS)
+
+    def add(self, record: dict, weight: float):
+        event_type = record.get("event_type") or f"{record.get('level', 'LOG')} {record.get('logger', '')}".rstrip()
+        self.records += 1
+        self.events[event_type] += weight
+        if event_type.endswith(STARTED_SUFFIX):
+            return
+        self.outcomes += weight
+        if event_type.endswith(ERROR_SUFFIXES) or record.get("level") in ("ERROR", "CRITICAL"):
+            self.errors += weight
+            self.recent_errors.append(record)
+
+
+class EndpointStats:
+    """
+    Request counts and latency of one endpoint, or of one time bucket.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.server_errors = 0
+        self.client_errors = 0
+        self.latency = LatencyDigest()
+        self.db_queries = 0
+        self.db_ms = 0.0
+
+    def add(self, data: dict):
+        status = int(data.get("status", 0))
+        self.requests += 1
+        if status >= 500:
+            self.server_errors += 1
+        elif status >= 400:
+            self.client_errors += 1
+        self.latency.add(float(data.get("duration_ms", 0.0)))
+        self.db_queries += int(data.get("db_queries", 0))
+        self.db_ms += float(data.get("db_ms", 0.0))
+
+    def summary(self) -> dict:
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "error_rate": self.server_errors / requests,
+            "client_error_rate": self.client_errors / requests,
+            "mean_ms": self.latency.mean(),
+            "p50_ms": self.latency.percentile(50),
+            "p95_ms": self.latency.percentile(95),
+            "p99_ms": self.latency.percentile(99),
+            "max_ms": self.latency.max,
+            "db_queries_per_request": self.db_queries / requests,
+            "db_ms_per_request": self.db_ms / requests,
+        }
+
+
+class Report:
+    """
+    Aggregates log records in one pass.
+
+    Args:
+        since (datetime): Ignore records before this time.
+        until (datetime): Ignore records at or after this time.
+        bucket (timedelta): Optional width of the time-series windows.
+    """
+
+    def __init__(self, since: datetime = None, until: datetime = None, bucket: timedelta = None):
+        self.since = since
+        self.until = until
+        self.since_key = since.isoformat() if since else None
+        self.until_key = until.isoformat() if until else None
+        self.bucket = bucket
+        self.domains = defaultdict(DomainStats)
+        self.endpoints = defaultdict(EndpointStats)
+        self.windows = defaultdict(EndpointStats)
+        self.window_events = defaultdict(lambda: defaultdict(float))
+        self.first = None
+        self.last = None
+        self.skipped = 0
+
+    def in_window(self, timestamp: str) -> bool:
+        # ISO timestamps of the same format compare correctly as strings.
+        if self.since_key and timestamp < self.since_key:
+            return False
+        if self.until_key and timestamp >= self.until_key:
+            return False
+        return True
+
+    def feed(self, line: bytes, domain: str):
+        """
+        Parse and aggregate one log line.
+        """
+        if line.startswith(_TIMESTAMP_PREFIX):
+            # Cheap time filter before paying for json.loads.
+            end = line.find(b'"', len(_TIMESTAMP_PREFIX))
+            if end > 0 and not self.in_window(line[len(_TIMESTAMP_PREFIX):end].decode()):
+                return
+            payload = line
+        else:
+            # Lines written before the JSON-lines format: "<asctime> - LEVEL - {json}"
+            start = line.find(b"{")
+            if start < 0:
+                self.skipped += 1
+                return
+            payload = line[start:]
+        try:
+            record = json.loads(payload)
+            timestamp = record["timestamp"]
+        except (ValueError, KeyError, TypeError):
+            self.skipped += 1
+            return
+        if not isinstance(timestamp, str):
+            # Legacy payloads such as order data carry their own "timestamp": null.
+            self.skipped += 1
+            return
+        if not self.in_window(timestamp):
+            return
+
+        weight = 1.0 / float(record.get("sample_rate") or 1.0)
+        domain = record.get("domain") or domain
+        self.domains[domain].add(record, weight)
+        if self.first is None or timestamp < self.first:
+            self.first = timestamp
+        if self.last is None or timestamp > self.last:
+            self.last = timestamp
+
+        window = self.window_of(timestamp) if self.bucket else None
+        if window is not None:
+            self.window_events[window][domain] += weight
+        if record.get("event_type") == REQUEST_EVENT:
+            data = record.get("data") or {}
+            self.endpoints[f"{data.get('method', '?')} {data.get('route', '?')}"].add(data)
+            if window is not None:
+                self.windows[window].add(data)
+
+    def window_of(self, timestamp: str) -> str:
+        moment = datetime.fromisoformat(timestamp)
+        origin = self.since or datetime(1970, 1, 1)
+        steps = (moment - origin) // self.bucket
+        return (origin + steps * self.bucket).isoformat(timespec="seconds")
+
+    def to_dict(self) -> dict:
+        return {
+            "since": self.since_key,
+            "until": self.until_key,
+            "first_record": self.first,
+            "last_record": self.last,
+            "skipped_lines": self.skipped,
+            "domains": {
+                name: {
+                    "records": stats.records,
+                    "events": dict(sorted(stats.events.items(), key=lambda item: -item[1])),
+                    "errors": stats.errors,
+                    "error_rate": stats.errors / stats.outcomes if stats.outcomes else 0.0,
+                    "recent_errors": list(stats.recent_errors),
+                }
+                for name, stats in sorted(self.domains.items())
+            },
+            "endpoints": {
+                name: stats.summary()
+                for name, stats in sorted(self.endpoints.items(), key=lambda item: -item[1].latency.total)
+            },
+            "windows": {
+                window: {
+                    "events": dict(self.window_events[window]),
+                    **(self.windows[window].summary() if window in self.windows else {}),
+                }
+                for window in sorted(self.window_events)
+            },
+        }
+
+
+def log_files(directory: str, domains):
+    """
+    List the current and rotated files of each domain, oldest first.
+
+    Returns:
+        list: (domain, path) pairs.
+    """
+    files = []
+    for domain in domains:
+        base = os.path.join(directory, f"{domain}.log")
+        rotated = [path for path in glob.glob(base + ".*") if not path.endswith(".tmp")]
+
+        def age(path):
+            suffix = path[len(base) + 1:].removesuffix(".gz")
+            # Numbered backups grow older with the number; dated backups sort by date.
+            return (0, -int(suffix), "") if suffix.isdigit() else (1, 0, suffix)
+
+        for path in sorted(rotated, key=age):
+            files.append((domain, path))
+        if os.path.exists(base):
+            files.append((domain, base))
+    return files
+
+
+def file_key(path: str) -> str:
+    """
+    Identity of a log file that survives renames by the rotating handler.
+    Compressed files are rewritten on compression, so they are keyed by name and size.
+    """
+    stat = os.stat(path)
+    if path.endswith(".gz"):
+        return f"gz:{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+def read_file(path: str, report: Report, domain: str, offset: int = 0) -> int:
+    """
+    Feed the complete lines of a file from offset on into the report.
+
+    Returns:
+        int: Offset after the last complete line.
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                report.feed(line.rstrip(b"\r\n"), domain)
+        return -1
+    with open(path, "rb") as f:
+        if offset > os.fstat(f.fileno()).st_size:
+            offset = 0  # truncated or recreated
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # the writer is in the middle of this line
+            offset += len(line)
+            report.feed(line.rstrip(b"\r\n"), domain)
+    return offset
+
+
+def analyze(directory: str, domains, report: Report, state_path: str = None) -> Report:
+    """
+    Run the report over every log file, resuming from saved offsets if state_path is given.
+    """
+    state = {}
+    if state_path and os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f).get("files", {})
+
+    seen = {}
+    for domain, path in log_files(directory, domains):
+        try:
+            key = file_key(path)
+        except FileNotFoundError:
+            continue  # rotated away while listing
+        offset = state.get(key, {}).get("offset", 0) if state_path else 0
+        if offset == -1:
+            seen[key] = state[key]
+            continue
+        seen[key] = {"path": path, "offset": read_file(path, report, domain, offset)}
+
+    if state_path:
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"updated_at": datetime.now().isoformat(), "files": seen}, f)
+        os.replace(tmp_path, state_path)
+    return report
+
+
+def print_report(data: dict, out=sys.stdout):
+    window = f"{data['since'] or '…'} ~ {data['until'] or '…'}"
+    print(f"=== 系統分析報告 ({window}) ===", file=out)
+    if data["first_record"] is None:
+        print("沒有符合條件的記錄", file=out)
+        return
+    print(f"記錄時間範圍：{data['first_record']} ~ {data['last_record']}", file=out)
+    if data["skipped_lines"]:
+        print(f"無法解析的行數：{data['skipped_lines']}", file=out)
+
+    for name, domain in data["domains"].items():
+        print(f"\n--- {name} ---", file=out)
+        print(f"事件數：{domain['records']}  錯誤數：{domain['errors']:.0f}  錯誤率：{domain['error_rate']:.2%}", file=out)
+        for event_type, count in domain["events"].items():
+            print(f"  {event_type:<32} {count:>10.0f}", file=out)
+        for record in domain["recent_errors"]:
+            print(f"  ! {record['timestamp']} {record.get('event_type') or record.get('message')} "
+                  f"{json.dumps(record.get('data', record.get('exc_info', '')), ensure_ascii=False)[:200]}", file=out)
+
+    if data["endpoints"]:
+        print("\n=== 端點效能 (ms) ===", file=out)
+        print(f"{'endpoint':<52} {'reqs':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'db q':>5}", file=out)
+        for name, stats in data["endpoints"].items():
+            print(f"{name[:52]:<52} {stats['requests']:>7} {stats['error_rate']:>6.1%} {stats['p50_ms']:>8.1f} "
+                  f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} "
+                  f"{stats['db_queries_per_request']:>5.1f}", file=out)
+
+    if data["windows"]:
+        print("\n=== 時間區間 ===", file=out)
+        print(f"{'window':<20} {'events':>8} {'reqs':>7} {'err%':>6} {'p95':>8}", file=out)
+        for window, stats in data["windows"].items():
+            print(f"{window:<20} {sum(stats['events'].values()):>8.0f} {stats.get('requests', 0):>7} "
+                  f"{stats.get('error_rate', 0.0):>6.1%} {stats.get('p95_ms', 0.0):>8.1f}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze the backend JSON-lines event logs.")
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("--domain", action="append", dest="domains",
+                        help="Log domain to read (repeatable); defaults to all known domains.")
+    parser.add_argument("--since", default=None,
+                        help="today, yesterday, a relative age (30m, 24h, 7d) or an ISO timestamp. "
+                             "Defaults to today, or to everything with --state.")
+    parser.add_argument("--until", default=None)
+    parser.add_argument("--bucket", type=parse_duration, default=None,
+                        help="Also break the report into windows of this width, e.g. 15m or 1h.")
+    parser.add_argument("--state", default=None,
+                        help="Offset file; only lines appended since the previous run are read.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    since = args.since or (None if args.state else "today")
+    report = Report(
+        since=parse_time(since) if since else None,
+        until=parse_time(args.until) if args.until else None,
+        bucket=args.bucket,
+    )
+    analyze(args.log_dir, args.domains or DOMAINS, report, args.state)
+    data = report.to_dict()
+    if args.json:
+        json.dump(data, sys.stdout, ensure_ascii=False, indent=2, default=str)
+        print()
+    else:
+        print_report(data)
+
+
+if __name__ == "__main__":
+    main()
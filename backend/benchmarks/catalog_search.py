@@ -0,0 +1,104 @@
+"""
+Latency benchmark for GET /api/consumer/search.
+
+Builds a synthetic copy of `agricultural_produce` (100k rows by default) with
+the production indexes in a scratch schema, then times the search query for
+a mix of Chinese and short/long search terms and prints the query plan of the
+first term. The scratch schema is dropped afterwards.
+
+    DATABASE_URL=postgresql://... python -m backend.benchmarks.catalog_search --rows 100000
+"""
+import argparse
+import os
+import time
+import datetime as dt
+import psycopg
+from backend.benchmarks.load_test import percentile
+from backend.routers.consumer import SEARCH_QUERY, escape_like
+
+SCHEMA = "search_bench"
+TERMS = ["高麗菜", "番茄", "有機", "蔬菜", "山蘇", "小米酒", "香蕉", "菇"]
+
+SETUP = f"""
+    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+    CREATE SCHEMA {SCHEMA};
+    CREATE TABLE {SCHEMA}.agricultural_produce (LIKE public.agricultural_produce INCLUDING ALL);
+    CREATE TABLE {SCHEMA}.image_objects (LIKE public.image_objects INCLUDING ALL);
+"""
+
+# Names are built from a prefix, a produce word and a suffix so that terms
+# match at different positions and with different frequencies.
+POPULATE = f"""
+    INSERT INTO {SCHEMA}.agricultural_produce
+        (name, price, total_quantity, category, upload_date, off_shelf_date,
+         img_link, img_id, seller_id, unit, location)
+    SELECT
+        (ARRAY['有機','新鮮','部落','自然','']) [1 + i %% 5]
+            || (ARRAY['高麗菜','番茄','山蘇','小米','香蕉','香菇','地瓜','竹筍','龍鬚菜','愛玉']) [1 + (i / 5) %% 10]
+            || (ARRAY['','禮盒','一斤','小包','酒']) [1 + (i / 50) %% 5],
+        10 + i %% 500,
+        1 + i %% 20,
+        (ARRAY['蔬菜','水果','五穀雜糧','加工品','其他']) [1 + i %% 5],
+        %(today)s,
+        %(today)s + (i %% 30),
+        'https://example.com/' || i,
+        md5(i::text),
+        1 + i %% 200,
+        '斤',
+        (ARRAY['部落','山下','市區']) [1 + i %% 3]
+    FROM generate_series(1, %(rows)s) AS i
+"""
+
+
+def search_params(term, today, limit):
+    pattern = escape_like(term)
+    return {
+        "q": term,
+        "prefix": pattern + '%',
+        "pattern": '%' + pattern + '%',
+        "today": today,
+        "category": None,
+        "after_rank": None,
+        "after_id": None,
+        "limit": limit + 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="Synthetic products to generate")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per search term")
+    parser.add_argument("--limit", type=int, default=20, help="Page size")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema")
+    args = parser.parse_args()
+
+    today = dt.date.today()
+    with psycopg.connect(os.environ["DATABASE_URL"], autocommit=True) as conn:
+        conn.execute(SETUP)
+        started = time.perf_counter()
+        conn.execute(POPULATE, {"rows": args.rows, "today": today})
+        conn.execute(f"ANALYZE {SCHEMA}.agricultural_produce")
+        print(f"generated {args.rows} products in {time.perf_counter() - started:.1f}s")
+        conn.execute(f"SET search_path TO {SCHEMA}, public")
+        try:
+            plan = conn.execute("EXPLAIN ANALYZE " + SEARCH_QUERY, search_params(TERMS[0], today, args.limit)).fetchall()
+            print("\n".join(line[0] for line in plan))
+
+            for term in TERMS:
+                params = search_params(term, today, args.limit)
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    rows = conn.execute(SEARCH_QUERY, params).fetchall()
+                    timings.append(time.perf_counter() - started)
+                timings.sort()
+                print(f"{term:>6}  results={len(rows):>3}  "
+                      f"p50_ms={percentile(timings, 50) * 1000:.2f}  p95_ms={percentile(timings, 95) * 1000:.2f}")
+        finally:
+            conn.execute("SET search_path TO public")
+            if not args.keep:
+                conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark for the batch order dispatcher (backend.matching.dispatcher).
+
+Builds a synthetic service area of villages, drivers with time slots over
+the next days and thousands of unaccepted orders, then times the two parts
+of a dispatcher run: scoring every driver for every order and the
+capacitated assignment. The regret assignment is compared with handing
+orders out first come, first served. No database needed.
+
+    python -m backend.benchmarks.dispatch_throughput --orders 1000 --orders 5000 --drivers 200
+"""
+import argparse
+import datetime as dt
+import random
+import time
+import numpy as np
+from backend.geocoding.providers import Coordinates
+from backend.matching import DriverInfo, Slot, assign_orders, driver_matching
+from backend.matching.dispatcher import DISPATCH_DRIVER_CAPACITY
+from backend.routing import distance_matrix
+from backend.benchmarks.route_optimizer import LAT_RANGE, LNG_RANGE
+
+
+def synthetic_area(places, drivers, slots_per_driver, rng, now):
+    """
+    Fill the distance matrix with places and the slot index with drivers' slots.
+    """
+    distance_matrix.path = None  # keep the benchmark matrix in memory
+    names = [f"村落{i}" for i in range(places)]
+    distance_matrix.update({
+        name: Coordinates(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for name in names
+    }, source="benchmark")
+    slot_id = 0
+    for driver_id in range(1, drivers + 1):
+        driver = DriverInfo(driver_id, driver_id, f"司機{driver_id}", "0900000000", rng.choice(names))
+        for _ in range(slots_per_driver):
+            slot_id += 1
+            starts_at = now + dt.timedelta(hours=rng.uniform(0, 72))
+            driver_matching.add_slot(Slot(slot_id, driver_id, starts_at, rng.choice(names)), driver)
+    return names
+
+
+def synthetic_orders(count, names, rng, now):
+    """
+    Unaccepted orders in the order `pending_orders` returns them: urgent and oldest first.
+    """
+    orders = [
+        {
+            "service": rng.choice(("necessities", "agricultural_product")),
+            "id": order_id,
+            "location": rng.choice(names),
+            "is_urgent": rng.random() < 0.1,
+            "ready_at": now + dt.timedelta(hours=rng.uniform(0, 48)),
+            "pickups": [rng.choice(names)],
+        }
+        for order_id in range(1, count + 1)
+    ]
+    return sorted(orders, key=lambda order: (not order["is_urgent"], order["ready_at"]))
+
+
+def check_scores(orders, drivers, costs, now):
+    """
+    The batched scores must agree with ranking each order on its own.
+    """
+    for order, row in zip(orders, costs):
+        expected = {c["driver_id"]: c["score"] for c in driver_matching.candidates(order, limit=len(drivers), now=now)}
+        actual = {driver_id: round(float(score), 1) for driver_id, score in zip(drivers, row) if np.isfinite(score)}
+        if expected.keys() != actual.keys() or any(abs(expected[k] - actual[k]) > 1 for k in expected):
+            raise AssertionError(f"batched scores differ from candidates() for order {order['id']}")
+
+
+def first_come(costs, capacity):
+    """
+    Each order in turn takes its cheapest driver with capacity left.
+    """
+    remaining = np.array(capacity)
+    result = np.full(len(costs), -1)
+    for i, row in enumerate(costs):
+        row = np.where(remaining > 0, row, np.inf)
+        j = int(np.argmin(row))
+        if np.isfinite(row[j]):
+            result[i] = j
+            remaining[j] -= 1
+    return result
+
+
+def total_cost(costs, chosen):
+    rows = np.flatnonzero(chosen >= 0)
+    return float(costs[rows, chosen[rows]].sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, action="append", help="Pending orders per run (repeatable), default 1000 5000")
+    parser.add_argument("--drivers", type=int, default=200)
+    parser.add_argument("--slots", type=int, default=3, help="Time slots per driver")
+    parser.add_argument("--places", type=int, default=300)
+    parser.add_argument("--capacity", type=int, default=DISPATCH_DRIVER_CAPACITY)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = dt.datetime.now().replace(microsecond=0)
+    names = synthetic_area(args.places, args.drivers, args.slots, rng, now)
+    for count in args.orders or [1000, 5000]:
+        orders = synthetic_orders(count, names, rng, now)
+
+        started = time.perf_counter()
+        drivers, costs, _ = driver_matching.cost_matrix(orders, now)
+        rank_seconds = time.perf_counter() - started
+        check_scores(orders[:50], drivers, costs[:50], now)
+
+        capacity = np.full(len(drivers), args.capacity)
+        urgent = np.array([order["is_urgent"] for order in orders])
+
+        started = time.perf_counter()
+        chosen = assign_orders(costs, capacity, urgent)
+        assign_seconds = time.perf_counter() - started
+        baseline = first_come(costs, capacity)
+
+        if np.bincount(chosen[chosen >= 0], minlength=len(drivers)).max(initial=0) > args.capacity:
+            raise AssertionError("a driver got more orders than their capacity")
+        assigned = int((chosen >= 0).sum())
+        feasible = int(np.isfinite(costs).any(axis=1).sum())
+        urgent_assigned = int((chosen[urgent] >= 0).sum())
+        total = rank_seconds + assign_seconds
+        print(f"orders={count:>5} drivers={args.drivers} feasible={feasible} assigned={assigned} "
+              f"(urgent {urgent_assigned}/{int(urgent.sum())}, first_come {int((baseline >= 0).sum())})  "
+              f"rank_ms={rank_seconds * 1000:.0f} assign_ms={assign_seconds * 1000:.0f} "
+              f"orders_per_s={count / total:.0f}  "
+              f"mean_cost={total_cost(costs, chosen) / max(assigned, 1):.0f} "
+              f"(first_come {total_cost(costs, baseline) / max(int((baseline >= 0).sum()), 1):.0f})")
+
+
+if __name__ == "__main__":
+    main()
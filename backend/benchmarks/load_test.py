@@ -0,0 +1,154 @@
+"""
+Concurrent load generator for the backend API.
+
+Fires a fixed number of GET requests at one or more endpoints with a bounded
+number of in-flight requests and reports throughput and latency percentiles.
+Run it against a build before and after a change to compare results, e.g.
+
+    python -m backend.benchmarks.load_test --url http://localhost:8001 \
+        --path /api/orders/ --path /api/consumer/ --requests 2000 --concurrency 50
+
+With --compare it needs no running server: it serves the same query from an
+in-process app once through the psycopg2 pool, called inside the async
+handler as the routers used to, and once through the async pool behind
+`get_db`, then prints both results side by side. DATABASE_URL must point at
+a database; --db-latency adds a pg_sleep to the query to stand in for the
+network round trip to a remote server. Compare throughput: the psycopg2
+pool blocks the event loop, so its requests run one at a time and their
+individual latencies look short while the total time grows.
+
+    python -m backend.benchmarks.load_test --compare --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+async def run(url, paths, total, concurrency, timeout, transport=None):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits, transport=transport) as client:
+        async def one(index):
+            nonlocal errors
+            path = paths[index % len(paths)]
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def comparison_app(query):
+    """
+    App serving `query` from the psycopg2 pool at /sync and from the async pool at /async.
+    """
+    from fastapi import Depends, FastAPI
+    from backend.database import db_connection, get_db
+
+    app = FastAPI()
+
+    @app.get("/sync")
+    async def sync_pool():
+        with db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(query)
+                rows = cur.fetchall()
+            finally:
+                cur.close()
+                conn.rollback()
+        return len(rows)
+
+    @app.get("/async")
+    async def async_pool(conn=Depends(get_db)):
+        cur = conn.cursor()
+        try:
+            await cur.execute(query)
+            rows = await cur.fetchall()
+        finally:
+            await cur.close()
+        return len(rows)
+
+    return app
+
+
+async def compare(total, concurrency, timeout, db_latency):
+    from backend.database import close_async_pool, close_pool
+
+    query = f"SELECT pg_sleep({db_latency}), COUNT(*) FROM users"
+    transport = httpx.ASGITransport(app=comparison_app(query))
+    results = {}
+    try:
+        for name in ("sync", "async"):
+            # Warm up so both pools have their connections open before timing
+            await run("http://bench", [f"/{name}"], concurrency, concurrency, timeout, transport)
+            results[name] = await run("http://bench", [f"/{name}"], total, concurrency, timeout, transport)
+    finally:
+        await close_async_pool()
+        close_pool()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001", help="Base URL of the running API")
+    parser.add_argument("--path", action="append", dest="paths", help="Endpoint path, may be repeated")
+    parser.add_argument("--requests", type=int, default=1000, help="Total number of requests")
+    parser.add_argument("--concurrency", type=int, default=50, help="Maximum in-flight requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare the psycopg2 pool with the async pool in-process instead of hitting --url")
+    parser.add_argument("--db-latency", type=float, default=0.005,
+                        help="Seconds of pg_sleep added to the --compare query")
+    args = parser.parse_args()
+
+    if args.compare:
+        results = asyncio.run(compare(args.requests, args.concurrency, args.timeout, args.db_latency))
+        print(f"{'':>15}  {'sync pool':>10}  {'async pool':>10}")
+        for key in results["sync"]:
+            print(f"{key:>15}: {results['sync'][key]:>10}  {results['async'][key]:>10}")
+        return
+
+    paths = args.paths or ["/api/orders/"]
+    result = asyncio.run(run(args.url, paths, args.requests, args.concurrency, args.timeout))
+    for key, value in result.items():
+        print(f"{key:>15}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Regression benchmark for GET /api/orders.
+
+Calls `get_orders` against an in-memory fake connection that serves synthetic
+rows, and asserts that a warm worker runs the same two SQL statements however
+many orders there are: the resource version lookup behind the ETag and the
+list query. Coordinates and distances come from the in-memory distance
+matrix. Also reports the handler's own processing time.
+
+    python -m backend.benchmarks.orders_query_count --sizes 10 1000 10000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from fastapi import Response
+from backend.routers import orders
+from backend.geocoding import Coordinates
+from backend.routing import distance_matrix
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    async def execute(self, query, params=None):
+        self.conn.statements.append(query)
+        if "resource_versions" in query:
+            self.result = [("locations", 1)]
+        elif "location_coordinates" in query:
+            self.result = []
+        else:
+            self.result = self.conn.rows
+
+    async def fetchall(self):
+        return self.result
+
+    async def fetchone(self):
+        return self.result[0] if self.result else None
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def synthetic_rows(count):
+    now = datetime.now()
+    rows = []
+    for order_id in range(1, count + 1):
+        item = {"item_id": str(order_id), "item_name": "米", "price": 100, "quantity": 2,
+                "img": "img", "location": "家樂福", "category": "未分類"}
+        if order_id % 2:
+            rows.append(("necessities", order_id, 1, "buyer", "0912345678", "部落", False, 200.0,
+                         "購買類", "未接單", None, now, None, [item, item]))
+        else:
+            rows.append(("agricultural_product", order_id, 1, "buyer", "0912345678", "部落", False, 200,
+                         "購買類", "未接單", None, now, False, [item]))
+    return rows
+
+
+async def measure(count):
+    conn = FakeConnection(synthetic_rows(count))
+    started = time.perf_counter()
+    result = await orders.get_orders(response=Response(), limit=count, conn=conn, request=None)
+    elapsed = time.perf_counter() - started
+    assert len(result) == count
+    return len(conn.statements), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    distance_matrix.path = None  # keep the benchmark matrix in memory
+    distance_matrix.update({"部落": Coordinates(24.70, 121.20), "家樂福": Coordinates(24.99, 121.57)}, source="benchmark")
+    asyncio.run(measure(1))  # the first request of a worker reads the coordinate table once
+    counts = set()
+    for size in args.sizes:
+        statements, elapsed = asyncio.run(measure(size))
+        counts.add(statements)
+        print(f"orders={size:>6}  statements={statements}  handler_ms={elapsed * 1000:.2f}")
+    assert counts == {2}, f"expected two statements for every size, got {sorted(counts)}"
+    print("OK: query count is constant")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark for the driver route planner (backend.routing).
+
+Generates a synthetic workload of orders around the service area (each with
+one or two pickups and a drop-off, so --orders 25 gives 50+ stops), then
+times the distance matrix and the solver and compares the planned length
+with visiting the orders one after another and with the greedy tour alone.
+Every plan is checked for pickup-before-dropoff order. No database needed.
+
+    python -m backend.benchmarks.route_optimizer --orders 25 --orders 50 --orders 100
+"""
+import argparse
+import math
+import random
+import time
+import numpy as np
+from backend.benchmarks.load_test import percentile
+from backend.routing import haversine_matrix, order_stops, plan_stops, route_cost
+
+# Jianshi township farms to NCCU: the area the service runs in.
+LAT_RANGE = (24.68, 24.99)
+LNG_RANGE = (121.19, 121.58)
+
+
+def synthetic_orders(count, rng):
+    """
+    Orders with coordinates attached, as the route endpoint sees them.
+    """
+    def place():
+        lat, lng = rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+        return f"{lat:.5f},{lng:.5f}", {"lat": lat, "lng": lng}
+
+    orders = []
+    for order_id in range(1, count + 1):
+        name, coordinates = place()
+        items = []
+        for _ in range(rng.choice((1, 1, 2))):
+            item_name, item_coordinates = place()
+            items.append({"location": item_name, "coordinates": item_coordinates})
+        orders.append({
+            "id": order_id,
+            "service": rng.choice(("necessities", "agricultural_product")),
+            "location": name,
+            "coordinates": coordinates,
+            "items": items,
+        })
+    return orders
+
+
+def python_matrix(lat, lng):
+    """
+    The same distances with a Python double loop, for comparison.
+    """
+    n = len(lat)
+    out = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(n):
+            p1, p2 = math.radians(lat[i]), math.radians(lat[j])
+            a = (math.sin((p2 - p1) / 2) ** 2
+                 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng[j] - lng[i]) / 2) ** 2)
+            out[i][j] = 2 * 6371008.8 * math.asin(math.sqrt(a))
+    return out
+
+
+def check_precedence(visit, precedence):
+    position = {stop: index for index, stop in enumerate(visit)}
+    return all(position[before] < position[after] for before, after in precedence)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, action="append", help="Orders per workload (repeatable), default 25 50 100")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per workload size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    origin = {"lat": 24.7050, "lng": 121.1990}
+    for count in args.orders or [25, 50, 100]:
+        matrix_times, python_times, solve_times, ratios, greedy_ratios = [], [], [], [], []
+        for _ in range(args.repeat):
+            stops, precedence, _ = order_stops(synthetic_orders(count, rng))
+            lat = np.array([s.coordinates["lat"] for s in stops])
+            lng = np.array([s.coordinates["lng"] for s in stops])
+
+            started = time.perf_counter()
+            distances = haversine_matrix(lat, lng)
+            start = haversine_matrix([origin["lat"]], [origin["lng"]], lat, lng)[0]
+            matrix_times.append(time.perf_counter() - started)
+            if len(python_times) < 3:
+                started = time.perf_counter()
+                python_matrix(lat.tolist(), lng.tolist())
+                python_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            visit = plan_stops(distances, precedence, start)
+            solve_times.append(time.perf_counter() - started)
+            if not check_precedence(visit, precedence):
+                raise AssertionError("planned route visits a drop-off before its pickup")
+
+            greedy = plan_stops(distances, precedence, start, max_rounds=0)
+            # Orders one after another, pickups first: what a driver gets without planning.
+            naive = [i for i, _ in sorted(enumerate(stops), key=lambda s: (s[1].order_id, s[1].kind == "dropoff"))]
+            planned = route_cost(distances, visit, start)
+            ratios.append(planned / route_cost(distances, naive, start))
+            greedy_ratios.append(planned / route_cost(distances, greedy, start))
+
+        for values in (matrix_times, python_times, solve_times):
+            values.sort()
+        print(f"orders={count:>4} stops={len(stops):>4}  "
+              f"matrix_ms={percentile(matrix_times, 50) * 1000:.3f} (python {percentile(python_times, 50) * 1000:.1f})  "
+              f"solve_p50_ms={percentile(solve_times, 50) * 1000:.1f} p95_ms={percentile(solve_times, 95) * 1000:.1f}  "
+              f"vs_sequential={sum(ratios) / len(ratios):.2f} vs_greedy={sum(greedy_ratios) / len(greedy_ratios):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+In-process caches.
+
+`TTLCache` is a thread-safe LRU cache whose entries also expire after a fixed
+time to live. Every cache reports hits, misses and evictions under its name on
+`GET /metrics`. Caches are per process: writers invalidate entries locally and
+the TTL bounds how long other workers can serve a stale value.
+"""
+import threading
+import time
+from collections import OrderedDict
+from backend import metrics
+
+_hits = metrics.counter("cache_hits_total", "Cache lookups answered from memory.", ["cache"])
+_misses = metrics.counter("cache_misses_total", "Cache lookups that had to load the value.", ["cache"])
+_evictions = metrics.counter("cache_evictions_total", "Entries dropped by size limit or expiry.", ["cache"])
+_size = metrics.gauge("cache_entries", "Entries currently held by the cache.", ["cache"])
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Least-recently-used cache with per-entry expiry.
+
+    Args:
+        name (str): Label used for the cache metrics.
+        maxsize (int): Maximum number of entries.
+        ttl (float): Seconds an entry stays valid.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        """
+        Return the cached value for key, or default when absent or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    _hits.inc(cache=self.name)
+                    return entry[1]
+                del self._data[key]
+                _evictions.inc(cache=self.name)
+                _size.set(len(self._data), cache=self.name)
+        _misses.inc(cache=self.name)
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Store value under key, evicting the least recently used entry when full.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                _evictions.inc(cache=self.name)
+            _size.set(len(self._data), cache=self.name)
+
+    def invalidate(self, key):
+        """
+        Drop the entry for key if present.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            _size.set(len(self._data), cache=self.name)
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self._data.clear()
+            _size.set(0, cache=self.name)
+
+    def stats(self):
+        """
+        Hit and miss counts of this cache.
+
+        Returns:
+            dict: The hits, misses and current size.
+        """
+        return {
+            "hits": _hits.value(cache=self.name),
+            "misses": _misses.value(cache=self.name),
+            "size": len(self._data),
+        }
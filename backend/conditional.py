@@ -0,0 +1,125 @@
+"""
+Conditional GET support for the polled list endpoints.
+
+Every list endpoint depends on one or more resources (`orders`, `products`,
+`drivers`, `locations`) whose versions in the `resource_versions` view count
+the committed transactions that changed the underlying tables (see
+createtable.sql). The ETag of a response is derived from those versions and
+the request's path and query string, so it can be computed with one small
+query before running the list query.
+A request whose If-None-Match still matches is answered with 304.
+"""
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from backend import metrics
+
+_conditional_requests = metrics.counter(
+    "conditional_requests_total",
+    "List requests by ETag outcome (not_modified, modified or unconditional).",
+    ["endpoint", "result"]
+)
+
+VERSIONS_QUERY = "SELECT resource, version FROM resource_versions WHERE resource = ANY(%s)"
+
+
+async def fetch_versions(conn, resources) -> dict:
+    """
+    Current versions of resources.
+
+    Args:
+        conn (Connection): The database connection.
+        resources (list): Names of the resources.
+
+    Returns:
+        dict: Version by resource name.
+    """
+    cur = conn.cursor()
+    try:
+        await cur.execute(VERSIONS_QUERY, (list(resources),))
+        return dict(await cur.fetchall())
+    finally:
+        await cur.close()
+
+
+async def resource_etag(conn, request: Request, resources, extra: str = "") -> str:
+    """
+    Compute the ETag of a list response from the versions of its resources.
+    The versions are kept on `request.state.resource_versions`, so the
+    handler can build the response from data of the same versions.
+
+    Args:
+        conn (Connection): The database connection.
+        request (Request): The incoming request; its path and query are part of the tag.
+        resources (list): Names of the resources the response is built from.
+        extra (str): Anything else the response depends on, e.g. the current date.
+
+    Returns:
+        str: A weak ETag.
+    """
+    versions = await fetch_versions(conn, resources)
+    request.state.resource_versions = versions
+    key = f"{request.url.path}?{request.url.query}|{sorted(versions.items())}|{extra}"
+    return 'W/"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+async def request_versions(conn, request: Optional[Request], resources) -> dict:
+    """
+    The resource versions `not_modified` tagged the request with, read now
+    when it did not run (e.g. the handler was called directly).
+    """
+    versions = getattr(request.state, "resource_versions", None) if request is not None else None
+    if versions is None or any(resource not in versions for resource in resources):
+        versions = await fetch_versions(conn, resources)
+    return versions
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header value matches the ETag (weak comparison).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+async def not_modified(conn, request: Request, response: Response, endpoint: str, resources, extra: str = "") -> Optional[Response]:
+    """
+    Tag the response and short-circuit unchanged list requests.
+
+    Sets ETag and `Cache-Control: no-cache` on the response so browsers
+    revalidate on every poll. Returns a 304 response when the request's
+    If-None-Match matches, in which case the handler should return it as is.
+
+    Args:
+        conn (Connection): The database connection.
+        request (Request): The incoming request, None when called directly.
+        response (Response): The response the handler will return.
+        endpoint (str): Endpoint label for the metrics.
+        resources (list): Names of the resources the response is built from.
+        extra (str): Anything else the response depends on.
+
+    Returns:
+        Response: A 304 response, or None when the list must be built.
+    """
+    if request is None:
+        return None
+    etag = await resource_etag(conn, request, resources, extra)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag):
+        _conditional_requests.inc(endpoint=endpoint, result="not_modified")
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    _conditional_requests.inc(endpoint=endpoint, result="modified" if if_none_match else "unconditional")
+    return None
@@ -1,6 +1,30 @@
+"""
+Database connection management.
+
+Connections are drawn from process-wide pools instead of opening a new
+PostgreSQL connection per request. Each pool keeps between DB_POOL_MIN_SIZE and
+DB_POOL_MAX_SIZE connections, checks connections on checkout, reaps idle
+connections above the minimum and recycles connections older than
+DB_POOL_MAX_LIFETIME seconds.
+
+- The async pool (psycopg 3) backs the FastAPI routers through `get_db`, so a
+  slow query only suspends its own request instead of the event loop.
+- The blocking pool (psycopg2) backs code that runs in worker threads, such as
+  the LINE webhook handlers, through `db_connection`.
+"""
+import asyncio
 import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from psycopg import pq
+from psycopg_pool import AsyncConnectionPool
 from dotenv import load_dotenv
+from backend import metrics
+from backend.instrumentation import InstrumentedCursor, InstrumentedAsyncCursor
 
 load_dotenv()
 
@@ -8,6 +32,404 @@ load_dotenv()
 # Fetch the DATABASE_URL from environment variables
 database_url = os.environ.get('DATABASE_URL')
 
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 20))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', 5))
+
+
+class PoolTimeout(PoolError):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Thread-safe, blocking PostgreSQL connection pool.
+
+    Args:
+        dsn (str): The connection string passed to psycopg2.connect.
+        min_size (int): Connections kept open even when idle.
+        max_size (int): Upper bound of open connections.
+        timeout (float): Seconds a checkout waits for a free connection.
+        max_idle (float): Idle seconds after which surplus connections are closed.
+        max_lifetime (float): Age in seconds after which a connection is recycled.
+        check_interval (float): Idle seconds after which a connection is pinged on checkout.
+
+    Surplus idle connections are closed when connections are checked out or
+    returned, and by a background thread every max_idle / 2 seconds so a pool
+    that went quiet after a burst shrinks back to min_size.
+    """
+
+    def __init__(self, dsn, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_idle=DB_POOL_MAX_IDLE,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, check_interval=DB_POOL_CHECK_INTERVAL):
+        if min_size > max_size:
+            raise ValueError("min_size must not be larger than max_size")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []          # stack of (conn, returned_at)
+        self._in_use = set()     # id(conn) of checked out connections
+        self._created_at = {}    # id(conn) -> creation time
+        self._waiting = 0
+        self._closed = False
+        self._stop = threading.Event()
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+        self._reaper = threading.Thread(target=self._reap_periodically, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=InstrumentedCursor)
+        self._created_at[id(conn)] = time.monotonic()
+        _connections_created.inc()
+        return conn
+
+    def _discard(self, conn, reason):
+        self._created_at.pop(id(conn), None)
+        _connections_closed.inc(reason=reason)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn, now):
+        return now - self._created_at.get(id(conn), now) > self.max_lifetime
+
+    def _healthy(self, conn, idle_since, now):
+        if conn.closed:
+            return False
+        if now - idle_since < self.check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap(self, now):
+        """
+        Close surplus idle connections. Must be called with the condition held.
+        """
+        keep = []
+        # The stack's oldest entries sit at the bottom; they are reaped first.
+        surplus = len(self._idle) + len(self._in_use) - self.min_size
+        for conn, idle_since in self._idle:
+            if surplus > 0 and now - idle_since > self.max_idle:
+                self._discard(conn, "idle")
+                surplus -= 1
+            elif self._expired(conn, now):
+                self._discard(conn, "lifetime")
+                surplus -= 1
+            else:
+                keep.append((conn, idle_since))
+        self._idle = keep
+
+    def _reap_periodically(self):
+        interval = max(self.max_idle / 2, 1.0)
+        while not self._stop.wait(interval):
+            with self._cond:
+                if self._closed:
+                    return
+                self._reap(time.monotonic())
+
+    def getconn(self):
+        """
+        Check a connection out of the pool, blocking until one is free.
+
+        Returns:
+            psycopg2.extensions.connection: A healthy connection.
+
+        Raises:
+            PoolTimeout: If no connection is free within the timeout.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    now = time.monotonic()
+                    self._reap(now)
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        self._in_use.add(id(conn))
+                        break
+                    if len(self._in_use) < self.max_size:
+                        # Reserve the slot before connecting outside the lock.
+                        placeholder = object()
+                        self._in_use.add(id(placeholder))
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        _checkout_timeouts.inc()
+                        raise PoolTimeout(f"no connection available within {self.timeout}s")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                finally:
+                    with self._cond:
+                        self._in_use.discard(id(placeholder))
+                        if conn is not None:
+                            self._in_use.add(id(conn))
+                        else:
+                            self._cond.notify()
+                _checkout_seconds.observe(time.monotonic() - started)
+                return conn
+
+            # Health checks run outside the lock so a slow ping does not stall other checkouts.
+            reason = None
+            if self._expired(conn, now):
+                reason = "lifetime"
+            elif not self._healthy(conn, idle_since, now):
+                reason = "broken"
+            if reason is None:
+                _checkout_seconds.observe(time.monotonic() - started)
+                return conn
+            with self._cond:
+                self._in_use.discard(id(conn))
+                self._cond.notify()
+            self._discard(conn, reason)
+
+    def putconn(self, conn):
+        """
+        Return a connection to the pool, rolling back any open transaction.
+
+        Args:
+            conn (psycopg2.extensions.connection): A connection obtained from getconn.
+        """
+        reason = None
+        if conn.closed:
+            reason = "broken"
+        else:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                reason = "broken"
+
+        now = time.monotonic()
+        with self._cond:
+            self._in_use.discard(id(conn))
+            if reason is None and self._closed:
+                reason = "shutdown"
+            if reason is None and self._expired(conn, now):
+                reason = "lifetime"
+            if reason is None:
+                self._idle.append((conn, now))
+            self._reap(now)
+            self._cond.notify()
+        if reason is not None:
+            self._discard(conn, reason)
+
+    def close(self):
+        """
+        Close every idle connection and refuse further checkouts.
+        """
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn, "shutdown")
+
+    def stats(self):
+        """
+        Snapshot of the pool state.
+
+        Returns:
+            dict: Counts of idle, in-use and waiting connections.
+        """
+        with self._cond:
+            return {
+                "size": len(self._idle) + len(self._in_use),
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(database_url)
+    return _pool
+
+
+def close_pool():
+    """
+    Close the process-wide connection pool if it was created.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _pool_stat(key):
+    return lambda: _pool.stats()[key] if _pool is not None else 0
+
+
+_connections_created = metrics.counter(
+    "db_pool_connections_created_total", "Connections opened by the pool.")
+_connections_closed = metrics.counter(
+    "db_pool_connections_closed_total", "Connections closed by the pool.", ["reason"])
+_checkout_timeouts = metrics.counter(
+    "db_pool_checkout_timeouts_total", "Checkouts that gave up waiting for a connection.")
+_checkout_seconds = metrics.histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled connection.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+metrics.gauge("db_pool_connections", "Open pooled connections.", callback=_pool_stat("size"))
+metrics.gauge("db_pool_connections_in_use", "Checked out connections.", callback=_pool_stat("in_use"))
+metrics.gauge("db_pool_connections_idle", "Idle pooled connections.", callback=_pool_stat("idle"))
+metrics.gauge("db_pool_requests_waiting", "Checkouts waiting for a connection.", callback=_pool_stat("waiting"))
+
+
 def get_db_connection():
-    conn = psycopg2.connect(database_url)
-    return conn
+    """
+    Check a connection out of the shared pool.
+    The caller must hand it back with release_db_connection.
+    """
+    return get_pool().getconn()
+
+
+def release_db_connection(conn):
+    """
+    Return a connection obtained from get_db_connection to the pool.
+    """
+    get_pool().putconn(conn)
+
+
+@contextmanager
+def db_connection():
+    """
+    Context manager yielding a pooled connection.
+    Uncommitted work is rolled back when the block exits.
+    """
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool():
+    """
+    Return the process-wide async connection pool, opening it on first use.
+    """
+    global _async_pool
+    if _async_pool is not None:
+        return _async_pool
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            return _async_pool
+        pool = AsyncConnectionPool(
+            database_url,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            check=AsyncConnectionPool.check_connection,
+            kwargs={"cursor_factory": InstrumentedAsyncCursor},
+            open=False,
+        )
+        await pool.open()
+        _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool():
+    """
+    Close the process-wide async connection pool if it was opened.
+    """
+    global _async_pool
+    if _async_pool is not None:
+        pool, _async_pool = _async_pool, None
+        await pool.close()
+
+
+def _async_pool_stat(key):
+    return lambda: _async_pool.get_stats().get(key, 0) if _async_pool is not None else 0
+
+
+_async_checkout_seconds = metrics.histogram(
+    "db_async_pool_checkout_seconds", "Time spent waiting for an async pooled connection.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+metrics.gauge("db_async_pool_connections", "Open async pooled connections.",
+              callback=_async_pool_stat("pool_size"))
+metrics.gauge("db_async_pool_connections_idle", "Idle async pooled connections.",
+              callback=_async_pool_stat("pool_available"))
+metrics.gauge("db_async_pool_requests_waiting", "Checkouts waiting for an async connection.",
+              callback=_async_pool_stat("requests_waiting"))
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """
+    Async context manager yielding a pooled connection.
+    Uncommitted work is rolled back when the block exits.
+    """
+    pool = await get_async_pool()
+    started = time.monotonic()
+    conn = await pool.getconn()
+    _async_checkout_seconds.observe(time.monotonic() - started)
+    try:
+        yield conn
+    finally:
+        if conn.info.transaction_status != pq.TransactionStatus.IDLE:
+            try:
+                await conn.rollback()
+            except Exception:
+                pass
+        await pool.putconn(conn)
+
+
+async def get_db():
+    """
+    Dependency function to get a database connection.
+
+    Yields:
+        psycopg.AsyncConnection: A pooled PostgreSQL connection.
+    """
+    async with async_db_connection() as conn:
+        yield conn
@@ -38,3 +38,51 @@ CREATE INDEX idx_driver_orders_timestamp ON driver_orders (timestamp);
 CREATE INDEX idx_driver_orders_driver_order ON driver_orders (driver_id, order_id);
 
 
+
+-- ====================================
+-- Keyset pagination indexes for GET /api/orders
+-- Orders are listed newest first by (timestamp, id), optionally filtered
+-- by status, destination, buyer or urgency.
+-- ====================================
+CREATE INDEX idx_orders_timestamp_id ON orders (timestamp DESC, id DESC);
+CREATE INDEX idx_orders_status_timestamp_id ON orders (order_status, timestamp DESC, id DESC);
+CREATE INDEX idx_orders_location_timestamp_id ON orders (location, timestamp DESC, id DESC);
+CREATE INDEX idx_orders_buyer_timestamp_id ON orders (buyer_id, timestamp DESC, id DESC);
+CREATE INDEX idx_orders_urgent_timestamp_id ON orders (timestamp DESC, id DESC) WHERE is_urgent;
+
+-- ====================================
+-- Indexes for agricultural_product_order table
+-- ====================================
+CREATE INDEX idx_agri_order_timestamp_id ON agricultural_product_order (timestamp DESC, id DESC);
+CREATE INDEX idx_agri_order_status_timestamp_id ON agricultural_product_order (status, timestamp DESC, id DESC);
+CREATE INDEX idx_agri_order_end_point_timestamp_id ON agricultural_product_order (end_point, timestamp DESC, id DESC);
+CREATE INDEX idx_agri_order_buyer_timestamp_id ON agricultural_product_order (buyer_id, timestamp DESC, id DESC);
+
+-- Driver workload lookups (GET /api/drivers/{driver_id}/orders)
+CREATE INDEX idx_driver_orders_driver_service_order ON driver_orders (driver_id, service, order_id);
+
+-- ====================================
+-- Indexes for notification_outbox table
+-- ====================================
+CREATE INDEX idx_notification_outbox_pending ON notification_outbox (next_attempt_at, id) WHERE status = 'pending';
+
+-- ====================================
+-- Indexes for agricultural_produce table
+-- ====================================
+-- On-sale catalog (GET /api/consumer/)
+CREATE INDEX idx_agricultural_produce_off_shelf_category ON agricultural_produce (off_shelf_date, category);
+
+-- Trigram indexes for product search (GET /api/consumer/search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_agricultural_produce_name_trgm ON agricultural_produce USING GIN (name gin_trgm_ops);
+CREATE INDEX idx_agricultural_produce_category_trgm ON agricultural_produce USING GIN (category gin_trgm_ops);
+
+-- ====================================
+-- Indexes for conversation_states table
+-- ====================================
+CREATE INDEX idx_conversation_states_expires_at ON conversation_states (expires_at);
+
+-- ====================================
+-- Indexes for processed_webhook_events table
+-- ====================================
+CREATE INDEX idx_processed_webhook_events_received_at ON processed_webhook_events (received_at);
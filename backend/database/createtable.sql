@@ -122,6 +122,145 @@ CREATE TABLE agricultural_product_order(
     note VARCHAR(255)
 );
 
+-- LINE notifications written in the same transaction as the order change
+-- and delivered by the background dispatcher
+CREATE TABLE notification_outbox (
+    id SERIAL PRIMARY KEY,
+    user_id INT NOT NULL,
+    message TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending', --pending, sent, skipped or dead
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Uploaded images by content hash, so re-uploads reuse the stored objects
+CREATE TABLE image_objects (
+    content_hash CHAR(64) PRIMARY KEY, --sha256 of the original bytes
+    img_id VARCHAR(64) UNIQUE NOT NULL,
+    img_link VARCHAR(255) NOT NULL,
+    variants JSONB NOT NULL DEFAULT '{}', --variant name -> url
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Change counters behind the ETags of the polled list endpoints.
+-- Statement-level triggers append one row per resource and writing
+-- transaction to resource_changes, so a new version is visible exactly when
+-- the change commits and concurrent writers never wait on a shared counter
+-- row. A resource's version is the number of committed changing
+-- transactions: the rows still in resource_changes plus those compacted
+-- into resource_version_base.
+CREATE TABLE resource_version_base (
+    resource VARCHAR(20) PRIMARY KEY, --orders, products, drivers or locations
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE resource_changes (
+    id BIGSERIAL PRIMARY KEY,
+    resource VARCHAR(20) NOT NULL,
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (resource, txid)
+);
+
+CREATE VIEW resource_versions AS
+    SELECT b.resource, b.version + COUNT(c.id) AS version
+    FROM resource_version_base b
+    LEFT JOIN resource_changes c ON c.resource = b.resource
+    GROUP BY b.resource, b.version;
+
+INSERT INTO resource_version_base (resource) VALUES ('orders'), ('products'), ('drivers');
 
+-- Fold the rows of transactions that finished before every running one into
+-- the base count. Skipped while another transaction is compacting.
+CREATE FUNCTION compact_resource_changes(name VARCHAR) RETURNS void AS $$
+DECLARE
+    moved BIGINT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('resource_changes:' || name)) THEN
+        RETURN;
+    END IF;
+    WITH done AS (
+        DELETE FROM resource_changes
+        WHERE resource = name AND txid < pg_snapshot_xmin(pg_current_snapshot())
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO moved FROM done;
+    IF moved > 0 THEN
+        UPDATE resource_version_base SET version = version + moved WHERE resource = name;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION bump_resource_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO resource_changes (resource) VALUES (TG_ARGV[0])
+    ON CONFLICT (resource, txid) DO NOTHING;
+    IF random() < 0.01 THEN
+        PERFORM compact_resource_changes(TG_ARGV[0]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER orders_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON orders
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('orders');
+CREATE TRIGGER order_items_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON order_items
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('orders');
+CREATE TRIGGER agricultural_product_order_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON agricultural_product_order
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('orders');
+CREATE TRIGGER driver_orders_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON driver_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('orders');
+CREATE TRIGGER agricultural_produce_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON agricultural_produce
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('products');
+CREATE TRIGGER image_objects_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON image_objects
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('products');
+CREATE TRIGGER drivers_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON drivers
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('drivers');
+CREATE TRIGGER driver_time_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON driver_time
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('drivers');
+
+-- A driver's home (users.location) is where their trips start, so moving it
+-- changes the routes of their time slots.
+CREATE FUNCTION bump_driver_home_version() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM drivers WHERE user_id = NEW.id) THEN
+        INSERT INTO resource_changes (resource) VALUES ('drivers')
+        ON CONFLICT (resource, txid) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_driver_home_version AFTER UPDATE OF location ON users
+    FOR EACH ROW WHEN (OLD.location IS DISTINCT FROM NEW.location)
+    EXECUTE FUNCTION bump_driver_home_version();
+
+-- State of multi-step LINE dialogues (e.g. registration), shared by all workers
+CREATE TABLE conversation_states (
+    line_user_id VARCHAR(255) PRIMARY KEY,
+    state JSONB NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Webhook event IDs already handled, so LINE redeliveries are handled once
+CREATE TABLE processed_webhook_events (
+    webhook_event_id VARCHAR(64) PRIMARY KEY,
+    received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Coordinates of free-text place names, resolved once by the geocoding service
+CREATE TABLE location_coordinates (
+    name VARCHAR(255) PRIMARY KEY, --normalized place name
+    lat DOUBLE PRECISION, --NULL when no provider knows the place
+    lng DOUBLE PRECISION,
+    provider VARCHAR(20) NOT NULL, --gazetteer, google or none
+    resolved_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
 
+INSERT INTO resource_version_base (resource) VALUES ('locations');
 
+CREATE TRIGGER location_coordinates_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON location_coordinates
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('locations');
@@ -6,4 +6,15 @@ DROP TABLE IF EXISTS orders CASCADE;
 DROP TABLE IF EXISTS users CASCADE;
 DROP TABLE IF EXISTS agricultural_produce CASCADE;
 DROP TABLE IF EXISTS agricultural_shopping_cart CASCADE;
-DROP TABLE IF EXISTS agricultural_product_order CASCADE;
\ No newline at end of file
+DROP TABLE IF EXISTS agricultural_product_order CASCADE;
+DROP TABLE IF EXISTS notification_outbox CASCADE;
+DROP TABLE IF EXISTS image_objects CASCADE;
+DROP VIEW IF EXISTS resource_versions CASCADE;
+DROP TABLE IF EXISTS resource_changes CASCADE;
+DROP TABLE IF EXISTS resource_version_base CASCADE;
+DROP TABLE IF EXISTS conversation_states CASCADE;
+DROP TABLE IF EXISTS processed_webhook_events CASCADE;
+DROP TABLE IF EXISTS location_coordinates CASCADE;
+DROP FUNCTION IF EXISTS bump_resource_version() CASCADE;
+DROP FUNCTION IF EXISTS compact_resource_changes(VARCHAR) CASCADE;
+DROP FUNCTION IF EXISTS bump_driver_home_version() CASCADE;
@@ -0,0 +1,227 @@
+"""
+Process-wide logging pipeline.
+
+Request handlers only put log records on an in-memory queue; a single
+`QueueListener` thread formats them and writes them out, so no request ever
+waits on `json.dumps` or disk I/O. Business events written with a domain
+logger from `event_logger()` go to one JSON-lines file per domain
+(`orders.log`, `drivers.log`, ...), every other record goes to `app.log`, and
+everything is echoed to the console. Files rotate by size or by time
+(LOG_ROTATION=size|time). High-volume `*_STARTED` events are sampled at
+LOG_STARTED_SAMPLE_RATE and record the rate they were kept at.
+
+Rotation is per process: when several workers share LOG_DIR, point each at
+its own directory or use time-based rotation with an external collector.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from datetime import datetime
+from typing import Callable, Dict
+from backend import metrics
+
+LOG_DIR = os.getenv('LOG_DIR', os.path.join(os.getcwd(), 'backend', 'logs'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_ROTATION = os.getenv('LOG_ROTATION', 'size')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 14))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_STARTED_SAMPLE_RATE = float(os.getenv('LOG_STARTED_SAMPLE_RATE', 0.1))
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', '1') not in ('0', 'false', 'False')
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+EVENT_LOGGER_PREFIX = 'events.'
+APP_DOMAIN = 'app'
+
+_events = metrics.counter("log_events_total", "Domain events passed to log_event.", ["domain", "result"])
+_dropped = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+_listener = None
+_lock = threading.Lock()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller and defers formatting to the listener.
+    """
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc()
+
+    def prepare(self, record):
+        # Only render the message text here; JSON encoding and timestamps are
+        # done by the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Render a record as one JSON object per line.
+
+    Event records carry `event_type` and `data`; plain records are written
+    with their logger name and message.
+    """
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+        }
+        event_type = getattr(record, 'event_type', None)
+        if event_type is not None:
+            entry["domain"] = record.event_domain
+            entry["event_type"] = event_type
+            entry["data"] = record.event_data
+            if record.sample_rate < 1:
+                entry["sample_rate"] = record.sample_rate
+        else:
+            entry["logger"] = record.name
+            entry["message"] = record.getMessage()
+            if record.exc_text:
+                entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    Human-readable console lines, with the event data appended as JSON.
+    """
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'event_type', None) is not None:
+            text += " " + json.dumps(record.event_data, ensure_ascii=False, default=str)
+        return text
+
+
+class DomainFileHandler(logging.Handler):
+    """
+    Write each record to the rotating file of its domain, opening files on first use.
+
+    Args:
+        directory (str): Directory holding the log files.
+    """
+
+    def __init__(self, directory: str = LOG_DIR):
+        super().__init__()
+        self.directory = directory
+        self._handlers: Dict[str, logging.Handler] = {}
+        self._formatter = JsonLinesFormatter()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _file_handler(self, domain: str) -> logging.Handler:
+        handler = self._handlers.get(domain)
+        if handler is None:
+            path = os.path.join(self.directory, f"{domain}.log")
+            if LOG_ROTATION == 'time':
+                handler = logging.handlers.TimedRotatingFileHandler(
+                    path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+                )
+            else:
+                handler = logging.handlers.RotatingFileHandler(
+                    path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+                )
+            handler.setFormatter(self._formatter)
+            self._handlers[domain] = handler
+        return handler
+
+    def emit(self, record):
+        self._file_handler(getattr(record, 'event_domain', APP_DOMAIN)).handle(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+def configure_logging():
+    """
+    Install the queue handler on the root logger and start the listener thread.
+
+    Safe to call more than once; only the first call has an effect.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handlers = [DomainFileHandler()]
+        if LOG_CONSOLE:
+            console = logging.StreamHandler()
+            console.setFormatter(ConsoleFormatter(CONSOLE_FORMAT))
+            handlers.append(console)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(NonBlockingQueueHandler(log_queue))
+        root.setLevel(LOG_LEVEL)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Flush queued records and close the log files.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def event_logger(domain: str) -> Callable[[str, dict], None]:
+    """
+    Build the `log_event(event_type, data)` function of a domain.
+
+    Has no side effects: events only reach the files once the application
+    has called `configure_logging()`.
+
+    Args:
+        domain (str): Name of the log file the events are written to.
+
+    Returns:
+        Callable: Function that queues one structured event.
+    """
+    logger = logging.getLogger(EVENT_LOGGER_PREFIX + domain)
+
+    def log_event(event_type: str, data: dict):
+        sample_rate = 1.0
+        if event_type.endswith('_STARTED') and LOG_STARTED_SAMPLE_RATE < 1:
+            if random.random() >= LOG_STARTED_SAMPLE_RATE:
+                _events.inc(domain=domain, result="sampled_out")
+                return
+            sample_rate = LOG_STARTED_SAMPLE_RATE
+        _events.inc(domain=domain, result="logged")
+        logger.info(
+            event_type,
+            extra={
+                "event_domain": domain,
+                "event_type": event_type,
+                "event_data": data,
+                "sample_rate": sample_rate,
+            }
+        )
+
+    return log_event
@@ -0,0 +1,20 @@
+"""
+Geocoding of the free-text place names used for order destinations, pickup
+points, driver routes and user locations.
+
+Names are resolved once, stored in `location_coordinates` and served from an
+in-process cache afterwards (see `service`). Providers are tried in the order
+given by GEOCODING_PROVIDERS: `gazetteer` is an offline list of known places
+(`gazetteer.json`), `google` calls the Google Geocoding API when
+GOOGLE_MAPS_API_KEY is set.
+"""
+from backend.geocoding.providers import (
+    Coordinates,
+    GazetteerProvider,
+    GeocodingError,
+    GeocodingProvider,
+    GoogleGeocodingProvider,
+    build_providers,
+    normalize_place,
+)
+from backend.geocoding.service import GeocodingService, geocoder
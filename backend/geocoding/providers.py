@@ -0,0 +1,189 @@
+"""
+Geocoding providers that turn a free-text place name into coordinates.
+"""
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+import httpx
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+GEOCODING_PROVIDERS = os.getenv('GEOCODING_PROVIDERS', 'gazetteer,google')
+GEOCODING_GAZETTEER = os.getenv(
+    'GEOCODING_GAZETTEER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.json')
+)
+GEOCODING_TIMEOUT = float(os.getenv('GEOCODING_TIMEOUT', 10))
+GEOCODING_REGION = os.getenv('GEOCODING_REGION', 'tw')
+GEOCODING_LANGUAGE = os.getenv('GEOCODING_LANGUAGE', 'zh-TW')
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+_provider_seconds = metrics.histogram(
+    "geocoding_provider_seconds", "Latency of geocoding provider lookups.", ["provider", "outcome"])
+
+_SPACE = re.compile(r"\s+")
+
+
+class Coordinates(NamedTuple):
+    lat: float
+    lng: float
+
+    def to_dict(self) -> dict:
+        return {"lat": self.lat, "lng": self.lng}
+
+
+class GeocodingError(RuntimeError):
+    """
+    Raised when a provider could not answer, as opposed to not knowing the place.
+    """
+
+
+def normalize_place(name: str) -> str:
+    """
+    Canonical form of a place name used as the cache and table key:
+    full-width characters folded (NFKC) and whitespace squeezed.
+    """
+    if not name:
+        return ""
+    return _SPACE.sub(" ", unicodedata.normalize("NFKC", name)).strip()
+
+
+class GeocodingProvider(ABC):
+    """
+    Interface of a geocoding provider.
+    """
+    name = "provider"
+
+    @abstractmethod
+    async def geocode(self, place: str) -> Optional[Coordinates]:
+        """
+        Look up a normalized place name.
+
+        Returns:
+            Coordinates: The location, or None if the provider does not know the place.
+
+        Raises:
+            GeocodingError: If the provider failed; the lookup should be retried later.
+        """
+
+    async def close(self):
+        """
+        Release resources held by the provider.
+        """
+
+
+class GazetteerProvider(GeocodingProvider):
+    """
+    Offline provider backed by a JSON list of known places.
+
+    Each entry is `{"name": ..., "lat": ..., "lng": ..., "aliases": [...]}`.
+    A name matches exactly, or when it contains a known name, e.g. a Google
+    Places "name + formatted address" string; the longest contained name wins.
+
+    Args:
+        path (str): The gazetteer file.
+    """
+    name = "gazetteer"
+
+    def __init__(self, path: str = GEOCODING_GAZETTEER):
+        self.places = {}
+        with open(path, encoding="utf-8") as f:
+            for entry in json.load(f):
+                coordinates = Coordinates(float(entry["lat"]), float(entry["lng"]))
+                for place in [entry["name"], *entry.get("aliases", [])]:
+                    self.places[normalize_place(place)] = coordinates
+        # Longest names first so the most specific contained name wins.
+        self._by_length = sorted(self.places, key=len, reverse=True)
+
+    async def geocode(self, place: str) -> Optional[Coordinates]:
+        coordinates = self.places.get(place)
+        if coordinates is not None:
+            return coordinates
+        for known in self._by_length:
+            if known in place:
+                return self.places[known]
+        return None
+
+
+class GoogleGeocodingProvider(GeocodingProvider):
+    """
+    Google Geocoding API through a pooled async HTTP client.
+
+    Args:
+        api_key (str): The Google Maps API key.
+    """
+    name = "google"
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv('GOOGLE_MAPS_API_KEY')
+        self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=GEOCODING_TIMEOUT)
+        return self._client
+
+    async def geocode(self, place: str) -> Optional[Coordinates]:
+        if not self.api_key:
+            raise GeocodingError("GOOGLE_MAPS_API_KEY not set")
+        try:
+            response = await self._http().get(GOOGLE_GEOCODE_URL, params={
+                "address": place,
+                "key": self.api_key,
+                "region": GEOCODING_REGION,
+                "language": GEOCODING_LANGUAGE,
+            })
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise GeocodingError(f"Network error: {str(e)}") from e
+
+        status = data.get("status")
+        if status == "OK" and data.get("results"):
+            location = data["results"][0]["geometry"]["location"]
+            return Coordinates(float(location["lat"]), float(location["lng"]))
+        if status == "ZERO_RESULTS":
+            return None
+        raise GeocodingError(f"Google geocoding error: {status} {data.get('error_message', '')}".strip())
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async def timed_geocode(provider: GeocodingProvider, place: str) -> Optional[Coordinates]:
+    """
+    Call a provider and record its latency.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        coordinates = await provider.geocode(place)
+        outcome = "found" if coordinates is not None else "not_found"
+        return coordinates
+    finally:
+        _provider_seconds.observe(time.perf_counter() - started, provider=provider.name, outcome=outcome)
+
+
+def build_providers(names: str = GEOCODING_PROVIDERS):
+    """
+    Create the providers listed in GEOCODING_PROVIDERS, in lookup order.
+    Google is left out when no API key is configured.
+    """
+    providers = []
+    for name in (part.strip() for part in names.split(",")):
+        if name == "gazetteer":
+            providers.append(GazetteerProvider())
+        elif name == "google":
+            if os.getenv('GOOGLE_MAPS_API_KEY'):
+                providers.append(GoogleGeocodingProvider())
+            else:
+                logger.info("GOOGLE_MAPS_API_KEY not set; geocoding uses the offline gazetteer only")
+        elif name:
+            raise ValueError(f"Unknown geocoding provider: {name}")
+    return providers
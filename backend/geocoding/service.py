@@ -0,0 +1,266 @@
+"""
+Read-through geocoding of place names with a persistent coordinate table.
+
+A name is looked up in the in-process cache, then in `location_coordinates`,
+and only then asked of the providers; whatever the providers answer is
+written back to the table, so each place is geocoded once for all workers.
+Places no provider knows are stored without coordinates and retried after
+GEOCODING_RETRY_AFTER seconds. List endpoints only read the cache and the
+table (`lookup_many`) and hand unknown names to `prefetch`, so a request never
+waits on an external geocoder.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+from backend import metrics
+from backend.cache import TTLCache, MISSING
+from backend.database import async_db_connection
+from backend.geocoding.providers import (
+    Coordinates,
+    GeocodingError,
+    build_providers,
+    normalize_place,
+    timed_geocode,
+)
+
+logger = logging.getLogger(__name__)
+
+GEOCODING_CACHE_SIZE = int(os.getenv('GEOCODING_CACHE_SIZE', 10000))
+GEOCODING_CACHE_TTL = float(os.getenv('GEOCODING_CACHE_TTL', 3600))
+GEOCODING_RETRY_AFTER = float(os.getenv('GEOCODING_RETRY_AFTER', 86400))
+GEOCODING_CONCURRENCY = int(os.getenv('GEOCODING_CONCURRENCY', 5))
+
+_lookups = metrics.counter(
+    "geocoding_lookups_total", "Place names looked up, by where the answer came from.", ["source"])
+
+LOOKUP_QUERY = """
+    SELECT name, lat, lng, lat IS NULL AND resolved_at < NOW() - make_interval(secs => %s) AS stale
+    FROM location_coordinates
+    WHERE name = ANY(%s)
+"""
+
+UPSERT_QUERY = """
+    INSERT INTO location_coordinates (name, lat, lng, provider, resolved_at)
+    VALUES (%s, %s, %s, %s, NOW())
+    ON CONFLICT (name) DO UPDATE
+    SET lat = EXCLUDED.lat, lng = EXCLUDED.lng, provider = EXCLUDED.provider, resolved_at = EXCLUDED.resolved_at
+"""
+
+
+class GeocodingService:
+    """
+    Resolves place names through the cache, the coordinate table and the providers.
+
+    Args:
+        providers (list): Providers tried in order; defaults to GEOCODING_PROVIDERS.
+    """
+
+    def __init__(self, providers=None):
+        self._providers = providers
+        self.cache = TTLCache("geocoding", maxsize=GEOCODING_CACHE_SIZE, ttl=GEOCODING_CACHE_TTL)
+        self._pending = set()
+        self._tasks = set()
+        self._listeners = []
+
+    @property
+    def providers(self):
+        if self._providers is None:
+            self._providers = build_providers()
+        return self._providers
+
+    def subscribe(self, listener):
+        """
+        Call `listener(found)` with a dict of normalized name -> Coordinates
+        whenever this process resolves new places.
+        """
+        self._listeners.append(listener)
+
+    async def lookup_many(self, conn, names: Iterable[str]) -> Dict[str, Optional[Coordinates]]:
+        """
+        Known coordinates of the names, from the cache and the coordinate table only.
+
+        Args:
+            conn (Connection): The database connection.
+            names (Iterable[str]): Place names as stored on orders, products or users.
+
+        Returns:
+            dict: Normalized name -> Coordinates, or None for places known to have no
+            coordinates. Names that were never resolved are left out.
+        """
+        known = {}
+        missing = []
+        for key in {normalize_place(name) for name in names if name}:
+            if not key:
+                continue
+            value = self.cache.get(key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                _lookups.inc(source="cache")
+                known[key] = value
+        if not missing:
+            return known
+
+        cur = conn.cursor()
+        try:
+            await cur.execute(LOOKUP_QUERY, (GEOCODING_RETRY_AFTER, missing))
+            rows = await cur.fetchall()
+        finally:
+            await cur.close()
+        for key, lat, lng, stale in rows:
+            if stale:
+                continue
+            coordinates = Coordinates(lat, lng) if lat is not None else None
+            self.cache.set(key, coordinates)
+            _lookups.inc(source="table")
+            known[key] = coordinates
+        return known
+
+    async def resolve_many(self, conn, names: Iterable[str]) -> Dict[str, Optional[Coordinates]]:
+        """
+        Coordinates of the names, asking the providers for the ones never resolved.
+        New results are committed to the coordinate table.
+
+        Args:
+            conn (Connection): The database connection; it is committed.
+            names (Iterable[str]): Place names.
+
+        Returns:
+            dict: Normalized name -> Coordinates, or None when no provider knows the
+            place. Names a provider failed on are left out.
+        """
+        known = await self.lookup_many(conn, names)
+        unknown = [key for key in {normalize_place(name) for name in names if name} if key and key not in known]
+        if not unknown:
+            return known
+
+        semaphore = asyncio.Semaphore(GEOCODING_CONCURRENCY)
+
+        async def one(key):
+            async with semaphore:
+                return key, await self._geocode(key)
+
+        results = await asyncio.gather(*(one(key) for key in unknown))
+        rows = []
+        for key, outcome in results:
+            if outcome is None:
+                continue  # every provider failed; try again next time
+            coordinates, provider = outcome
+            rows.append((key, coordinates.lat if coordinates else None,
+                         coordinates.lng if coordinates else None, provider))
+            self.cache.set(key, coordinates)
+            known[key] = coordinates
+        if rows:
+            cur = conn.cursor()
+            try:
+                await cur.executemany(UPSERT_QUERY, rows)
+                await conn.commit()
+            finally:
+                await cur.close()
+            found = {key: Coordinates(lat, lng) for key, lat, lng, _ in rows if lat is not None}
+            for listener in self._listeners if found else []:
+                try:
+                    listener(found)
+                except Exception:
+                    logger.exception("Error notifying geocoding listener")
+        return known
+
+    async def _geocode(self, key: str):
+        """
+        Ask the providers in order.
+
+        Returns:
+            tuple: (Coordinates or None, provider name), or None if every provider failed.
+        """
+        failed = False
+        for provider in self.providers:
+            try:
+                coordinates = await timed_geocode(provider, key)
+            except GeocodingError as e:
+                logger.warning("Geocoding %s with %s failed: %s", key, provider.name, e)
+                failed = True
+                continue
+            if coordinates is not None:
+                _lookups.inc(source=provider.name)
+                return coordinates, provider.name
+        if failed:
+            _lookups.inc(source="error")
+            return None
+        _lookups.inc(source="not_found")
+        return None, "none"
+
+    def prefetch(self, names: Iterable[str]):
+        """
+        Resolve names in the background so later lookups find them.
+        Names already cached or being resolved are skipped.
+        """
+        keys = []
+        for key in {normalize_place(name) for name in names if name}:
+            if key and key not in self._pending and self.cache.get(key) is MISSING:
+                keys.append(key)
+        if not keys:
+            return
+        self._pending.update(keys)
+        task = asyncio.create_task(self._prefetch(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, keys: List[str]):
+        try:
+            async with async_db_connection() as conn:
+                await self.resolve_many(conn, keys)
+        except Exception:
+            logger.exception("Error prefetching coordinates")
+        finally:
+            self._pending.difference_update(keys)
+
+    async def attach_coordinates(self, conn, orders: List[dict]) -> List[dict]:
+        """
+        Add `coordinates` to each order payload and each of its items.
+
+        Orders carry their destination in `location` and items their pickup
+        point in `location`; both get `{"lat", "lng"}` or None. Unknown places
+        are prefetched for the next request.
+
+        Args:
+            conn (Connection): The database connection.
+            orders (list): Order dicts as returned by the list endpoints.
+
+        Returns:
+            list: The same orders.
+        """
+        names = set()
+        for order in orders:
+            names.add(order.get("location"))
+            for item in order.get("items") or []:
+                names.add(item.get("location"))
+        names.discard(None)
+        known = await self.lookup_many(conn, names)
+
+        def coordinates_of(name):
+            coordinates = known.get(normalize_place(name)) if name else None
+            return coordinates.to_dict() if coordinates else None
+
+        for order in orders:
+            order["coordinates"] = coordinates_of(order.get("location"))
+            for item in order.get("items") or []:
+                item["coordinates"] = coordinates_of(item.get("location"))
+        unknown = [name for name in names if normalize_place(name) not in known]
+        if unknown:
+            self.prefetch(unknown)
+        return orders
+
+    async def close(self):
+        """
+        Cancel background lookups and close the providers.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for provider in self._providers or []:
+            await provider.close()
+
+
+geocoder = GeocodingService()
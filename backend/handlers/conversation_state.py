@@ -0,0 +1,178 @@
+# backend/handlers/conversation_state.py
+"""
+Conversation state for multi-step LINE dialogues such as registration.
+
+A state is a small JSON-serialisable dict per LINE user (e.g.
+`{"step": "waiting_for_phone", "name": "..."}`) that expires when the user
+abandons the dialogue. `PostgresConversationStateStore` shares state between
+uvicorn workers and survives restarts; `InMemoryConversationStateStore` is a
+single-process fallback for development. CONVERSATION_STATE_STORE selects the
+implementation (`postgres` by default, or `memory`).
+"""
+import json
+import logging
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+from backend import metrics
+from backend.cache import TTLCache, MISSING
+from backend.database import db_connection
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_STATE_STORE = os.getenv('CONVERSATION_STATE_STORE', 'postgres')
+CONVERSATION_STATE_TTL = float(os.getenv('CONVERSATION_STATE_TTL', 1800))
+CONVERSATION_STATE_MAX_ENTRIES = int(os.getenv('CONVERSATION_STATE_MAX_ENTRIES', 10000))
+CONVERSATION_STATE_PURGE_INTERVAL = float(os.getenv('CONVERSATION_STATE_PURGE_INTERVAL', 300))
+
+_writes = metrics.counter("conversation_state_writes_total", "Conversation states saved.", ["store"])
+_clears = metrics.counter("conversation_state_clears_total", "Conversation states finished or cancelled.", ["store"])
+_expired = metrics.counter("conversation_state_expired_total", "Conversation states purged after expiring.", ["store"])
+_entries = metrics.gauge("conversation_state_entries", "Conversation states currently stored.", ["store"])
+_state_bytes = metrics.histogram(
+    "conversation_state_size_bytes",
+    "Serialized size of saved conversation states.",
+    ["store"],
+    buckets=(32, 64, 128, 256, 512, 1024, 4096)
+)
+
+
+class ConversationStateStore(ABC):
+    """
+    Interface of a conversation state store keyed by LINE user ID.
+    """
+    name = "abstract"
+
+    @abstractmethod
+    def get(self, line_user_id: str) -> Optional[dict]:
+        """
+        Return the user's unexpired state, or None.
+        """
+
+    @abstractmethod
+    def set(self, line_user_id: str, state: dict):
+        """
+        Save the user's state and restart its expiry.
+        """
+
+    @abstractmethod
+    def clear(self, line_user_id: str):
+        """
+        Drop the user's state.
+        """
+
+    def _record_write(self, state: dict):
+        _writes.inc(store=self.name)
+        _state_bytes.observe(len(json.dumps(state, ensure_ascii=False).encode()), store=self.name)
+
+
+class InMemoryConversationStateStore(ConversationStateStore):
+    """
+    Per-process store; states are lost on restart and not shared between workers.
+    """
+    name = "memory"
+
+    def __init__(self, ttl: float = CONVERSATION_STATE_TTL, maxsize: int = CONVERSATION_STATE_MAX_ENTRIES):
+        self._cache = TTLCache("conversation_state", maxsize=maxsize, ttl=ttl)
+
+    def get(self, line_user_id: str) -> Optional[dict]:
+        state = self._cache.get(line_user_id)
+        return None if state is MISSING else dict(state)
+
+    def set(self, line_user_id: str, state: dict):
+        self._cache.set(line_user_id, dict(state))
+        self._record_write(state)
+        _entries.set(self._cache.stats()["size"], store=self.name)
+
+    def clear(self, line_user_id: str):
+        self._cache.invalidate(line_user_id)
+        _clears.inc(store=self.name)
+        _entries.set(self._cache.stats()["size"], store=self.name)
+
+
+class PostgresConversationStateStore(ConversationStateStore):
+    """
+    Store backed by the `conversation_states` table, shared by every worker.
+    Expired rows are ignored on read and purged at most every purge_interval seconds.
+    """
+    name = "postgres"
+
+    def __init__(self, ttl: float = CONVERSATION_STATE_TTL, purge_interval: float = CONVERSATION_STATE_PURGE_INTERVAL):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def get(self, line_user_id: str) -> Optional[dict]:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT state FROM conversation_states WHERE line_user_id = %s AND expires_at > NOW()",
+                (line_user_id,)
+            )
+            row = cur.fetchone()
+            conn.commit()
+        return row[0] if row else None
+
+    def set(self, line_user_id: str, state: dict):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                INSERT INTO conversation_states (line_user_id, state, expires_at)
+                VALUES (%s, %s, NOW() + make_interval(secs => %s))
+                ON CONFLICT (line_user_id)
+                DO UPDATE SET state = EXCLUDED.state, expires_at = EXCLUDED.expires_at
+                """,
+                (line_user_id, json.dumps(state, ensure_ascii=False), self.ttl)
+            )
+            conn.commit()
+        self._record_write(state)
+        self.purge_expired()
+
+    def clear(self, line_user_id: str):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM conversation_states WHERE line_user_id = %s", (line_user_id,))
+            conn.commit()
+        _clears.inc(store=self.name)
+
+    def purge_expired(self, force: bool = False):
+        """
+        Delete expired states and refresh the entry gauge, at most once per purge interval.
+        """
+        now = time.monotonic()
+        with self._purge_lock:
+            if not force and now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM conversation_states WHERE expires_at <= NOW()")
+                _expired.inc(cur.rowcount, store=self.name)
+                cur.execute("SELECT COUNT(*) FROM conversation_states")
+                _entries.set(cur.fetchone()[0], store=self.name)
+                conn.commit()
+        except Exception:
+            logger.exception("Error purging expired conversation states")
+
+
+_store = None
+
+
+def get_conversation_state_store() -> ConversationStateStore:
+    """
+    Return the process-wide store selected by CONVERSATION_STATE_STORE.
+    """
+    global _store
+    if _store is None:
+        if CONVERSATION_STATE_STORE == 'memory':
+            _store = InMemoryConversationStateStore()
+        elif CONVERSATION_STATE_STORE == 'postgres':
+            _store = PostgresConversationStateStore()
+        else:
+            raise ValueError(f"Unknown CONVERSATION_STATE_STORE: {CONVERSATION_STATE_STORE}")
+    return _store
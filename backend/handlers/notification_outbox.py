@@ -0,0 +1,203 @@
+# backend/handlers/notification_outbox.py
+"""
+Transactional outbox for LINE notifications.
+
+Request handlers write a pending row into `notification_outbox` with the same
+transaction that changes the order, so the notification is recorded exactly
+when the change commits and the HTTP request never waits on the LINE API.
+`NotificationDispatcher` drains pending rows in the background, retrying
+failed pushes with exponential backoff, skipping users without a bound LINE
+account and dead-lettering rows that keep failing.
+"""
+import asyncio
+import logging
+import os
+import random
+from backend.database import async_db_connection
+from backend.handlers.send_message import LineMessageService, SENT, UNBOUND
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', 50))
+NOTIFY_POLL_INTERVAL = float(os.getenv('NOTIFY_POLL_INTERVAL', 5))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 6))
+NOTIFY_BASE_BACKOFF = float(os.getenv('NOTIFY_BASE_BACKOFF', 5))
+NOTIFY_MAX_BACKOFF = float(os.getenv('NOTIFY_MAX_BACKOFF', 900))
+# A claimed row is invisible to other dispatchers for this long, so a worker
+# that dies mid-send only delays the notification instead of losing it.
+NOTIFY_CLAIM_LEASE = float(os.getenv('NOTIFY_CLAIM_LEASE', 120))
+
+
+async def enqueue_notification(cur, user_id: int, message: str):
+    """
+    Record a notification inside the caller's transaction.
+
+    Parameters:
+    - cur: A cursor of the transaction that performs the order change.
+    - user_id: The user to notify.
+    - message: The text to push.
+    """
+    await cur.execute(
+        "INSERT INTO notification_outbox (user_id, message) VALUES (%s, %s)",
+        (user_id, message)
+    )
+
+
+async def enqueue_notifications(cur, notifications):
+    """
+    Record many notifications inside the caller's transaction.
+
+    Parameters:
+    - cur: A cursor of the transaction that performs the change.
+    - notifications: The (user_id, message) pairs to record.
+    """
+    if not notifications:
+        return
+    await cur.executemany(
+        "INSERT INTO notification_outbox (user_id, message) VALUES (%s, %s)",
+        notifications
+    )
+
+
+class NotificationDispatcher:
+    """
+    Background worker that delivers pending outbox rows through LineMessageService.
+    """
+
+    def __init__(self, line_service: LineMessageService = None):
+        self.line_service = line_service or LineMessageService()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """
+        Start draining the outbox on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the background worker.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.line_service.close()
+
+    def wake(self):
+        """
+        Ask the worker to drain now instead of waiting for the next poll.
+        """
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error draining notification outbox")
+                delivered = 0
+            if delivered < NOTIFY_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=NOTIFY_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim(self):
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(
+                """
+                UPDATE notification_outbox
+                SET attempts = attempts + 1,
+                    next_attempt_at = NOW() + make_interval(secs => %s)
+                WHERE id IN (
+                    SELECT id FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= NOW()
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, user_id, message, attempts
+                """,
+                (NOTIFY_CLAIM_LEASE, NOTIFY_BATCH_SIZE)
+            )
+            rows = await cur.fetchall()
+            await conn.commit()
+            return sorted(rows)
+
+    async def drain_once(self) -> int:
+        """
+        Claim one batch of due notifications and deliver them with batched LINE calls.
+
+        Returns:
+        - The number of claimed rows.
+        """
+        rows = await self._claim()
+        if not rows:
+            return 0
+
+        outcomes = await self.line_service.send_messages(
+            [(user_id, message) for _, user_id, message, _ in rows]
+        )
+
+        sent, unbound, dead, retry = [], [], [], []
+        for (outbox_id, _, _, attempts), outcome in zip(rows, outcomes):
+            if outcome == SENT:
+                sent.append(outbox_id)
+            elif outcome == UNBOUND:
+                unbound.append(outbox_id)
+            elif attempts >= NOTIFY_MAX_ATTEMPTS:
+                dead.append(outbox_id)
+            else:
+                retry.append((self.backoff(attempts), outbox_id))
+        if dead:
+            logger.warning("Notifications %s dead-lettered after %s attempts", dead, NOTIFY_MAX_ATTEMPTS)
+
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            if sent:
+                await cur.execute(
+                    "UPDATE notification_outbox SET status = 'sent', sent_at = NOW(), last_error = NULL WHERE id = ANY(%s)",
+                    (sent,)
+                )
+            if unbound:
+                await cur.execute(
+                    "UPDATE notification_outbox SET status = 'skipped', last_error = %s WHERE id = ANY(%s)",
+                    ("User LINE ID not found", unbound)
+                )
+            if dead:
+                await cur.execute(
+                    "UPDATE notification_outbox SET status = 'dead', last_error = %s WHERE id = ANY(%s)",
+                    ("LINE push failed", dead)
+                )
+            if retry:
+                await cur.executemany(
+                    """
+                    UPDATE notification_outbox
+                    SET next_attempt_at = NOW() + make_interval(secs => %s), last_error = %s
+                    WHERE id = %s
+                    """,
+                    [(delay, "LINE push failed", outbox_id) for delay, outbox_id in retry]
+                )
+            await conn.commit()
+        return len(rows)
+
+    @staticmethod
+    def backoff(attempts: int) -> float:
+        """
+        Exponential backoff with jitter for the given number of failed attempts.
+        """
+        delay = min(NOTIFY_MAX_BACKOFF, NOTIFY_BASE_BACKOFF * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+
+notification_dispatcher = NotificationDispatcher()
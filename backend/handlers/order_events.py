@@ -0,0 +1,140 @@
+# backend/handlers/order_events.py
+"""
+Real-time order events over Postgres LISTEN/NOTIFY.
+
+Request handlers call `publish_order_event` inside the transaction that
+changes an order; Postgres delivers the notification to every listener only
+when that transaction commits, so events are never sent for rolled-back
+changes. Each uvicorn worker runs one `OrderEventBroker` that listens on the
+channel with a dedicated connection and fans events out to its Server-Sent
+Events subscribers, which makes the feed work across workers.
+"""
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+import psycopg
+from backend import metrics
+from backend.database import database_url
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_CHANNEL = "order_events"
+ORDER_EVENTS_QUEUE_SIZE = int(os.getenv('ORDER_EVENTS_QUEUE_SIZE', 100))
+ORDER_EVENTS_RECONNECT_DELAY = float(os.getenv('ORDER_EVENTS_RECONNECT_DELAY', 2))
+
+_published = metrics.counter("order_events_published_total", "Order events published by this process.", ["event"])
+_delivered = metrics.counter("order_events_delivered_total", "Order events received from Postgres.", ["event"])
+_dropped = metrics.counter("order_events_dropped_total", "Events dropped because a subscriber fell behind.")
+
+
+async def publish_order_event(cur, event: str, service: str, order_id: int, **data):
+    """
+    Publish an order event; it is delivered when the caller's transaction commits.
+
+    Parameters:
+    - cur: A cursor of the transaction that changes the order.
+    - event: created, accepted, transferred or completed.
+    - service: 'necessities' or 'agricultural_product'.
+    - order_id: The order's ID.
+    - data: Extra fields for subscribers, e.g. driver_id.
+    """
+    payload = json.dumps({
+        "event": event,
+        "service": service,
+        "order_id": order_id,
+        "timestamp": datetime.now().isoformat(),
+        **data
+    })
+    await cur.execute("SELECT pg_notify(%s, %s)", (ORDER_EVENTS_CHANNEL, payload))
+    _published.inc(event=event)
+
+
+class OrderEventBroker:
+    """
+    Listens for order events and fans them out to in-process subscribers.
+    """
+
+    def __init__(self, conninfo: str = None):
+        self.conninfo = conninfo or database_url
+        self._subscribers = set()
+        self._task = None
+
+    def start(self):
+        """
+        Start listening on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop listening.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @asynccontextmanager
+    async def subscribe(self):
+        """
+        Register a subscriber queue for the duration of the context.
+
+        Yields:
+        - An asyncio.Queue receiving event dicts.
+        """
+        queue = asyncio.Queue(maxsize=ORDER_EVENTS_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    def publish_local(self, event: dict):
+        """
+        Hand an event to every subscriber, dropping the oldest one for subscribers that fell behind.
+        """
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+                _dropped.inc()
+            queue.put_nowait(event)
+
+    async def _run(self):
+        connected_before = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {ORDER_EVENTS_CHANNEL}")
+                    if connected_before:
+                        # Events may have been missed while disconnected
+                        self.publish_local({"event": "resync"})
+                    connected_before = True
+                    async for notify in conn.notifies():
+                        try:
+                            event = json.loads(notify.payload)
+                        except ValueError:
+                            logger.warning("Ignoring malformed order event: %s", notify.payload)
+                            continue
+                        _delivered.inc(event=event.get("event", "unknown"))
+                        self.publish_local(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Order event listener disconnected")
+            await asyncio.sleep(ORDER_EVENTS_RECONNECT_DELAY)
+
+
+order_event_broker = OrderEventBroker()
+
+metrics.gauge(
+    "order_events_subscribers",
+    "Open order event streams.",
+    callback=lambda: len(order_event_broker._subscribers)
+)
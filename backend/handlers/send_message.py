@@ -1,54 +1,186 @@
 # backend/handlers/send_message.py
 from linebot.v3.messaging import (
-    ApiClient,
-    MessagingApi,
+    AsyncMessagingApi,
     Configuration,
     TextMessage,
-    PushMessageRequest
+    PushMessageRequest,
+    MulticastRequest
 )
-from fastapi import HTTPException
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
 import os
-from backend.database import get_db_connection  # Adjust the import path as necessary
+from backend.cache import TTLCache, MISSING
+from backend.database import async_db_connection
+from backend.instrumentation import InstrumentedAsyncApiClient
+
+logger = logging.getLogger(__name__)
+
+# LINE Messaging API limits
+MULTICAST_MAX_RECIPIENTS = 500
+PUSH_MAX_MESSAGES = 5
+
+# Per-recipient outcomes reported by LineMessageService.send_messages
+SENT = "sent"
+UNBOUND = "unbound"
+FAILED = "failed"
+
+# user_id -> line_user_id (None when the user has not bound a LINE account).
+# Invalidated by users.bind_line_account and the LINE registration flow.
+line_user_id_cache = TTLCache(
+    "line_user_id",
+    maxsize=int(os.getenv('LINE_USER_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('LINE_USER_CACHE_TTL', 600))
+)
 
 class LineMessageService:
     def __init__(self):
         self.configuration = Configuration(
             access_token=os.getenv('LINE_BOT_TOKEN')
         )
-    
-    async def send_message_to_user(self, user_id: int, message: str):
+        self._api_client = None
+        self._line_bot_api = None
+
+    def _messaging_api(self) -> AsyncMessagingApi:
+        """
+        Return the long-lived messaging client, creating it on first use.
+        Its HTTP session keeps connections to the LINE API alive between pushes.
+        """
+        if self._line_bot_api is None:
+            self._api_client = InstrumentedAsyncApiClient(self.configuration)
+            self._line_bot_api = AsyncMessagingApi(self._api_client)
+        return self._line_bot_api
+
+    async def close(self):
+        """
+        Close the HTTP session of the messaging client.
         """
-        Send a message to a LINE user by user ID.
-        
+        if self._api_client is not None:
+            await self._api_client.close()
+            self._api_client = None
+            self._line_bot_api = None
+
+    async def get_line_user_id(self, user_id: int):
+        """
+        Look up the LINE user ID bound to a user, using the in-process cache.
+
         Parameters:
-        - user_id: 
-        - message: 
+        - user_id: The user's ID.
+
+        Returns:
+        - The LINE user ID, or None if the user has not bound a LINE account.
         """
-        try:
-            # Get LINE user ID from database
-            with get_db_connection() as conn:
+        line_user_id = line_user_id_cache.get(user_id)
+        if line_user_id is not MISSING:
+            return line_user_id
+
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(
+                "SELECT line_user_id FROM users WHERE id = %s",
+                (user_id,)
+            )
+            result = await cur.fetchone()
+
+        line_user_id = result[0] if result and result[0] else None
+        line_user_id_cache.set(user_id, line_user_id)
+        return line_user_id
+
+    async def get_line_user_ids(self, user_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """
+        Look up the LINE user IDs of many users with at most one query.
+
+        Parameters:
+        - user_ids: The users' IDs.
+
+        Returns:
+        - A mapping of user ID to LINE user ID, None for users without a bound account.
+        """
+        resolved = {}
+        missing = []
+        for user_id in set(user_ids):
+            line_user_id = line_user_id_cache.get(user_id)
+            if line_user_id is MISSING:
+                missing.append(user_id)
+            else:
+                resolved[user_id] = line_user_id
+
+        if missing:
+            async with async_db_connection() as conn:
                 cur = conn.cursor()
-                cur.execute(
-                    "SELECT line_user_id FROM users WHERE id = %s",
-                    (user_id,)
+                await cur.execute(
+                    "SELECT id, line_user_id FROM users WHERE id = ANY(%s)",
+                    (missing,)
                 )
-                result = cur.fetchone()
-                
-                if not result or not result[0]:
-                    raise HTTPException(status_code=404, detail="User LINE ID not found")
-                
-                line_user_id = result[0]
-            
-            # Send message to LINE user
-            with ApiClient(self.configuration) as api_client:
-                line_bot_api = MessagingApi(api_client)
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=line_user_id,
-                        messages=[TextMessage(text=message)]
-                    )
-                )
-            return True
+                found = dict(await cur.fetchall())
+            for user_id in missing:
+                line_user_id = found.get(user_id) or None
+                line_user_id_cache.set(user_id, line_user_id)
+                resolved[user_id] = line_user_id
+        return resolved
+
+    async def send_messages(self, notifications: List[Tuple[int, str]]) -> List[str]:
+        """
+        Deliver many (user_id, message) notifications with as few API calls as possible.
+
+        Identical messages for several recipients are sent with one multicast
+        (up to 500 recipients per call); the remaining messages of each
+        recipient are pushed together (up to 5 messages per call).
+
+        Parameters:
+        - notifications: The (user_id, message) pairs to deliver.
+
+        Returns:
+        - One outcome per notification, in input order: SENT, UNBOUND or FAILED.
+        """
+        outcomes = [FAILED] * len(notifications)
+        line_user_ids = await self.get_line_user_ids(user_id for user_id, _ in notifications)
+
+        # message -> {line_user_id: [notification indexes]}
+        by_message = defaultdict(lambda: defaultdict(list))
+        for index, (user_id, message) in enumerate(notifications):
+            line_user_id = line_user_ids.get(user_id)
+            if not line_user_id:
+                outcomes[index] = UNBOUND
+                continue
+            by_message[message][line_user_id].append(index)
+
+        # line_user_id -> [(message, [notification indexes])] left for push
+        by_recipient = defaultdict(list)
+        api = self._messaging_api()
+        for message, recipients in by_message.items():
+            if len(recipients) < 2:
+                for line_user_id, indexes in recipients.items():
+                    by_recipient[line_user_id].append((message, indexes))
+                continue
+            line_ids = list(recipients)
+            for start in range(0, len(line_ids), MULTICAST_MAX_RECIPIENTS):
+                chunk = line_ids[start:start + MULTICAST_MAX_RECIPIENTS]
+                outcome = await self._call(api.multicast, MulticastRequest(
+                    to=chunk,
+                    messages=[TextMessage(text=message)]
+                ))
+                for line_user_id in chunk:
+                    for index in recipients[line_user_id]:
+                        outcomes[index] = outcome
+
+        for line_user_id, pending in by_recipient.items():
+            for start in range(0, len(pending), PUSH_MAX_MESSAGES):
+                chunk = pending[start:start + PUSH_MAX_MESSAGES]
+                outcome = await self._call(api.push_message, PushMessageRequest(
+                    to=line_user_id,
+                    messages=[TextMessage(text=message) for message, _ in chunk]
+                ))
+                for _, indexes in chunk:
+                    for index in indexes:
+                        outcomes[index] = outcome
+        return outcomes
+
+    @staticmethod
+    async def _call(method, request) -> str:
+        try:
+            await method(request)
+            return SENT
         except Exception as e:
-            print(f"Error sending LINE message: {str(e)}")
-            return False
\ No newline at end of file
+            logger.error("Error sending LINE message: %s", str(e))
+            return FAILED
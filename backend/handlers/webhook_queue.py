@@ -0,0 +1,171 @@
+# backend/handlers/webhook_queue.py
+"""
+Asynchronous processing of LINE webhook events.
+
+POST /callback only verifies the signature, drops events it has already seen
+and enqueues the rest, then acknowledges LINE. An event's `webhook_event_id`
+is recorded in `processed_webhook_events` only once its handler has finished,
+so redeliveries are caught by any worker while an event lost to a crash or
+shutdown is still handled when LINE redelivers it; events still queued in
+this process are skipped in memory.
+`WebhookDispatcher` runs a fixed number of shard workers; events of the same
+LINE user always go to the same shard, so a user's messages are handled in
+order while different users are handled concurrently. The blocking handler
+runs in a thread so DB queries and reply calls never block the event loop.
+"""
+import asyncio
+import logging
+import os
+import time
+import zlib
+from typing import Callable, List
+from backend import metrics
+from backend.database import async_db_connection
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+WEBHOOK_DEDUP_RETENTION = float(os.getenv('WEBHOOK_DEDUP_RETENTION', 86400))
+WEBHOOK_SHUTDOWN_GRACE = float(os.getenv('WEBHOOK_SHUTDOWN_GRACE', 10))
+
+_received = metrics.counter("webhook_events_received_total", "Webhook events received, by outcome.", ["result"])
+_processed = metrics.counter("webhook_events_processed_total", "Webhook events handled, by outcome.", ["result"])
+_queue_wait = metrics.histogram("webhook_event_queue_seconds", "Time events wait in the queue before handling.")
+_handle_time = metrics.histogram("webhook_event_handle_seconds", "Time spent handling one event.")
+
+
+class WebhookDispatcher:
+    """
+    Sharded worker pool for webhook events.
+
+    Args:
+        process (Callable): Blocking function handling one event.
+        workers (int): Number of shards, i.e. events handled concurrently.
+        queue_size (int): Capacity of each shard's queue.
+    """
+
+    def __init__(self, process: Callable, workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        self.process = process
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queues = []
+        self._tasks = []
+        self._in_flight = set()
+        self._last_purge = 0.0
+        metrics.gauge("webhook_queue_depth", "Webhook events waiting to be handled.",
+                      callback=lambda: sum(queue.qsize() for queue in self._queues))
+
+    def start(self):
+        """
+        Start the shard workers on the running event loop.
+        """
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def stop(self):
+        """
+        Let queued events finish for a short grace period, then stop the workers.
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=WEBHOOK_SHUTDOWN_GRACE
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %s unhandled webhook events on shutdown",
+                           sum(queue.qsize() for queue in self._queues))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, events: List) -> int:
+        """
+        Queue new events for processing, skipping ones already received.
+        Waits when a shard is full, which slows the webhook down instead of losing events.
+        Starts the workers if `start()` has not been called yet.
+
+        Parameters:
+        - events: Parsed webhook events.
+
+        Returns:
+        - The number of events queued.
+        """
+        if not self._tasks:
+            self.start()
+        fresh = await self._filter_new(events)
+        for event in fresh:
+            shard = zlib.crc32(self._user_key(event).encode()) % len(self._queues)
+            await self._queues[shard].put((time.perf_counter(), event))
+            _received.inc(result="queued")
+        return len(fresh)
+
+    @staticmethod
+    def _user_key(event) -> str:
+        source = getattr(event, "source", None)
+        return (getattr(source, "user_id", None) or getattr(source, "group_id", None)
+                or getattr(source, "room_id", None) or "")
+
+    async def _filter_new(self, events: List) -> List:
+        ids = {event.webhook_event_id for event in events if getattr(event, "webhook_event_id", None)}
+        seen = ids & self._in_flight
+        if ids - seen:
+            async with async_db_connection() as conn:
+                cur = conn.cursor()
+                await cur.execute(
+                    "SELECT webhook_event_id FROM processed_webhook_events WHERE webhook_event_id = ANY(%s)",
+                    (list(ids - seen),)
+                )
+                seen.update(row[0] for row in await cur.fetchall())
+
+        fresh = []
+        for event in events:
+            event_id = getattr(event, "webhook_event_id", None)
+            if event_id is None:
+                fresh.append(event)
+            elif event_id in seen:
+                _received.inc(result="duplicate")
+            else:
+                fresh.append(event)
+                seen.add(event_id)
+                self._in_flight.add(event_id)
+        return fresh
+
+    async def _mark_processed(self, event_id: str):
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(
+                "INSERT INTO processed_webhook_events (webhook_event_id) VALUES (%s) ON CONFLICT DO NOTHING",
+                (event_id,)
+            )
+            if time.monotonic() - self._last_purge > WEBHOOK_DEDUP_RETENTION / 24:
+                self._last_purge = time.monotonic()
+                await cur.execute(
+                    "DELETE FROM processed_webhook_events WHERE received_at < NOW() - make_interval(secs => %s)",
+                    (WEBHOOK_DEDUP_RETENTION,)
+                )
+            await conn.commit()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            enqueued_at, event = await queue.get()
+            started = time.perf_counter()
+            _queue_wait.observe(started - enqueued_at)
+            event_id = getattr(event, "webhook_event_id", None)
+            try:
+                await asyncio.to_thread(self.process, event)
+                if event_id:
+                    await self._mark_processed(event_id)
+                _processed.inc(result="ok")
+            except Exception:
+                _processed.inc(result="error")
+                logger.exception("Error handling webhook event %s", event_id)
+            finally:
+                _handle_time.observe(time.perf_counter() - started)
+                self._in_flight.discard(event_id)
+                queue.task_done()
@@ -0,0 +1,30 @@
+"""
+Image storage for product photos.
+
+Every upload is stored along with resized JPEG variants (see `processing`)
+and recorded by content hash in `image_objects`, so re-uploading the same
+photo reuses the stored objects.
+
+The backend is chosen with IMAGE_STORAGE: `imgbb` (default) uploads to ImgBB,
+`local` writes into IMAGE_LOCAL_DIR and is served by the API itself, which is
+handy for development and tests.
+"""
+from backend.images.storage import (
+    ImageStorage,
+    ImageStorageError,
+    ImageTooLargeError,
+    ImgBBStorage,
+    LocalImageStorage,
+    StoredImage,
+    close_image_storage,
+    detect_content_type,
+    get_image_storage,
+    max_base64_length,
+    read_upload,
+    IMAGE_MAX_BYTES,
+    IMAGE_STORAGE,
+    IMAGE_LOCAL_DIR,
+    IMAGE_PUBLIC_URL,
+)
+from backend.images.processing import VARIANTS, content_hash, make_variants
+from backend.images.pipeline import save_image
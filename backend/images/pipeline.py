@@ -0,0 +1,53 @@
+"""
+Store an uploaded image with its variants, reusing earlier uploads of the same bytes.
+"""
+import asyncio
+import json
+from backend.images.processing import content_hash, make_variants
+from backend.images.storage import get_image_storage
+
+
+async def save_image(cur, data: bytes, content_type: str):
+    """
+    Store an image and its variants, or return the stored copy of identical bytes.
+
+    Args:
+        cur: A cursor used to look up and record the content hash.
+        data (bytes): The validated image.
+        content_type (str): The MIME type of data.
+
+    Returns:
+        tuple: (img_id, img_link, variants, reused) where variants maps
+        variant name to URL and reused tells whether the image already existed.
+    """
+    digest = content_hash(data)
+    await cur.execute(
+        "SELECT img_id, img_link, variants FROM image_objects WHERE content_hash = %s",
+        (digest,)
+    )
+    existing = await cur.fetchone()
+    if existing:
+        return existing[0], existing[1], existing[2], True
+
+    variants = await asyncio.to_thread(make_variants, data)
+    storage = get_image_storage()
+    names = list(variants)
+    stored = await asyncio.gather(
+        storage.save(data, content_type),
+        *(storage.save(variants[name], "image/jpeg") for name in names)
+    )
+    original = stored[0]
+    variant_links = {name: image.img_link for name, image in zip(names, stored[1:])}
+
+    # A concurrent upload of the same bytes may have won the race; keep its row
+    await cur.execute(
+        """
+        INSERT INTO image_objects (content_hash, img_id, img_link, variants)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (content_hash) DO UPDATE SET content_hash = EXCLUDED.content_hash
+        RETURNING img_id, img_link, variants
+        """,
+        (digest, original.img_id, original.img_link, json.dumps(variant_links))
+    )
+    row = await cur.fetchone()
+    return row[0], row[1], row[2], row[0] != original.img_id
@@ -0,0 +1,57 @@
+"""
+Resized variants and content hashing for uploaded images.
+"""
+import hashlib
+import io
+import os
+from PIL import Image, ImageOps
+
+# Variant name -> longest edge in pixels
+VARIANTS = {
+    "thumbnail": int(os.getenv('IMAGE_THUMBNAIL_SIZE', 160)),
+    "list": int(os.getenv('IMAGE_LIST_SIZE', 480)),
+    "detail": int(os.getenv('IMAGE_DETAIL_SIZE', 1280)),
+}
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+# Refuse images that would need too much memory to decode
+Image.MAX_IMAGE_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+
+
+def content_hash(data: bytes) -> str:
+    """
+    SHA-256 of the image bytes, used to recognise re-uploads.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_variants(data: bytes):
+    """
+    Decode an image once and encode a JPEG for each entry of VARIANTS.
+
+    Orientation from EXIF is applied and transparency is flattened onto
+    white. Images smaller than a variant are recompressed but not enlarged.
+    CPU bound; call it with asyncio.to_thread.
+
+    Args:
+        data (bytes): The original image.
+
+    Returns:
+        dict: Variant name -> JPEG bytes.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        variants = {}
+        # Largest first so each step downsamples an already smaller image
+        for name, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, "JPEG", quality=IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+            variants[name] = out.getvalue()
+        return variants
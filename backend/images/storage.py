@@ -0,0 +1,213 @@
+"""
+Pluggable storage backends for uploaded images.
+"""
+import asyncio
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+import httpx
+
+IMAGE_STORAGE = os.getenv('IMAGE_STORAGE', 'imgbb')
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+IMAGE_LOCAL_DIR = os.getenv('IMAGE_LOCAL_DIR', os.path.join(os.getcwd(), 'backend', 'media'))
+IMAGE_PUBLIC_URL = os.getenv('IMAGE_PUBLIC_URL', '/api/images')
+IMGBB_UPLOAD_URL = "https://api.imgbb.com/1/upload"
+IMGBB_TIMEOUT = float(os.getenv('IMGBB_TIMEOUT', 30))
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class StoredImage(NamedTuple):
+    img_id: str
+    img_link: str
+
+
+class ImageTooLargeError(ValueError):
+    """
+    Raised when an upload exceeds IMAGE_MAX_BYTES.
+    """
+
+
+class ImageStorageError(RuntimeError):
+    """
+    Raised when the storage backend rejects an upload.
+
+    Args:
+        status_code (int): HTTP status to report to the client.
+        detail (str): Error message.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ImageStorage(ABC):
+    """
+    Interface of an image storage backend.
+    """
+
+    @abstractmethod
+    async def save(self, data: bytes, content_type: str = "image/jpeg", name: str = None) -> StoredImage:
+        """
+        Store the image bytes and return their ID and public URL.
+        """
+
+    async def close(self):
+        """
+        Release resources held by the backend.
+        """
+
+
+class ImgBBStorage(ImageStorage):
+    """
+    Uploads images to ImgBB through a pooled async HTTP client.
+    """
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.environ.get('IMGBB_API_KEY')
+        self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=IMGBB_TIMEOUT)
+        return self._client
+
+    async def save(self, data: bytes, content_type: str = "image/jpeg", name: str = None) -> StoredImage:
+        if not self.api_key:
+            raise ImageStorageError(500, "IMGBB_API_KEY not set")
+        filename = name or uuid.uuid4().hex + EXTENSIONS.get(content_type, "")
+        try:
+            response = await self._http().post(
+                IMGBB_UPLOAD_URL,
+                data={'key': self.api_key},
+                files={'image': (filename, data, content_type)}
+            )
+        except httpx.HTTPError as e:
+            raise ImageStorageError(500, f"Network error: {str(e)}") from e
+
+        try:
+            response_data = response.json()
+        except ValueError:
+            response_data = {}
+        if response.status_code == 200 and response_data.get("data"):
+            return StoredImage(response_data["data"]["id"], response_data["data"]["url"])
+        error_msg = (response_data.get("error") or {}).get("message", "Unknown ImgBB API error")
+        raise ImageStorageError(response.status_code, f"ImgBB API error: {error_msg}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalImageStorage(ImageStorage):
+    """
+    Writes images into a local directory served under IMAGE_PUBLIC_URL.
+
+    Args:
+        root (str): Directory the images are written to.
+        public_url (str): URL prefix the directory is served from.
+    """
+
+    def __init__(self, root: str = IMAGE_LOCAL_DIR, public_url: str = IMAGE_PUBLIC_URL):
+        self.root = root
+        self.public_url = public_url.rstrip('/')
+        os.makedirs(self.root, exist_ok=True)
+
+    async def save(self, data: bytes, content_type: str = "image/jpeg", name: str = None) -> StoredImage:
+        img_id = name or uuid.uuid4().hex + EXTENSIONS.get(content_type, "")
+        await asyncio.to_thread(self._write, img_id, data)
+        return StoredImage(img_id, f"{self.public_url}/{img_id}")
+
+    def _write(self, img_id: str, data: bytes):
+        path = os.path.join(self.root, img_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def detect_content_type(data: bytes):
+    """
+    Identify the image format from its leading bytes.
+
+    Returns:
+        str: The MIME type, or None if the data is not a supported image.
+    """
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def max_base64_length(limit: int = IMAGE_MAX_BYTES) -> int:
+    """
+    Longest base64 string that can decode to at most limit bytes.
+    """
+    return (limit + 2) // 3 * 4
+
+
+async def read_upload(upload, limit: int = IMAGE_MAX_BYTES) -> bytes:
+    """
+    Read an uploaded file in chunks, giving up as soon as it exceeds limit.
+
+    Args:
+        upload (UploadFile): The multipart file.
+        limit (int): Maximum number of bytes.
+
+    Returns:
+        bytes: The file content.
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            raise ImageTooLargeError(f"Image exceeds {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+_storage = None
+
+
+def get_image_storage() -> ImageStorage:
+    """
+    Return the process-wide storage backend selected by IMAGE_STORAGE.
+    """
+    global _storage
+    if _storage is None:
+        if IMAGE_STORAGE == 'local':
+            _storage = LocalImageStorage()
+        elif IMAGE_STORAGE == 'imgbb':
+            _storage = ImgBBStorage()
+        else:
+            raise ValueError(f"Unknown IMAGE_STORAGE: {IMAGE_STORAGE}")
+    return _storage
+
+
+async def close_image_storage():
+    """
+    Close the storage backend, if one was created.
+    """
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
@@ -0,0 +1,359 @@
+"""
+Request, database and LINE API instrumentation.
+
+`RequestMetricsMiddleware` records the count, errors and latency of every
+request under its route template (e.g. `/api/orders/{order_id}`), together
+with how many SQL statements the request issued and how long they took. The
+statements are timed by the cursor classes the connection pools are created
+with, which add to the stats of the request running in the current context.
+`InstrumentedApiClient` / `InstrumentedAsyncApiClient` time every LINE
+Messaging API call. Everything is exposed on `GET /metrics`; each request is
+also written as a REQUEST_COMPLETED event to `http.log` for `analyze_logs.py`.
+
+Statements are recorded in normalized form (literals and placeholders
+replaced by `?`), so a statement run in a loop is counted as one statement
+with many calls. Statements slower than DB_SLOW_QUERY_MS are written to
+`db.log` as SLOW_QUERY events, whether or not they ran inside a request.
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+import psycopg
+from psycopg2 import extensions
+from linebot.v3.messaging import ApiClient, AsyncApiClient
+from backend import metrics
+from backend.event_log import event_logger
+
+UNMATCHED_ROUTE = "unmatched"
+LOG_REQUESTS = os.getenv('LOG_REQUESTS', '1') not in ('0', 'false', 'False')
+# Statements at least this slow are written to db.log as SLOW_QUERY events.
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+# Requests at least this slow log their full statement trace.
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+DB_TRACE_MAX_STATEMENTS = int(os.getenv('DB_TRACE_MAX_STATEMENTS', 100))
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') not in ('0', 'false', 'False')
+
+log_event = event_logger("http")
+log_db_event = event_logger("db")
+
+_requests = metrics.counter(
+    "http_requests_total", "HTTP requests handled.", ["method", "route", "status"])
+_request_errors = metrics.counter(
+    "http_request_errors_total", "HTTP requests that failed with a 5xx status or an exception.", ["method", "route"])
+_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Time to produce the full HTTP response.", ["method", "route"])
+_in_progress = metrics.gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled.")
+_request_db_queries = metrics.histogram(
+    "http_request_db_queries", "SQL statements issued per HTTP request.", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+_request_db_seconds = metrics.histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per HTTP request.", ["method", "route"])
+_db_query_seconds = metrics.histogram(
+    "db_query_duration_seconds", "Duration of single SQL statements.", ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+_slow_queries = metrics.counter(
+    "db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS.", ["pool"])
+_line_api_seconds = metrics.histogram(
+    "line_api_request_seconds", "Latency of LINE Messaging API calls.", ["endpoint", "outcome"])
+
+
+class RequestStats:
+    """
+    Database work done while handling one request.
+
+    Statements are aggregated by their normalized text, so a query issued in a
+    loop shows up as one entry with many calls.
+    """
+    __slots__ = ("method", "path", "db_queries", "db_seconds", "statements")
+
+    def __init__(self, method: str = None, path: str = None):
+        self.method = method
+        self.path = path
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}  # normalized SQL -> [calls, seconds, rows]
+
+    def add(self, statement: str, seconds: float, rows: int):
+        self.db_queries += 1
+        self.db_seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            if len(self.statements) >= DB_TRACE_MAX_STATEMENTS:
+                return
+            entry = self.statements[statement] = [0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += max(rows, 0)
+
+    def trace(self) -> list:
+        """
+        Statements of the request, slowest first.
+        """
+        return [
+            {"statement": statement, "calls": calls, "total_ms": round(seconds * 1000, 3), "rows": rows}
+            for statement, (calls, seconds, rows) in sorted(
+                self.statements.items(), key=lambda item: -item[1][1]
+            )
+        ]
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """
+    Stats of the request being handled in this context, or None outside a request.
+    """
+    return _current_request.get()
+
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_SQL_PLACEHOLDER = re.compile(r"%\([^)]+\)s|%s")
+_SQL_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """
+    Reduce a statement to its shape: literals and placeholders become `?`,
+    lists of them collapse to `(?...)` and whitespace is squeezed.
+    """
+    text = _SQL_STRING.sub("?", query)
+    text = _SQL_PLACEHOLDER.sub("?", text)
+    text = _SQL_NUMBER.sub("?", text)
+    text = _SQL_LIST.sub("(?...)", text)
+    return _SQL_SPACE.sub(" ", text).strip()
+
+
+def _statement_text(query) -> str:
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    return normalize_sql(query)
+
+
+def record_query(seconds: float, pool: str, query=None, rows: int = -1):
+    """
+    Account one executed SQL statement and log it if it was slow.
+
+    Args:
+        seconds (float): Execution time of the statement.
+        pool (str): "async" for the psycopg 3 pool, "sync" for the psycopg2 pool.
+        query: The statement text as passed to execute.
+        rows (int): Rows returned or affected, -1 if unknown.
+    """
+    _db_query_seconds.observe(seconds, pool=pool)
+    stats = _current_request.get()
+    if stats is None and seconds * 1000 < DB_SLOW_QUERY_MS:
+        return
+    statement = _statement_text(query)
+    if stats is not None:
+        stats.add(statement, seconds, rows)
+    if seconds * 1000 >= DB_SLOW_QUERY_MS:
+        _slow_queries.inc(pool=pool)
+        log_db_event("SLOW_QUERY", {
+            "statement": statement,
+            "duration_ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "pool": pool,
+            "method": stats.method if stats else None,
+            "path": stats.path if stats else None,
+        })
+
+
+def _rowcount(cursor) -> int:
+    try:
+        return cursor.rowcount
+    except Exception:
+        return -1
+
+
+class InstrumentedAsyncCursor(psycopg.AsyncCursor):
+    """
+    psycopg 3 cursor that times and traces execute and executemany.
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_query(time.perf_counter() - started, "async", query, _rowcount(self))
+
+    async def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            record_query(time.perf_counter() - started, "async", query, _rowcount(self))
+
+
+class InstrumentedCursor(extensions.cursor):
+    """
+    psycopg2 cursor that times and traces execute and executemany.
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(time.perf_counter() - started, "sync", query, _rowcount(self))
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(time.perf_counter() - started, "sync", query, _rowcount(self))
+
+
+def route_template(scope) -> str:
+    """
+    Rebuild the route template of a handled request from its path parameters.
+
+    `/api/orders/necessities/7/accept` with path parameters
+    `{"service": "necessities", "order_id": 7}` becomes
+    `/api/orders/{service}/{order_id}/accept`. This works the same whether the
+    framework flattens included routers or nests them.
+    """
+    if "route" not in scope and "endpoint" not in scope:
+        return UNMATCHED_ROUTE
+    path = scope.get("path", "")
+    params = scope.get("path_params") or {}
+    if not params:
+        return path
+    names = {str(value): name for name, value in params.items()}
+    segments = path.split("/")
+    for index, segment in enumerate(segments):
+        name = names.get(segment)
+        if name is not None:
+            segments[index] = "{" + name + "}"
+            continue
+        rest = "/".join(segments[index:])
+        name = names.get(rest)
+        if name is not None and "/" in rest:
+            # A {name:path} parameter swallows the remaining segments.
+            segments[index:] = ["{" + name + "}"]
+            break
+    return "/".join(segments)
+
+
+def server_timing_headers(stats: RequestStats, elapsed: float) -> list:
+    """
+    `Server-Timing` header reporting the DB time spent before the response started.
+    """
+    value = (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_queries} queries", '
+        f'app;dur={elapsed * 1000:.1f}'
+    )
+    return [(b"server-timing", value.encode()), (b"timing-allow-origin", b"*")]
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording per-route request metrics.
+
+    Routes are labelled by their template so path parameters do not create new
+    series; requests that match no route share the "unmatched" label.
+    Server-sent event streams are counted but kept out of the latency
+    histogram, since they stay open for as long as the client listens.
+    Responses carry a `Server-Timing` header with the DB time and query count,
+    and requests slower than SLOW_REQUEST_MS log their statement trace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["method"], scope.get("path"))
+        token = _current_request.set(stats)
+        status = 500
+        streaming = False
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        streaming = True
+                if SERVER_TIMING:
+                    message["headers"] = list(message.get("headers", ())) + server_timing_headers(
+                        stats, time.perf_counter() - started
+                    )
+            await send(message)
+
+        _in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_progress.dec()
+            _current_request.reset(token)
+            method = scope["method"]
+            route = route_template(scope)
+            _requests.inc(method=method, route=route, status=str(status))
+            if status >= 500:
+                _request_errors.inc(method=method, route=route)
+            if not streaming:
+                _request_seconds.observe(elapsed, method=method, route=route)
+            _request_db_queries.observe(stats.db_queries, method=method, route=route)
+            _request_db_seconds.observe(stats.db_seconds, method=method, route=route)
+            if LOG_REQUESTS and not streaming:
+                log_event("REQUEST_COMPLETED", {
+                    "method": method,
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "db_queries": stats.db_queries,
+                    "db_ms": round(stats.db_seconds * 1000, 3),
+                    **({"statements": stats.trace()} if elapsed * 1000 >= SLOW_REQUEST_MS else {}),
+                })
+
+
+class InstrumentedApiClient(ApiClient):
+    """
+    LINE API client that records the latency of every call.
+    """
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = super().call_api(resource_path, method, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            _line_api_seconds.observe(time.perf_counter() - started, endpoint=resource_path, outcome=outcome)
+
+
+class InstrumentedAsyncApiClient(AsyncApiClient):
+    """
+    Async LINE API client that records the latency of every call.
+    """
+
+    async def call_api(self, resource_path, method, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await super().call_api(resource_path, method, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            _line_api_seconds.observe(time.perf_counter() - started, endpoint=resource_path, outcome=outcome)
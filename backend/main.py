@@ -4,23 +4,28 @@ This module is responsible for importing FastAPI and its dependencies.
 import logging
 import os
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from backend.routers import orders, drivers, users, seller, consumer
-from collections import defaultdict
+from backend.routers import orders, drivers, users, seller, consumer, geocoding, matching
+from backend import metrics
+from backend.event_log import configure_logging, shutdown_logging
+from backend.instrumentation import RequestMetricsMiddleware, InstrumentedApiClient
+from backend.images import IMAGE_STORAGE, IMAGE_LOCAL_DIR, IMAGE_PUBLIC_URL, close_image_storage
+from backend.geocoding import geocoder
+from backend.routing import distance_matrix
+from backend.matching import order_dispatcher
 import re
 
-user_states = defaultdict(str)
-
 # Import Line Bot API
 from linebot.v3 import (
-    WebhookHandler
+    WebhookParser
 )
 from linebot.v3.exceptions import (
     InvalidSignatureError
 )
 from linebot.v3.messaging import (
-    ApiClient,
     MessagingApi,
     Configuration,
     TextMessage,
@@ -33,10 +38,14 @@ from linebot.v3.webhooks import (
 
 # Import handlers
 from .handlers.customer_service import handle_customer_service
-from .handlers.send_message import LineMessageService
+from .handlers.send_message import line_user_id_cache
+from .handlers.notification_outbox import notification_dispatcher
+from .handlers.order_events import order_event_broker
+from .handlers.conversation_state import get_conversation_state_store
+from .handlers.webhook_queue import WebhookDispatcher
 
 # Import database connection function
-from backend.database import get_db_connection
+from backend.database import db_connection, close_pool, get_async_pool, close_async_pool
 
 
 
@@ -55,6 +64,8 @@ app.include_router(drivers.router, prefix="/api/drivers", tags=["drivers"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(seller.router, prefix="/api/seller", tags=["seller"])
 app.include_router(consumer.router, prefix="/api/consumer", tags=["consumer"])
+app.include_router(geocoding.router, prefix="/api/geocoding", tags=["geocoding"])
+app.include_router(matching.router, prefix="/api/matching", tags=["matching"])
 
 # Setup CORS
 app.add_middleware(
@@ -63,23 +74,73 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Per-route request, database and latency metrics served on /metrics
+app.add_middleware(RequestMetricsMiddleware)
+
+# Serve uploaded images when they are stored on the local filesystem
+if IMAGE_STORAGE == 'local':
+    os.makedirs(IMAGE_LOCAL_DIR, exist_ok=True)
+    app.mount(IMAGE_PUBLIC_URL, StaticFiles(directory=IMAGE_LOCAL_DIR), name="images")
+
 
 # setup Line Bot API
 configuration = Configuration(
     access_token=line_bot_token
 )
-handler = WebhookHandler(line_bot_secret)
-line_message_service = LineMessageService()
+parser = WebhookParser(line_bot_secret)
 
-logging.basicConfig(level=logging.INFO)
+# Registration dialogue state per LINE user, shared by all workers
+registration_states = get_conversation_state_store()
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_pool():
+    """
+    Open the async connection pool and start the background workers.
+    """
+    await get_async_pool()
+    distance_matrix.load()
+    notification_dispatcher.start()
+    order_event_broker.start()
+    webhook_dispatcher.start()
+    order_dispatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_db_pool():
+    """
+    Close pooled database and HTTP connections when the server stops.
+    """
+    await order_dispatcher.stop()
+    await webhook_dispatcher.stop()
+    await order_event_broker.stop()
+    await notification_dispatcher.stop()
+    await close_image_storage()
+    await geocoder.close()
+    await distance_matrix.close()
+    await close_async_pool()
+    close_pool()
+    shutdown_logging()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose process metrics in the Prometheus text format.
+
+    Returns:
+        str: The metrics exposition body.
+    """
+    return metrics.render()
+
 @app.post("/callback")
 async def callback(request: Request):
     """
     Handle the Line Bot callback request.
+    Verifies the signature and queues the events for the webhook workers.
 
     Parameters:
     - request (Request): The HTTP request object.
@@ -92,12 +153,16 @@ async def callback(request: Request):
     body = (await request.body()).decode('utf-8')
     logger.info("Request body: %s", body)
     try:
-        handler.handle(body, signature)
+        events = parser.parse(body, signature)
     except InvalidSignatureError:
         logger.error("Invalid signature")
         raise HTTPException(status_code=400, detail="Invalid signature")
+
+    # Events are handled by the webhook workers; acknowledge LINE right away
+    try:
+        await webhook_dispatcher.submit(events)
     except Exception as e:
-        logger.exception("Unhandled exception occurred during webhook handling")
+        logger.exception("Unhandled exception occurred while queueing webhook events")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
     return 'OK'
@@ -112,7 +177,17 @@ def handle_invalid_signature_error():
     raise HTTPException(status_code=400, detail="Invalid signature")
 
 
-@handler.add(MessageEvent, message=TextMessageContent)
+def process_event(event):
+    """
+    Route one webhook event to its handler. Runs in a webhook worker thread.
+
+    Parameters:
+    - event: A parsed webhook event.
+    """
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+        handle_message(event)
+
+
 def handle_message(event):
     """
     Handles incoming messages from users and routes them 
@@ -128,12 +203,12 @@ def handle_message(event):
     line_user_id = event.source.user_id
     logger.info("Message from LINE user: %s, content: %s", line_user_id, user_message)
 
-    with ApiClient(configuration) as api_client:
+    with InstrumentedApiClient(configuration) as api_client:
         line_bot_api = MessagingApi(api_client)
 
         if user_message == "註冊":
             # Check if user is already registered
-            with get_db_connection() as conn:
+            with db_connection() as conn:
                 cur = conn.cursor()
                 cur.execute("SELECT id FROM users WHERE line_user_id = %s", (line_user_id,))
                 existing_binding = cur.fetchone()
@@ -147,7 +222,7 @@ def handle_message(event):
                     )
                     return
                 
-            user_states[line_user_id] = "waiting_for_name"
+            registration_states.set(line_user_id, {"step": "waiting_for_name"})
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
@@ -158,11 +233,12 @@ def handle_message(event):
             )
             return
 
+        state = registration_states.get(line_user_id) or {}
+        step = state.get("step")
+
         if user_message.lower() == "取消":
-            if line_user_id in user_states:
-                del user_states[line_user_id]
-            if f"{line_user_id}_name" in user_states:
-                del user_states[f"{line_user_id}_name"]
+            if state:
+                registration_states.clear(line_user_id)
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
@@ -172,7 +248,7 @@ def handle_message(event):
             return
 
         # Deal with name input
-        if user_states.get(line_user_id) == "waiting_for_name":
+        if step == "waiting_for_name":
             name = user_message.strip()
             # Check if name is valid
             if not re.match(r'^[\u4e00-\u9fa5A-Za-z]+$', name):
@@ -187,8 +263,7 @@ def handle_message(event):
                 return
             
             # Save name and prompt for phone number
-            user_states[f"{line_user_id}_name"] = name
-            user_states[line_user_id] = "waiting_for_phone"
+            registration_states.set(line_user_id, {"step": "waiting_for_phone", "name": name})
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
@@ -200,11 +275,9 @@ def handle_message(event):
             return
 
         if user_message == "重新輸入":
-            if user_states.get(line_user_id) == "waiting_for_phone":
+            if step == "waiting_for_phone":
                 # Back to waiting for name
-                user_states[line_user_id] = "waiting_for_name"
-                if f"{line_user_id}_name" in user_states:
-                    del user_states[f"{line_user_id}_name"]
+                registration_states.set(line_user_id, {"step": "waiting_for_name"})
                 line_bot_api.reply_message(
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
@@ -212,7 +285,7 @@ def handle_message(event):
                     )
                 )
                 return
-            elif user_states.get(line_user_id) == "waiting_for_name":
+            elif step == "waiting_for_name":
                 line_bot_api.reply_message(
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
@@ -222,10 +295,10 @@ def handle_message(event):
                 return
 
         # Deal with phone number input
-        if user_states.get(line_user_id) == "waiting_for_phone":
+        if step == "waiting_for_phone":
             try:
                 phone = user_message.strip()
-                name = user_states.get(f"{line_user_id}_name")
+                name = state.get("name")
                 
                 if not phone.isdigit() or not (7 <= len(phone) <= 10):
                     line_bot_api.reply_message(
@@ -239,7 +312,7 @@ def handle_message(event):
                     return
 
                 # Check if phone number is already registered
-                with get_db_connection() as conn:
+                with db_connection() as conn:
                     cur = conn.cursor()
                     cur.execute("SELECT id FROM users WHERE phone = %s", (phone,))
                     existing_user = cur.fetchone()
@@ -260,7 +333,9 @@ def handle_message(event):
                         "INSERT INTO users (name, phone, location, is_driver, line_user_id) VALUES (%s, %s, %s, %s, %s) RETURNING id",
                         (name, phone, '未選擇', False, line_user_id)
                     )
+                    new_user_id = cur.fetchone()[0]
                     conn.commit()
+                    line_user_id_cache.invalidate(new_user_id)
                     
                     line_bot_api.reply_message(
                         ReplyMessageRequest(
@@ -272,8 +347,7 @@ def handle_message(event):
                     )
                 
                 # Clear user states
-                del user_states[line_user_id]
-                del user_states[f"{line_user_id}_name"]
+                registration_states.clear(line_user_id)
                 
             except Exception as e:
                 logger.error("Error during registration: %s", str(e))
@@ -287,10 +361,7 @@ def handle_message(event):
                 )
                 
                 # Clear user states
-                if line_user_id in user_states:
-                    del user_states[line_user_id]
-                if f"{line_user_id}_name" in user_states:
-                    del user_states[f"{line_user_id}_name"]
+                registration_states.clear(line_user_id)
             return
 
         elif user_message in ["客服", "詢問客服", "詢問"]:
@@ -303,6 +374,9 @@ def handle_message(event):
                 )
             )
 
+# Handles queued webhook events; started and stopped with the app
+webhook_dispatcher = WebhookDispatcher(process_event)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8001, reload=True)
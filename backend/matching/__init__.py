@@ -0,0 +1,11 @@
+"""
+Matching of unaccepted orders to drivers' announced time slots (`driver_time`).
+
+`index` keeps the slots in memory by start time and route, `service` ranks
+the drivers whose slots fit an order's time window and pass near its pickup
+and drop-off, and `dispatcher` periodically assigns all of them across
+drivers at once.
+"""
+from backend.matching.index import DriverInfo, Slot, SlotIndex
+from backend.matching.service import DriverMatchingService, driver_matching, slot_from_row
+from backend.matching.dispatcher import OrderDispatcher, assign_orders, order_dispatcher
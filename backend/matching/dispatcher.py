@@ -0,0 +1,464 @@
+"""
+Periodic batch dispatch of unaccepted ('未接單') orders to drivers.
+
+Every DISPATCH_INTERVAL seconds the dispatcher ranks drivers for all pending
+orders (see `DriverMatchingService.candidates`: time slot and detour) and
+solves one assignment across all of them. Each driver takes at most
+DISPATCH_DRIVER_CAPACITY orders including the ones they are already
+delivering, urgent orders are served first and, among the rest, the order
+that would lose the most by not getting its best driver (regret) goes
+first. DISPATCH_MODE decides what happens with the result:
+
+- `off` (default): the dispatcher does not run; POST /api/matching/dispatch
+  can still plan on demand.
+- `propose`: the assignment is recorded in `driver_orders` with action
+  '推薦' and drivers are told about their new proposals; they accept them
+  through the usual accept endpoint.
+- `assign`: orders are accepted on the drivers' behalf, exactly as the
+  accept endpoint would, and buyers and drivers are notified.
+
+All notifications of a run go into the outbox in one batch and are sent
+by the notification dispatcher after the transaction commits. A
+transaction-level advisory lock keeps concurrent workers from dispatching
+the same orders twice.
+"""
+import asyncio
+import datetime as dt
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import List
+import numpy as np
+from backend import metrics
+from backend.database import async_db_connection
+from backend.event_log import event_logger
+from backend.geocoding import geocoder
+from backend.handlers.notification_outbox import enqueue_notifications, notification_dispatcher
+from backend.handlers.order_events import publish_order_event
+from backend.matching.service import driver_matching
+from backend.routing import distance_matrix
+
+logger = logging.getLogger(__name__)
+log_event = event_logger("orders")
+
+DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'off')
+DISPATCH_INTERVAL = float(os.getenv('DISPATCH_INTERVAL', 60))
+DISPATCH_DRIVER_CAPACITY = int(os.getenv('DISPATCH_DRIVER_CAPACITY', 5))
+DISPATCH_MAX_ORDERS = int(os.getenv('DISPATCH_MAX_ORDERS', 5000))
+# Score (meters) an order loses by getting no driver; caps the regret of orders with one option.
+DISPATCH_UNASSIGNED_PENALTY = float(os.getenv('DISPATCH_UNASSIGNED_PENALTY', 30000))
+DISPATCH_MODES = ("propose", "assign")
+
+PROPOSED = '推薦'
+ACCEPTED = '接單'
+# Orders listed in one driver message.
+_MESSAGE_LINES = 20
+
+_runs = metrics.counter("dispatch_runs_total", "Dispatcher runs by mode and result.", ["mode", "result"])
+_orders = metrics.counter("dispatch_orders_total", "Pending orders seen by the dispatcher, by outcome.", ["outcome"])
+_run_seconds = metrics.histogram("dispatch_run_seconds", "Duration of dispatcher runs.", ["mode"])
+
+LOCK_QUERY = "SELECT pg_try_advisory_xact_lock(hashtext('order_dispatch'))"
+
+# Orders each driver is delivering right now.
+ACTIVE_LOAD_QUERY = """
+    SELECT dro.driver_id, COUNT(*)
+    FROM driver_orders dro
+    LEFT JOIN orders o ON dro.service = 'necessities' AND o.id = dro.order_id
+    LEFT JOIN agricultural_product_order a ON dro.service = 'agricultural_product' AND a.id = dro.order_id
+    WHERE dro.action = '接單' AND COALESCE(o.order_status, a.status) = '接單'
+    GROUP BY dro.driver_id
+"""
+
+
+def assign_orders(costs: np.ndarray, capacity: np.ndarray, urgent: np.ndarray,
+                  penalty: float = DISPATCH_UNASSIGNED_PENALTY) -> np.ndarray:
+    """
+    Capacitated assignment of orders to drivers by regret.
+
+    Repeatedly assigns the open order with the highest priority (urgent
+    first, then the largest gap between its best and second-best driver,
+    at most `penalty`) to its best driver with capacity left. Without the
+    cap, orders only one far-away driver can serve would use up capacity
+    first whenever there are more orders than drivers can take. Best and
+    second-best are only recomputed for the orders whose choices a full
+    driver invalidated, so a run is O(n) array work per order.
+
+    Args:
+        costs (np.ndarray): (orders, drivers) cost, np.inf where a driver cannot take the order.
+        capacity (np.ndarray): Orders each driver can still take.
+        urgent (np.ndarray): Whether each order is urgent.
+        penalty (float): Cost of leaving an order unassigned.
+
+    Returns:
+        np.ndarray: The driver column of each order, -1 if unassigned.
+    """
+    n, m = costs.shape
+    result = np.full(n, -1, dtype=np.intp)
+    if n == 0 or m == 0:
+        return result
+    cost = np.array(costs, dtype=np.float64)
+    remaining = np.array(capacity, dtype=np.intp)
+    cost[:, remaining <= 0] = np.inf
+    open_orders = np.ones(n, dtype=bool)
+    best = np.zeros(n, dtype=np.intp)
+    second = np.zeros(n, dtype=np.intp)
+    first_cost = np.full(n, np.inf)
+    second_cost = np.full(n, np.inf)
+
+    def rank(rows):
+        sub = cost[rows]
+        if m == 1:
+            best[rows], first_cost[rows] = 0, sub[:, 0]
+            second[rows], second_cost[rows] = 0, np.inf
+            return
+        two = np.argpartition(sub, 1, axis=1)[:, :2]
+        values = np.take_along_axis(sub, two, axis=1)
+        swap = values[:, 0] > values[:, 1]
+        two[swap] = two[swap][:, ::-1]
+        values[swap] = values[swap][:, ::-1]
+        best[rows], second[rows] = two[:, 0], two[:, 1]
+        first_cost[rows], second_cost[rows] = values[:, 0], values[:, 1]
+
+    rank(np.arange(n))
+    urgency = np.where(np.asarray(urgent, dtype=bool), penalty + 1, 0.0)
+    while True:
+        feasible = open_orders & np.isfinite(first_cost)
+        if not feasible.any():
+            break
+        with np.errstate(invalid="ignore"):
+            regret = np.minimum(second_cost - first_cost, penalty)
+        priority = np.where(feasible, urgency + regret, -np.inf)
+        i = int(np.argmax(priority))
+        j = int(best[i])
+        result[i] = j
+        open_orders[i] = False
+        first_cost[i] = np.inf
+        remaining[j] -= 1
+        if remaining[j] == 0:
+            cost[:, j] = np.inf
+            stale = np.flatnonzero(open_orders & ((best == j) | (second == j)))
+            if len(stale):
+                rank(stale)
+    return result
+
+
+class OrderDispatcher:
+    """
+    Background worker that plans and applies batch dispatches.
+
+    Args:
+        mode (str): 'off', 'propose' or 'assign'.
+        interval (float): Seconds between runs.
+    """
+
+    def __init__(self, mode: str = DISPATCH_MODE, interval: float = DISPATCH_INTERVAL):
+        self.mode = mode
+        self.interval = interval
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """
+        Start periodic runs on the running event loop, unless the mode is off.
+        """
+        if self.mode not in DISPATCH_MODES:
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the background worker.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """
+        Ask the worker to run now instead of waiting for the next interval.
+        """
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once(self.mode)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error dispatching orders")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def plan(self, conn, orders: List[dict]) -> List[dict]:
+        """
+        Choose a driver slot for as many orders as possible.
+
+        Args:
+            conn (Connection): The database connection.
+            orders (list): Orders from `DriverMatchingService.pending_orders`.
+
+        Returns:
+            list: One {order, candidate} entry per assigned order.
+        """
+        cur = conn.cursor()
+        try:
+            await cur.execute(ACTIVE_LOAD_QUERY)
+            load = dict(await cur.fetchall())
+        finally:
+            await cur.close()
+
+        now = dt.datetime.now()
+        drivers, costs, slots = driver_matching.cost_matrix(orders, now)
+        capacity = np.array([DISPATCH_DRIVER_CAPACITY - load.get(driver_id, 0) for driver_id in drivers])
+        urgent = np.array([order["is_urgent"] for order in orders], dtype=bool)
+
+        chosen = assign_orders(costs, capacity, urgent)
+        plan = []
+        for row in np.flatnonzero(chosen >= 0):
+            order = orders[row]
+            candidate = driver_matching.candidate_for(order, int(slots[row, chosen[row]]), now)
+            plan.append({"order": order, "candidate": candidate})
+        return plan
+
+    async def run_once(self, mode: str, dry_run: bool = False) -> dict:
+        """
+        Plan one dispatch over all pending orders and apply it.
+
+        Args:
+            mode (str): 'propose' or 'assign'.
+            dry_run (bool): Only plan; nothing is written or sent.
+
+        Returns:
+            dict: Counts of the run and the planned assignments.
+        """
+        if mode not in DISPATCH_MODES:
+            raise ValueError(f"Unknown dispatch mode: {mode}")
+        started = time.perf_counter()
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(LOCK_QUERY)
+                if not (await cur.fetchone())[0]:
+                    _runs.inc(mode=mode, result="locked")
+                    return {"mode": mode, "dry_run": dry_run, "skipped": True}
+                await driver_matching.refresh(conn)
+                await distance_matrix.refresh(conn)
+                orders = await driver_matching.pending_orders(conn, None, DISPATCH_MAX_ORDERS)
+                geocoder.prefetch(place for order in orders for place in [order["location"], *order["pickups"]]
+                                  if place not in distance_matrix)
+                plan = await self.plan(conn, orders)
+
+                applied, notified = plan, 0
+                if not dry_run and mode == "assign":
+                    applied, notified = await self._assign(cur, plan)
+                elif not dry_run:
+                    applied, notified = await self._propose(cur, plan)
+                if dry_run:
+                    await conn.rollback()
+                else:
+                    await conn.commit()
+            except Exception:
+                await conn.rollback()
+                _runs.inc(mode=mode, result="error")
+                raise
+            finally:
+                await cur.close()
+
+        if notified:
+            notification_dispatcher.wake()
+        seconds = time.perf_counter() - started
+        _run_seconds.observe(seconds, mode=mode)
+        _runs.inc(mode=mode, result="dry_run" if dry_run else "applied")
+        _orders.inc(len(applied), outcome="dry_run" if dry_run else ("assigned" if mode == "assign" else "proposed"))
+        _orders.inc(len(orders) - len(plan), outcome="unassigned")
+        summary = {
+            "mode": mode,
+            "dry_run": dry_run,
+            "skipped": False,
+            "pending_orders": len(orders),
+            "assigned": len(applied),
+            "unassigned": len(orders) - len(plan),
+            "drivers_notified": notified,
+            "seconds": round(seconds, 3),
+        }
+        log_event("DISPATCH_COMPLETED", summary)
+        summary["assignments"] = [
+            {
+                "order_id": entry["order"]["id"],
+                "service": entry["order"]["service"],
+                "driver_id": entry["candidate"]["driver_id"],
+                "time_slot_id": entry["candidate"]["time_slot_id"],
+                "detour_m": entry["candidate"]["detour_m"],
+                "score": entry["candidate"]["score"],
+            }
+            for entry in applied
+        ]
+        return summary
+
+    async def _propose(self, cur, plan: List[dict]):
+        """
+        Replace the previous proposals with the plan and tell drivers about new ones.
+        Nothing is written when the proposals did not change, so an idle
+        dispatcher does not move the `orders` version behind the list ETags.
+
+        Returns:
+            tuple: (the proposals standing after the run, number of drivers notified)
+        """
+        await cur.execute("SELECT id, driver_id, order_id, service FROM driver_orders WHERE action = %s", (PROPOSED,))
+        existing = {(driver_id, order_id, service): row_id for row_id, driver_id, order_id, service in await cur.fetchall()}
+        planned = {(entry["candidate"]["driver_id"], entry["order"]["id"], entry["order"]["service"]): entry
+                   for entry in plan}
+
+        stale = [row_id for key, row_id in existing.items() if key not in planned]
+        if stale:
+            await cur.execute("DELETE FROM driver_orders WHERE id = ANY(%s)", (stale,))
+
+        added = {key: entry for key, entry in planned.items() if key not in existing}
+        if added:
+            # Orders accepted since they were read get no proposal; the share
+            # lock makes a concurrent accept wait and then delete ours.
+            pending = await self._lock_pending(cur, list(added.values()))
+            added = {key: entry for key, entry in added.items() if (key[2], key[1]) in pending}
+        if added:
+            await cur.execute(
+                """
+                INSERT INTO driver_orders (driver_id, order_id, action, service)
+                SELECT plan.driver_id, plan.order_id, %s, plan.service
+                FROM unnest(%s::int[], %s::int[], %s::text[]) AS plan(driver_id, order_id, service)
+                """,
+                (PROPOSED, [key[0] for key in added], [key[1] for key in added], [key[2] for key in added])
+            )
+        notifications = self._driver_messages(list(added.values()), "有 {count} 筆訂單順路，歡迎接單🚚")
+        await enqueue_notifications(cur, notifications)
+        standing = [entry for key, entry in planned.items() if key in existing or key in added]
+        return standing, len(notifications)
+
+    @staticmethod
+    async def _lock_pending(cur, entries: List[dict]) -> set:
+        """
+        Share-lock the orders of the entries that are still unaccepted.
+
+        Returns:
+            set: (service, order ID) of those orders.
+        """
+        pending = set()
+        tables = {"necessities": ("orders", "order_status"), "agricultural_product": ("agricultural_product_order", "status")}
+        for service, (table, status) in tables.items():
+            ids = [entry["order"]["id"] for entry in entries if entry["order"]["service"] == service]
+            if ids:
+                await cur.execute(
+                    f"SELECT id FROM {table} WHERE id = ANY(%s) AND {status} = '未接單' FOR SHARE", (ids,))
+                pending.update((service, row[0]) for row in await cur.fetchall())
+        return pending
+
+    async def _assign(self, cur, plan: List[dict]):
+        """
+        Accept the planned orders on the drivers' behalf. Orders another driver
+        accepted since they were read are skipped.
+
+        Returns:
+            tuple: (the assignments applied, number of drivers notified)
+        """
+        by_service = defaultdict(list)
+        for entry in plan:
+            by_service[entry["order"]["service"]].append(entry["order"]["id"])
+        taken = set()
+        if by_service["necessities"]:
+            await cur.execute(
+                "UPDATE orders SET order_status = %s WHERE id = ANY(%s) AND order_status = '未接單' RETURNING id",
+                (ACCEPTED, by_service["necessities"])
+            )
+            taken.update(("necessities", row[0]) for row in await cur.fetchall())
+        if by_service["agricultural_product"]:
+            await cur.execute(
+                "UPDATE agricultural_product_order SET status = %s WHERE id = ANY(%s) AND status = '未接單' RETURNING id",
+                (ACCEPTED, by_service["agricultural_product"])
+            )
+            taken.update(("agricultural_product", row[0]) for row in await cur.fetchall())
+        applied = [entry for entry in plan if (entry["order"]["service"], entry["order"]["id"]) in taken]
+        if not applied:
+            return applied, 0
+
+        driver_ids = [entry["candidate"]["driver_id"] for entry in applied]
+        order_ids = [entry["order"]["id"] for entry in applied]
+        services = [entry["order"]["service"] for entry in applied]
+        await cur.execute(
+            """
+            DELETE FROM driver_orders
+            WHERE action = %s AND (order_id, service) IN (SELECT * FROM unnest(%s::int[], %s::text[]))
+            """,
+            (PROPOSED, order_ids, services)
+        )
+        await cur.execute(
+            """
+            INSERT INTO driver_orders (driver_id, order_id, action, service)
+            SELECT plan.driver_id, plan.order_id, %s, plan.service
+            FROM unnest(%s::int[], %s::int[], %s::text[]) AS plan(driver_id, order_id, service)
+            """,
+            (ACCEPTED, driver_ids, order_ids, services)
+        )
+        for entry in applied:
+            await publish_order_event(cur, "accepted", entry["order"]["service"], entry["order"]["id"],
+                                      driver_id=entry["candidate"]["driver_id"])
+
+        await cur.execute(
+            """
+            SELECT 'necessities', id, buyer_id FROM orders WHERE id = ANY(%s)
+            UNION ALL
+            SELECT 'agricultural_product', id, buyer_id FROM agricultural_product_order WHERE id = ANY(%s)
+            """,
+            (by_service["necessities"], by_service["agricultural_product"])
+        )
+        buyers = {(service, order_id): buyer_id for service, order_id, buyer_id in await cur.fetchall()}
+        notifications = [
+            (buyers[(entry["order"]["service"], entry["order"]["id"])],
+             "司機已接取您的訂單，請等待司機送貨👍🏻\n\n"
+             f"📦 訂單明細 #{entry['order']['id']}\n"
+             f"📍 送貨地點：{entry['order']['location']}\n"
+             f"📱 司機電話：{entry['candidate']['driver_phone'] or '無'}")
+            for entry in applied if (entry["order"]["service"], entry["order"]["id"]) in buyers
+        ]
+        driver_notifications = self._driver_messages(applied, "系統已為您安排 {count} 筆訂單🚚")
+        await enqueue_notifications(cur, notifications + driver_notifications)
+        return applied, len(driver_notifications)
+
+    @staticmethod
+    def _driver_messages(entries: List[dict], title: str):
+        """
+        One message per driver listing their orders.
+
+        Returns:
+            list: (user_id, message) pairs for drivers with a user account.
+        """
+        by_driver = defaultdict(list)
+        for entry in entries:
+            by_driver[entry["candidate"]["driver_id"]].append(entry)
+        messages = []
+        for driver_id, driver_entries in by_driver.items():
+            driver = driver_matching.index.drivers.get(driver_id)
+            if driver is None or driver.user_id is None:
+                continue
+            message = title.format(count=len(driver_entries)) + "\n"
+            for entry in driver_entries[:_MESSAGE_LINES]:
+                order, candidate = entry["order"], entry["candidate"]
+                pickups = "、".join(order["pickups"]) or order["location"]
+                message += (f"\n・#{order['id']} {pickups} → {order['location']}"
+                            f"（{candidate['date']} {candidate['start_time'][:5]}）")
+            if len(driver_entries) > _MESSAGE_LINES:
+                message += f"\n…等共 {len(driver_entries)} 筆"
+            messages.append((driver.user_id, message))
+        return messages
+
+
+order_dispatcher = OrderDispatcher()
@@ -0,0 +1,145 @@
+"""
+In-memory index of driver availability (`driver_time` rows).
+
+Slots are bucketed by date and kept sorted by start time, so the slots
+starting in a time window are found by bisection, and grouped by route
+(the driver's home place to the slot's `locations`), so the detour of an
+order is computed once per distinct route rather than once per slot.
+"""
+import bisect
+import datetime as dt
+from collections import defaultdict
+from typing import Dict, Iterator, NamedTuple, Optional, Set, Tuple
+from backend.geocoding import normalize_place
+
+
+class DriverInfo(NamedTuple):
+    driver_id: int
+    user_id: Optional[int]
+    name: str
+    phone: str
+    home: Optional[str]  # users.location of the driver, where their trips start
+
+
+class Slot(NamedTuple):
+    id: int
+    driver_id: int
+    starts_at: dt.datetime
+    location: str
+
+
+def _route_key(home: Optional[str], location: str) -> Tuple[str, str]:
+    """
+    Route of a slot; without a known home the trip starts at the slot place itself.
+    """
+    destination = normalize_place(location)
+    origin = normalize_place(home) if home and home != '未選擇' else destination
+    return origin, destination
+
+
+class SlotIndex:
+    """
+    Driver time slots indexed by start time and by route.
+    """
+
+    def __init__(self):
+        self.slots: Dict[int, Slot] = {}
+        self.drivers: Dict[int, DriverInfo] = {}
+        self._by_date: Dict[dt.date, list] = defaultdict(list)  # sorted (starts_at, slot id)
+        self._by_route: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+        self._route_of: Dict[int, Tuple[str, str]] = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, slot: Slot, driver: Optional[DriverInfo] = None):
+        """
+        Insert or replace a slot. A changed driver home re-routes all of the driver's slots.
+        """
+        if driver is not None:
+            previous = self.drivers.get(driver.driver_id)
+            self.drivers[driver.driver_id] = driver
+            if previous is not None and previous.home != driver.home:
+                self._reindex_driver(driver.driver_id)
+        if slot.id in self.slots:
+            if self.slots[slot.id] == slot:
+                return
+            self.remove(slot.id)
+        self.slots[slot.id] = slot
+        bisect.insort(self._by_date[slot.starts_at.date()], (slot.starts_at, slot.id))
+        self._index_route(slot)
+
+    def remove(self, slot_id: int) -> bool:
+        """
+        Drop a slot; returns whether it was indexed.
+        """
+        slot = self.slots.pop(slot_id, None)
+        if slot is None:
+            return False
+        day = self._by_date[slot.starts_at.date()]
+        i = bisect.bisect_left(day, (slot.starts_at, slot_id))
+        if i < len(day) and day[i] == (slot.starts_at, slot_id):
+            del day[i]
+        if not day:
+            del self._by_date[slot.starts_at.date()]
+        self._unindex_route(slot_id)
+        return True
+
+    def set_home(self, user_id: int, home: Optional[str]) -> bool:
+        """
+        Move the trip start of every slot of the driver with this user ID.
+        Returns whether the user is a known driver.
+        """
+        driver = next((d for d in self.drivers.values() if d.user_id == user_id), None)
+        if driver is None:
+            return False
+        self.drivers[driver.driver_id] = driver._replace(home=home)
+        self._reindex_driver(driver.driver_id)
+        return True
+
+    def _reindex_driver(self, driver_id: int):
+        for slot in self.slots.values():
+            if slot.driver_id == driver_id:
+                self._unindex_route(slot.id)
+                self._index_route(slot)
+
+    def _index_route(self, slot: Slot):
+        driver = self.drivers.get(slot.driver_id)
+        key = _route_key(driver.home if driver else None, slot.location)
+        self._route_of[slot.id] = key
+        self._by_route[key].add(slot.id)
+
+    def _unindex_route(self, slot_id: int):
+        key = self._route_of.pop(slot_id, None)
+        if key is not None:
+            self._by_route[key].discard(slot_id)
+            if not self._by_route[key]:
+                del self._by_route[key]
+
+    def starting_between(self, start: dt.datetime, end: dt.datetime) -> Iterator[Slot]:
+        """
+        Slots starting in [start, end], in start order.
+        """
+        day = start.date()
+        while day <= end.date():
+            entries = self._by_date.get(day)
+            if entries:
+                i = bisect.bisect_left(entries, (start, -1))
+                while i < len(entries) and entries[i][0] <= end:
+                    yield self.slots[entries[i][1]]
+                    i += 1
+            day += dt.timedelta(days=1)
+
+    def route_of(self, slot_id: int) -> Tuple[str, str]:
+        return self._route_of[slot_id]
+
+    def routes(self) -> Dict[Tuple[str, str], Set[int]]:
+        return self._by_route
+
+    def prune(self, before: dt.date):
+        """
+        Forget slots on days before `before`.
+        """
+        for day in [day for day in self._by_date if day < before]:
+            for _, slot_id in list(self._by_date[day]):
+                self.remove(slot_id)
@@ -0,0 +1,324 @@
+"""
+Ranked driver candidates for orders that no driver has accepted yet.
+
+A driver is a candidate for an order when one of their `driver_time` slots
+starts within the order's time window and the slot's route (from the
+driver's home place to the slot's `locations`) passes near the order: the
+extra distance of picking the goods up and dropping them off on the way is
+at most DRIVER_MATCH_MAX_DETOUR_M. Candidates are ranked by detour plus
+DRIVER_MATCH_WAIT_WEIGHT meters per hour the order waits for the slot.
+
+The slot index is updated in place by the driver time endpoints of this
+process. Other workers' changes bump the `drivers` resource version; at
+most every DRIVER_MATCH_REFRESH seconds the version is checked and, when it
+moved, the upcoming slots are read and diffed into the index.
+"""
+import asyncio
+import datetime as dt
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from backend import metrics
+from backend.geocoding import geocoder
+from backend.matching.index import DriverInfo, Slot, SlotIndex
+from backend.routing import distance_matrix
+
+logger = logging.getLogger(__name__)
+
+DRIVER_MATCH_REFRESH = float(os.getenv('DRIVER_MATCH_REFRESH', 10))
+DRIVER_MATCH_MAX_DETOUR_M = float(os.getenv('DRIVER_MATCH_MAX_DETOUR_M', 15000))
+DRIVER_MATCH_WAIT_WEIGHT = float(os.getenv('DRIVER_MATCH_WAIT_WEIGHT', 2000))
+DRIVER_MATCH_HORIZON_HOURS = float(os.getenv('DRIVER_MATCH_HORIZON_HOURS', 72))
+DRIVER_MATCH_URGENT_HOURS = float(os.getenv('DRIVER_MATCH_URGENT_HOURS', 24))
+# driver_time only records a start; a slot counts as available this long after it.
+DRIVER_SLOT_HOURS = float(os.getenv('DRIVER_SLOT_HOURS', 4))
+
+VERSION_QUERY = "SELECT version FROM resource_versions WHERE resource = 'drivers'"
+
+SLOTS_QUERY = """
+    SELECT dt.id, dt.driver_id, dt.date, dt.start_time, dt.locations,
+        d.user_id, d.driver_name, d.driver_phone, u.location
+    FROM driver_time dt
+    JOIN drivers d ON d.id = dt.driver_id
+    LEFT JOIN users u ON u.id = d.user_id
+    WHERE dt.date >= %s
+"""
+
+# Unaccepted orders of both services with their pickup places; necessities
+# orders are ready at their date and time, agricultural orders when placed.
+UNACCEPTED_ORDERS_QUERY = """
+    SELECT * FROM (
+        SELECT 'necessities' AS service, o.id, o.location, o.is_urgent, o.date + o.time AS ready_at,
+            ARRAY(SELECT DISTINCT oi.location FROM order_items oi
+                  WHERE oi.order_id = o.id AND oi.location IS NOT NULL) AS pickups
+        FROM orders o
+        WHERE o.order_status = '未接單'
+        UNION ALL
+        SELECT 'agricultural_product', a.id, a.end_point, FALSE, a.timestamp, ARRAY[a.starting_point]
+        FROM agricultural_product_order a
+        WHERE a.status = '未接單'
+    ) AS pending
+    WHERE %(ids)s::text[] IS NULL OR service || ':' || id = ANY(%(ids)s::text[])
+    ORDER BY is_urgent DESC, ready_at
+    LIMIT %(limit)s
+"""
+
+_matches = metrics.histogram(
+    "driver_match_candidates", "Driver candidates found per order.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50))
+
+
+def slot_from_row(row) -> Tuple[Slot, DriverInfo]:
+    slot_id, driver_id, date, start_time, location, user_id, name, phone, home = row
+    starts_at = dt.datetime.combine(date, start_time or dt.time())
+    return Slot(slot_id, driver_id, starts_at, location or ""), DriverInfo(driver_id, user_id, name, phone, home)
+
+
+class DriverMatchingService:
+    """
+    Keeps the slot index current and ranks drivers for orders.
+    """
+
+    def __init__(self):
+        self.index = SlotIndex()
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def add_slot(self, slot: Slot, driver: DriverInfo):
+        self.index.add(slot, driver)
+
+    def remove_slot(self, slot_id: int):
+        self.index.remove(slot_id)
+
+    def set_home(self, user_id: int, home: Optional[str]):
+        self.index.set_home(user_id, home)
+
+    async def refresh(self, conn, force: bool = False):
+        """
+        Reconcile the index with `driver_time` if another worker changed it.
+
+        Args:
+            conn (Connection): The database connection.
+            force (bool): Read the slots regardless of the interval and version.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < DRIVER_MATCH_REFRESH:
+            return
+        async with self._lock:
+            if not force and now - self._checked_at < DRIVER_MATCH_REFRESH:
+                return
+            self._checked_at = now
+            today = dt.date.today()
+            cur = conn.cursor()
+            try:
+                await cur.execute(VERSION_QUERY)
+                row = await cur.fetchone()
+                version = row[0] if row else None
+                if version == self._version and not force:
+                    return
+                await cur.execute(SLOTS_QUERY, (today,))
+                rows = await cur.fetchall()
+            finally:
+                await cur.close()
+            self._version = version
+            seen = set()
+            for row in rows:
+                slot, driver = slot_from_row(row)
+                self.index.add(slot, driver)
+                seen.add(slot.id)
+            for slot_id in [slot_id for slot_id in self.index.slots if slot_id not in seen]:
+                self.index.remove(slot_id)
+            self.index.prune(today)
+            places = {driver.home for driver in self.index.drivers.values() if driver.home}
+            places.update(slot.location for slot in self.index.slots.values())
+            geocoder.prefetch(place for place in places if place not in distance_matrix)
+
+    async def pending_orders(self, conn, refs: Optional[Iterable[Tuple[str, int]]] = None, limit: int = 500) -> List[dict]:
+        """
+        Unaccepted orders of both services, urgent and oldest first.
+
+        Args:
+            conn (Connection): The database connection.
+            refs (list): (service, order ID) pairs to restrict to.
+            limit (int): Maximum number of orders.
+        """
+        ids = [f"{service}:{order_id}" for service, order_id in refs] if refs is not None else None
+        cur = conn.cursor()
+        try:
+            await cur.execute(UNACCEPTED_ORDERS_QUERY, {"ids": ids, "limit": limit})
+            rows = await cur.fetchall()
+        finally:
+            await cur.close()
+        return [
+            {"service": row[0], "id": row[1], "location": row[2], "is_urgent": row[3],
+             "ready_at": row[4], "pickups": list(row[5] or [])}
+            for row in rows
+        ]
+
+    def candidates(self, order: dict, limit: int = 5, now: Optional[dt.datetime] = None) -> List[dict]:
+        """
+        Ranked driver slots for one order.
+
+        Args:
+            order (dict): An order from `pending_orders`.
+            limit (int): Maximum number of candidates; one per driver.
+            now (datetime): The current time.
+
+        Returns:
+            list: Candidates, best first, with detour in meters and wait in minutes.
+        """
+        now = now or dt.datetime.now()
+        ready = max(now, order["ready_at"] or now)
+        horizon = DRIVER_MATCH_URGENT_HOURS if order["is_urgent"] else DRIVER_MATCH_HORIZON_HOURS
+        slots = list(self.index.starting_between(
+            ready - dt.timedelta(hours=DRIVER_SLOT_HOURS), ready + dt.timedelta(hours=horizon)))
+        if not slots:
+            return []
+
+        pickup = self.pickup_of(order)
+        routes = defaultdict(list)
+        for slot in slots:
+            routes[self.index.route_of(slot.id)].append(slot)
+        keys = list(routes)
+        detours = distance_matrix.detours([k[0] for k in keys], [k[1] for k in keys], pickup, order["location"])
+
+        best: Dict[int, dict] = {}
+        for key, detour in zip(keys, detours):
+            if np.isnan(detour) or detour > DRIVER_MATCH_MAX_DETOUR_M:
+                continue
+            for slot in routes[key]:
+                wait_hours = max(0.0, (slot.starts_at - ready).total_seconds() / 3600)
+                score = float(detour) + DRIVER_MATCH_WAIT_WEIGHT * wait_hours
+                current = best.get(slot.driver_id)
+                if current is None or score < current["score"]:
+                    best[slot.driver_id] = self._candidate(slot, float(detour), wait_hours, score)
+        ranked = sorted(best.values(), key=lambda c: c["score"])[:limit]
+        _matches.observe(len(ranked))
+        return ranked
+
+    def cost_matrix(self, orders: List[dict], now: Optional[dt.datetime] = None, chunk: int = 500):
+        """
+        The score of every driver for every order, as `candidates` ranks
+        them, computed with array operations over all slots at once.
+
+        Args:
+            orders (list): Orders from `pending_orders`.
+            now (datetime): The current time.
+            chunk (int): Orders scored per block, to bound memory.
+
+        Returns:
+            tuple: (driver IDs, (orders, drivers) scores with np.inf where
+            the driver has no fitting slot, (orders, drivers) best slot IDs or -1)
+        """
+        now = now or dt.datetime.now()
+        slots = sorted(self.index.slots.values(), key=lambda slot: slot.driver_id)
+        drivers = sorted({slot.driver_id for slot in slots})
+        costs = np.full((len(orders), len(drivers)), np.inf)
+        chosen = np.full((len(orders), len(drivers)), -1, dtype=np.int64)
+        if not orders or not slots:
+            return drivers, costs, chosen
+
+        routes: Dict[Tuple[str, str], int] = {}
+        route_of = np.array([routes.setdefault(self.index.route_of(slot.id), len(routes)) for slot in slots])
+        starts = np.array([(slot.starts_at - now).total_seconds() for slot in slots])
+        slot_ids = np.array([slot.id for slot in slots], dtype=np.int64)
+        driver_of = np.array([slot.driver_id for slot in slots])
+        bounds = np.flatnonzero(np.r_[True, driver_of[1:] != driver_of[:-1], True])
+
+        ready = np.array([max(0.0, ((order["ready_at"] or now) - now).total_seconds()) for order in orders])
+        horizon = np.array([DRIVER_MATCH_URGENT_HOURS if order["is_urgent"] else DRIVER_MATCH_HORIZON_HOURS
+                            for order in orders]) * 3600
+        origins, destinations = [key[0] for key in routes], [key[1] for key in routes]
+        pickups = [self.pickup_of(order) for order in orders]
+        dropoffs = [order["location"] for order in orders]
+
+        for start in range(0, len(orders), chunk):
+            rows = slice(start, start + chunk)
+            detour = distance_matrix.detour_matrix(origins, destinations, pickups[rows], dropoffs[rows])[route_of].T
+            wait = starts[None, :] - ready[rows, None]
+            with np.errstate(invalid="ignore"):
+                fits = ((wait >= -DRIVER_SLOT_HOURS * 3600) & (wait <= horizon[rows, None])
+                        & (detour <= DRIVER_MATCH_MAX_DETOUR_M))
+            score = np.where(fits, detour + DRIVER_MATCH_WAIT_WEIGHT * np.maximum(wait, 0) / 3600, np.inf)
+            block = np.arange(score.shape[0])
+            for column, (first, last) in enumerate(zip(bounds[:-1], bounds[1:])):
+                best = score[:, first:last].argmin(axis=1)
+                costs[rows, column] = score[block, first + best]
+                chosen[rows, column] = np.where(np.isfinite(costs[rows, column]), slot_ids[first + best], -1)
+        return drivers, costs, chosen
+
+    def candidate_for(self, order: dict, slot_id: int, now: Optional[dt.datetime] = None) -> Optional[dict]:
+        """
+        The candidate entry of one slot for an order, as `candidates` returns it.
+        """
+        slot = self.index.slots.get(slot_id)
+        if slot is None:
+            return None
+        now = now or dt.datetime.now()
+        ready = max(now, order["ready_at"] or now)
+        origin, destination = self.index.route_of(slot_id)
+        detour = float(distance_matrix.detours([origin], [destination], self.pickup_of(order), order["location"])[0])
+        wait_hours = max(0.0, (slot.starts_at - ready).total_seconds() / 3600)
+        return self._candidate(slot, detour, wait_hours, detour + DRIVER_MATCH_WAIT_WEIGHT * wait_hours)
+
+    def _candidate(self, slot: Slot, detour: float, wait_hours: float, score: float) -> dict:
+        driver = self.index.drivers[slot.driver_id]
+        return {
+            "driver_id": slot.driver_id,
+            "driver_name": driver.name,
+            "driver_phone": driver.phone,
+            "time_slot_id": slot.id,
+            "date": slot.starts_at.date().isoformat(),
+            "start_time": slot.starts_at.time().isoformat(),
+            "locations": slot.location,
+            "detour_m": round(detour, 1),
+            "wait_minutes": round(wait_hours * 60),
+            "score": round(score, 1),
+        }
+
+    @staticmethod
+    def pickup_of(order: dict) -> str:
+        """
+        The pickup that decides the detour: the known one farthest from the
+        destination, or the destination itself when the order has none.
+        """
+        known = [(distance_matrix.distance(place, order["location"]), place) for place in order["pickups"]]
+        known = [(meters, place) for meters, place in known if meters is not None]
+        return max(known)[1] if known else order["location"]
+
+    async def match(self, conn, refs=None, limit: int = 5, max_orders: int = 500) -> List[dict]:
+        """
+        Ranked candidates for many unaccepted orders.
+
+        Args:
+            conn (Connection): The database connection.
+            refs (list): (service, order ID) pairs; all unaccepted orders when None.
+            limit (int): Candidates per order.
+            max_orders (int): Maximum number of orders.
+
+        Returns:
+            list: One entry per order with its `candidates`.
+        """
+        await self.refresh(conn)
+        await distance_matrix.refresh(conn)
+        orders = await self.pending_orders(conn, refs, max_orders)
+        geocoder.prefetch(place for order in orders for place in [order["location"], *order["pickups"]]
+                          if place not in distance_matrix)
+        now = dt.datetime.now()
+        return [
+            {
+                "order_id": order["id"],
+                "service": order["service"],
+                "location": order["location"],
+                "is_urgent": order["is_urgent"],
+                "candidates": self.candidates(order, limit, now),
+            }
+            for order in orders
+        ]
+
+
+driver_matching = DriverMatchingService()
@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from pydantic import BaseModel
 class ProductInfo(BaseModel):
     """
@@ -15,6 +16,8 @@ class ProductInfo(BaseModel):
     seller_id: int
     unit: str
     upload_date: str
+    location: Optional[str] = None
+    img_variants: Dict[str, str] = {} # thumbnail, list and detail links
     
 class AddCartRequest(BaseModel):
     buyer_id: int
@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from backend.models.models import LatLng
+
+class ResolveLocationsRequest(BaseModel):
+    """
+    Request model for resolving place names to coordinates.
+    """
+    names: List[str] = Field(..., min_length=1, max_length=200)
+
+class ResolveLocationsResponse(BaseModel):
+    """
+    Response model mapping every requested name to its coordinates, or None if unknown.
+    """
+    results: Dict[str, Optional[LatLng]]
@@ -0,0 +1,73 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class OrderRef(BaseModel):
+    """
+    Model identifying an order of either service.
+    """
+    service: str # 'necessities' or 'agricultural_product'
+    order_id: int
+
+class MatchRequest(BaseModel):
+    """
+    Request model for ranking drivers for many orders at once.
+    """
+    orders: Optional[List[OrderRef]] = Field(None, max_length=500) # all unaccepted orders when omitted
+    limit: int = Field(5, ge=1, le=50) # candidates per order
+
+class DriverCandidate(BaseModel):
+    """
+    Model representing a driver time slot that fits an order.
+    """
+    driver_id: int
+    driver_name: str
+    driver_phone: str
+    time_slot_id: int
+    date: str
+    start_time: str
+    locations: str
+    detour_m: float # extra driving for the pickup and drop-off
+    wait_minutes: int # from the order being ready to the slot start
+    score: float # lower is better
+
+class OrderMatches(BaseModel):
+    """
+    Model representing the ranked driver candidates of one unaccepted order.
+    """
+    order_id: int
+    service: str
+    location: str
+    is_urgent: bool
+    candidates: List[DriverCandidate]
+
+class DispatchRequest(BaseModel):
+    """
+    Request model for running the batch dispatcher once.
+    """
+    mode: str = "propose" # 'propose' or 'assign'
+    dry_run: bool = False # only plan, nothing is written or sent
+
+class DispatchAssignment(BaseModel):
+    """
+    Model representing the driver slot the dispatcher chose for an order.
+    """
+    order_id: int
+    service: str
+    driver_id: int
+    time_slot_id: int
+    detour_m: float
+    score: float
+
+class DispatchResult(BaseModel):
+    """
+    Model representing the outcome of one dispatcher run.
+    """
+    mode: str
+    dry_run: bool
+    skipped: bool # another worker was dispatching
+    pending_orders: int = 0
+    assigned: int = 0 # proposed or assigned, depending on the mode
+    unassigned: int = 0
+    drivers_notified: int = 0
+    seconds: float = 0.0
+    assignments: List[DispatchAssignment] = []
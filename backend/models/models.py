@@ -9,6 +9,13 @@ from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
+class LatLng(BaseModel):
+    """
+    Model representing geographic coordinates.
+    """
+    lat: float
+    lng: float
+
 class OrderItem(BaseModel):
     item_id: str
     item_name: str
@@ -17,6 +24,7 @@ class OrderItem(BaseModel):
     img: str
     location: Optional[str] = '家樂福'
     category: Optional[str] = '未分類'
+    coordinates: Optional[LatLng] = None # where the item is picked up, filled in by the server
 
 class Order(BaseModel):
     id: Optional[int] = None 
@@ -32,6 +40,9 @@ class Order(BaseModel):
     service: str
     items: List[OrderItem]
     timestamp: Optional[datetime] = None 
+    coordinates: Optional[LatLng] = None # of location, filled in by the server
+    distance_m: Optional[float] = None # longest pickup-to-location leg, filled in by the server
+    duration_s: Optional[float] = None # estimated driving time of that leg
 
 class DetailedOrder(Order):
     seller_id: int
@@ -91,6 +102,40 @@ class DriverOrder(BaseModel):
     previous_driver_phone: Optional[str] = None
     service: str
 
+class RouteStop(BaseModel):
+    """
+    Model representing one pickup or drop-off on a planned driver route.
+    """
+    order_id: int
+    service: str
+    kind: str # 'pickup' or 'dropoff'
+    location: str
+    coordinates: LatLng
+    leg_distance_m: float # from the previous stop, or from the origin
+    cumulative_distance_m: float
+    leg_duration_s: float # estimated driving time
+    cumulative_duration_s: float
+
+class UnresolvedStop(BaseModel):
+    """
+    Model representing a stop left out of a route because its place has no coordinates yet.
+    """
+    order_id: int
+    service: str
+    kind: str
+    location: str
+
+class DriverRoute(BaseModel):
+    """
+    Model representing a planned visiting order of a driver's active orders.
+    """
+    driver_id: int
+    origin: Optional[LatLng] = None
+    stops: List[RouteStop]
+    total_distance_m: float
+    total_duration_s: float
+    unresolved: List[UnresolvedStop]
+
 class TransferOrderRequest(BaseModel):
     """
     Model representing a transfer order request.
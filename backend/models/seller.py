@@ -4,7 +4,7 @@ This module defines the Pydantic models used in the application.
 It includes models for UploadImage,.
 These models help in validating and serializing the data exchanged between the API and the database.
 """
-from typing import List
+from typing import Dict, List
 from pydantic import BaseModel
 
 class UploadImageRequset(BaseModel):
@@ -16,6 +16,7 @@ class UploadImageResponse(BaseModel):
     """
     img_id: str
     img_link: str
+    variants: Dict[str, str] = {} # thumbnail, list and detail links
 class UploadItemRequest(BaseModel):
     """
     Model representing upload agricultural_product request.
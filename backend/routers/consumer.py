@@ -1,6 +1,7 @@
 '''
 Endpoints:
-- GET /: Get on sell items
+- GET /: Get on sell items, filtered and paginated
+- GET /search: Search on sell items by name or category
 - POST /cart: Add item to shopping cart
 - GET /cart/{userId}:  Get user shopping cart items 
 - DELETE /cart/{itemId}: Delete specific item in shopping cart
@@ -11,96 +12,288 @@ Endpoints:
 - PATCH /order/status_confirm/{orderId}: Update status to '已確認' with id {orderId}
 
 '''
-from fastapi import APIRouter, HTTPException, Depends
-from psycopg2.extensions import connection as Connection
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from psycopg import AsyncConnection as Connection
 from backend.models.consumer import ProductInfo, AddCartRequest, CartItem, UpdateCartQuantityRequest, PurchaseProductRequest, PurchasedProduct
-from backend.database import get_db_connection
+from backend.database import get_db
+from backend.event_log import event_logger
+from backend.cache import TTLCache, MISSING
+from backend.conditional import not_modified, request_versions
+from backend.handlers.order_events import publish_order_event
+from backend.geocoding import geocoder
 import logging
 import json
-from typing import List
-from datetime import datetime
+import base64
+import bisect
+import itertools
+from typing import List, Optional
 import datetime as dt
 router = APIRouter()
 import os
 
 
-log_dir = os.path.join(os.getcwd(), 'backend', 'logs')
-
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file = os.path.join(log_dir, 'consumers.log')
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
+logger = logging.getLogger(__name__)
+log_event = event_logger("consumers")
+
+# Catalog snapshot: every product still on sale, newest first. Keyed by date
+# because products drop off the shelf when the day changes, and by the
+# `products` version the ETag is built from, so no worker serves an older
+# snapshot under a newer ETag. Writes move the version, so the outdated
+# snapshot is never read again and is evicted by the next one.
+catalog_cache = TTLCache(
+    "consumer_catalog",
+    maxsize=2,
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', 60))
 )
 
+PRODUCT_COLUMNS = """
+    p.id, p.name, p.price, p.total_quantity, p.category, p.upload_date,
+    p.off_shelf_date, p.img_link, p.img_id, p.seller_id, p.unit, p.location, io.variants
+"""
 
-logger = logging.getLogger(__name__)
+CATALOG_QUERY = f"""
+    SELECT {PRODUCT_COLUMNS}
+    FROM agricultural_produce p
+    LEFT JOIN image_objects io ON io.img_id = p.img_id
+    WHERE p.off_shelf_date >= %s
+    ORDER BY p.id DESC
+"""
 
-def log_event(event_type: str, data: dict):
-    log_data = {
-        "timestamp": datetime.now().isoformat(),
-        "event_type": event_type,
-        "data": data
+def product_row_to_dict(product) -> dict:
+    """
+    Build the ProductInfo payload from a row selected with PRODUCT_COLUMNS.
+    Args:
+        product (tuple): The product row.
+    Returns:
+        dict: The product information.
+    """
+    return {
+        "id": product[0],
+        "name": product[1],
+        "price": str(product[2]),
+        "total_quantity": str(product[3]),
+        "category": product[4],
+        "upload_date": str(product[5]),
+        "off_shelf_date": str(product[6]),
+        "img_link": product[7],
+        "img_id": product[8],
+        "seller_id": product[9],
+        "unit": product[10],
+        "location": product[11],
+        "img_variants": product[12] or {},
+        "_price": product[2],
     }
-    logger.info(json.dumps(log_data))
 
-def get_db():
+async def load_catalog(conn: Connection, today: dt.date, version: int) -> List[dict]:
     """
-    Get a database connection.
-    
-    Yields:
-        psycopg2.extensions.connection: A PostgreSQL database connection.
+    Return the on-sale catalog snapshot for today, loading it on a cache miss.
+    Args:
+        conn (Connection): The database connection.
+        today (date): The current date.
+        version (int): The `products` resource version read before the catalog.
+    Returns:
+        List[dict]: The products on sale, ordered by id descending.
     """
-    conn = get_db_connection()
+    products = catalog_cache.get((today, version))
+    if products is not MISSING:
+        return products
+
+    cur = conn.cursor()
     try:
-        yield conn
+        logging.info("Load agricultural_product catalog.(today_date: %s)", today)
+        await cur.execute(CATALOG_QUERY, (today,))
+        products = [product_row_to_dict(product) for product in await cur.fetchall()]
     finally:
-        conn.close()
+        await cur.close()
+    catalog_cache.set((today, version), products)
+    return products
+
+def encode_catalog_cursor(product: dict) -> str:
+    """
+    Encode the keyset position of a product as an opaque cursor.
+    Args:
+        product (dict): The last product of a page.
+    Returns:
+        str: The cursor for the following page.
+    """
+    return base64.urlsafe_b64encode(json.dumps([product["id"]]).encode()).decode()
+
+def decode_catalog_cursor(cursor: str) -> int:
+    """
+    Decode a cursor produced by encode_catalog_cursor.
+    Args:
+        cursor (str): The opaque cursor.
+    Returns:
+        int: The id of the last product already returned.
+    """
+    try:
+        (product_id,) = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(product_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="無效的分頁游標") from e
+
 @router.get('/', response_model=List[ProductInfo])
-async def get_on_sell_item(conn: Connection=Depends(get_db)):
+async def get_on_sell_item(
+    response: Response,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    conn: Connection=Depends(get_db),
+    request: Request = None
+):
     """
     Get agricultural_product which off_shelf_date is larger than today_date
 
+    Products are served from an in-process snapshot of the catalog and paged
+    newest first. When more products follow, the X-Next-Cursor header holds
+    the cursor for the next page. Answers 304 when the If-None-Match ETag is
+    still current.
+
     Args:
-        today_date(str):today date
+        category (str): Only products of this category.
+        location (str): Only products placed at this location.
+        min_price (int): Lowest price to include.
+        max_price (int): Highest price to include.
+        cursor (str): The X-Next-Cursor value of the previous page.
+        limit (int): Maximum number of products to return.
         conn(Connection): The database connection.
+        request (Request): The incoming request.
 
     Returns:
         List[ProductInfo]: A list of agricultural_product information.
     """
+    after_id = decode_catalog_cursor(cursor) if cursor else None
     today = dt.date.today()
+    try:
+        unchanged = await not_modified(conn, request, response, "catalog", ["products"], str(today))
+        if unchanged is not None:
+            return unchanged
+        versions = await request_versions(conn, request, ["products"])
+        products = await load_catalog(conn, today, versions.get("products"))
+    except Exception as e:
+        await conn.rollback()
+        logging.error("Error occurred: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    start = 0
+    if after_id is not None:
+        # ids are descending, so search the negated ids
+        start = bisect.bisect_right(products, -after_id, key=lambda product: -product["id"])
+
+    page = []
+    for product in itertools.islice(products, start, None):
+        if category is not None and product["category"] != category:
+            continue
+        if location is not None and product["location"] != location:
+            continue
+        if min_price is not None and product["_price"] < min_price:
+            continue
+        if max_price is not None and product["_price"] > max_price:
+            continue
+        if len(page) == limit:
+            response.headers["X-Next-Cursor"] = encode_catalog_cursor(page[-1])
+            break
+        page.append(product)
+    return page
+# Ranked product search. Matches are substring matches on name or category
+# (served by the pg_trgm GIN indexes) plus fuzzy name matches above the
+# pg_trgm similarity threshold. Exact, prefix and substring name matches rank
+# first, then category matches; similarity breaks ties. Trigrams of Chinese
+# text need a database whose LC_CTYPE classifies CJK as letters (any UTF-8
+# locale other than C); the ILIKE matches and ranking work either way.
+SEARCH_QUERY = f"""
+    SELECT * FROM (
+        SELECT {PRODUCT_COLUMNS},
+            (CASE
+                WHEN p.name = %(q)s THEN 4
+                WHEN p.name ILIKE %(prefix)s THEN 3
+                WHEN p.name ILIKE %(pattern)s THEN 2
+                WHEN p.category ILIKE %(pattern)s THEN 1
+                ELSE 0
+            END + similarity(p.name, %(q)s))::float8 AS rank
+        FROM agricultural_produce p
+        LEFT JOIN image_objects io ON io.img_id = p.img_id
+        WHERE p.off_shelf_date >= %(today)s
+            AND (p.name ILIKE %(pattern)s OR p.category ILIKE %(pattern)s OR p.name %% %(q)s)
+            AND (%(category)s::text IS NULL OR p.category = %(category)s)
+    ) AS results
+    WHERE %(after_rank)s::float8 IS NULL OR (results.rank, results.id) < (%(after_rank)s, %(after_id)s)
+    ORDER BY results.rank DESC, results.id DESC
+    LIMIT %(limit)s
+"""
+
+def escape_like(text: str) -> str:
+    """
+    Escape LIKE wildcards so user input matches literally.
+    """
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+@router.get('/search', response_model=List[ProductInfo])
+async def search_products(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=50),
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    conn: Connection = Depends(get_db)
+):
+    """
+    Search on-sale products by name or category, best matches first.
+
+    When more results follow, the X-Next-Cursor header holds the cursor for
+    the next page.
+
+    Args:
+        q (str): The search text.
+        category (str): Only products of this category.
+        cursor (str): The X-Next-Cursor value of the previous page.
+        limit (int): Maximum number of products to return.
+        conn (Connection): The database connection.
+
+    Returns:
+        List[ProductInfo]: The matching products.
+    """
+    after_rank, after_id = None, None
+    if cursor:
+        try:
+            after_rank, after_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            after_rank, after_id = float(after_rank), int(after_id)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail="無效的分頁游標") from e
+
+    q = q.strip()
+    pattern = escape_like(q)
     cur = conn.cursor()
     try:
-        logging.info("Get agricultural_product.(today_date: %s)", today)
-        cur.execute("SELECT * FROM agricultural_produce WHERE off_shelf_date >= %s", (today,))
-        products = cur.fetchall()
-        logging.info('start create product list')
-        product_list:List[ProductInfo] = []
-        for product in products:
-            product_list.append({
-                "id":product[0],
-                "name":product[1],
-                "price": str(product[2]),
-                "total_quantity": str(product[3]),
-                "category": product[4],
-                "upload_date":str(product[5]),
-                "off_shelf_date":str(product[6]),
-                "img_link": product[7],
-                "img_id": product[8],
-                "seller_id": product[9],
-                "unit": product[10],   
-            })
-        return product_list
+        await cur.execute(SEARCH_QUERY, {
+            "q": q,
+            "prefix": pattern + '%',
+            "pattern": '%' + pattern + '%',
+            "today": dt.date.today(),
+            "category": category,
+            "after_rank": after_rank,
+            "after_id": after_id,
+            "limit": limit + 1,
+        })
+        rows = await cur.fetchall()
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = base64.urlsafe_b64encode(
+            json.dumps([last[-1], last[0]]).encode()
+        ).decode()
+    return [product_row_to_dict(row) for row in rows]
+
 @router.post('/cart')
 async def add_cart(req: AddCartRequest, conn: Connection = Depends(get_db)):
     """
@@ -123,22 +316,22 @@ async def add_cart(req: AddCartRequest, conn: Connection = Depends(get_db)):
 
     try:
         logging.info('check whether insert the same item')
-        cur.execute(
+        await cur.execute(
             "SELECT produce_id FROM agricultural_shopping_cart WHERE produce_id = %s AND buyer_id = %s AND status = %s", 
             (req.produce_id, req.buyer_id, '未送單')
         )
-        repeated_id = cur.fetchone()
+        repeated_id = await cur.fetchone()
         if repeated_id:
             raise HTTPException(status_code=409, detail="重複新增相同商品")
             
         logging.info("Inserting to cart")
-        cur.execute(
+        await cur.execute(
             """INSERT INTO agricultural_shopping_cart (buyer_id, produce_id, quantity, status) 
             VALUES (%s, %s, %s, %s) RETURNING id""",
             (req.buyer_id, req.produce_id, req.quantity, '未送單')
         )
-        itemId = cur.fetchone()[0]
-        conn.commit()
+        itemId = (await cur.fetchone())[0]
+        await conn.commit()
         log_event("ADDED_TO_CART", {
             "item_id": itemId,
             "buyer_id": req.buyer_id,
@@ -147,7 +340,7 @@ async def add_cart(req: AddCartRequest, conn: Connection = Depends(get_db)):
         })
         return itemId
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("ADD_TO_CART_ERROR", {
             "buyer_id": req.buyer_id,
             "produce_id": req.produce_id,
@@ -155,7 +348,7 @@ async def add_cart(req: AddCartRequest, conn: Connection = Depends(get_db)):
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get('/cart/{userId}', response_model=List[CartItem])
 async def get_seller_item(userId: int, conn: Connection=Depends(get_db)):
@@ -173,13 +366,13 @@ async def get_seller_item(userId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Get cart items of user whose id is %s.", userId)
-        cur.execute(
+        await cur.execute(
             """SELECT cart.id, produce.id, produce.name, produce.img_link, produce.price, cart.quantity, produce.seller_id, produce.unit, produce.location
             FROM agricultural_shopping_cart as cart
             JOIN agricultural_produce as produce ON cart.produce_id=produce.id
             WHERE buyer_id = %s AND produce.off_shelf_date >= %s AND cart.status = %s""", (userId, today, '未送單'))
 
-        items = cur.fetchall()
+        items = await cur.fetchall()
         logging.info('start create product list')
         cart_list:List[CartItem] = []
         for item in items:
@@ -196,11 +389,11 @@ async def get_seller_item(userId: int, conn: Connection=Depends(get_db)):
             })
         return cart_list
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.delete('/cart/{itemId}')
 async def delete_cart_item(itemId: int, conn: Connection=Depends(get_db)):
@@ -217,17 +410,17 @@ async def delete_cart_item(itemId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Delete cart item with id %s.", itemId)
-        cur.execute(
+        await cur.execute(
             """DELETE FROM agricultural_shopping_cart
             WHERE id = %s""", (itemId, ))
-        conn.commit()
+        await conn.commit()
         return {"success":"delete"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 @router.patch("/cart/quantity/{itemId}")
 async def update_cart_quantity(itemId: int, req: UpdateCartQuantityRequest, conn: Connection = Depends(get_db)):
     """
@@ -243,21 +436,21 @@ async def update_cart_quantity(itemId: int, req: UpdateCartQuantityRequest, conn
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             "UPDATE agricultural_shopping_cart SET quantity = %s WHERE id = %s",
             ( req.quantity, itemId )
         )
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Item not found")
         
-        conn.commit()
+        await conn.commit()
         return {"status": "success"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error updating user nearest location: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.post('/order')
 async def purchase_product(req: PurchaseProductRequest, conn: Connection = Depends(get_db)):
@@ -281,20 +474,22 @@ async def purchase_product(req: PurchaseProductRequest, conn: Connection = Depen
     })
 
     try:
-        cur.execute("SELECT phone FROM users WHERE id = %s", (req.buyer_id,))
-        result = cur.fetchone()
+        await cur.execute("SELECT phone FROM users WHERE id = %s", (req.buyer_id,))
+        result = await cur.fetchone()
         if result is None:
             raise HTTPException(status_code=404, detail="Buyer not found")
         buyer_phone = result[0] 
         logging.info("Inserting agricultural_product order")
-        cur.execute(
+        await cur.execute(
             """INSERT INTO agricultural_product_order 
             (seller_id, buyer_id, buyer_name, buyer_phone, produce_id, quantity, starting_point, end_point, status) 
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
             (req.seller_id, req.buyer_id, req.buyer_name, buyer_phone, req.produce_id, req.quantity, req.starting_point, req.end_point, '未接單')
         )
-        order_id = cur.fetchone()[0]
-        conn.commit()
+        order_id = (await cur.fetchone())[0]
+        await publish_order_event(cur, "created", "agricultural_product", order_id, location=req.end_point)
+        await conn.commit()
+        geocoder.prefetch([req.starting_point, req.end_point])
         log_event("PURCHASE_COMPLETED", {
             "order_id": order_id,
             "buyer_id": req.buyer_id,
@@ -303,14 +498,14 @@ async def purchase_product(req: PurchaseProductRequest, conn: Connection = Depen
         })
         return order_id
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("PURCHASE_ERROR", {
             "buyer_id": req.buyer_id,
             "error": str(e)
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.patch("/cart/status/{itemId}")
 async def update_cart_item_status(itemId: int, conn: Connection = Depends(get_db)):
@@ -326,21 +521,21 @@ async def update_cart_item_status(itemId: int, conn: Connection = Depends(get_db
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             "UPDATE agricultural_shopping_cart SET status = %s WHERE id = %s",
             ( '已送單', itemId )
         )
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Item not found")
         
-        conn.commit()
+        await conn.commit()
         return {"status": "success"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error updating cart item status: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get('/purchased/{userId}', response_model=List[PurchasedProduct])
 async def get_purchase_item(userId: int, conn: Connection=Depends(get_db)):
@@ -357,13 +552,13 @@ async def get_purchase_item(userId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Get purchased items of user whose id is %s.", userId)
-        cur.execute(
+        await cur.execute(
             """SELECT o.id, o.quantity, o.timestamp, produce.name, produce.price, produce.img_link, o.status, produce.unit
             FROM agricultural_product_order as o
             JOIN agricultural_produce as produce ON o.produce_id=produce.id
             WHERE buyer_id = %s  """, (userId,))
 
-        items = cur.fetchall()
+        items = await cur.fetchall()
         logging.info('start create purchased product list')
         purchased_item_list:List[PurchasedProduct] = []
         for item in items:
@@ -379,11 +574,11 @@ async def get_purchase_item(userId: int, conn: Connection=Depends(get_db)):
             })
         return purchased_item_list
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 @router.patch("/order/status_confirm/{orderId}")
 async def update_cart_item_status(orderId: int, conn: Connection = Depends(get_db)):
     """
@@ -398,20 +593,20 @@ async def update_cart_item_status(orderId: int, conn: Connection = Depends(get_d
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             "UPDATE agricultural_product_order SET status = %s WHERE id = %s",
             ( '已確認', orderId )
         )
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Item not found")
         
-        conn.commit()
+        await conn.commit()
         return {"status": "success"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error updating cart item status: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 
@@ -8,7 +8,8 @@ Endpoints:
 - POST /: Create a new driver.
 - GET /user/{user_id}: Get driver information by user ID.
 - GET /{driver_id}: Get driver information by driver ID.
-- GET /{driver_id}/orders: Get orders assigned to a driver.
+- GET /{driver_id}/orders: Get orders assigned to a driver, optionally filtered by status.
+- GET /{driver_id}/route: Plan the visiting order of a driver's accepted orders.
 - POST /time: Add a new available time slot for a driver.
 - GET /all/times: Retrieve available time slots for all driver.
 - GET /{driver_id}/times: Retrieve available time slots for a specific driver.
@@ -16,51 +17,25 @@ Endpoints:
 - DELETE /drop_agricultural_order/{driver_id}/{order_id}:Delete received agricultural product order.
 """
 
+import asyncio
 import logging
-import json
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
-from psycopg2.extensions import connection as Connection
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from psycopg import AsyncConnection as Connection
 from backend.models.models import Driver
-from backend.models.models import DriverTime, DriverTimeDetail
-from backend.database import get_db_connection
-from typing import List
-import os 
+from backend.models.models import DriverTime, DriverTimeDetail, DriverRoute
+from backend.database import get_db
+from backend.event_log import event_logger
+from backend.conditional import not_modified, request_versions
+from backend.geocoding import geocoder
+from backend.routing import plan_route, distance_matrix
+from backend.matching import driver_matching, slot_from_row
+from typing import List, Optional
 
 router = APIRouter()
 
-log_dir = os.path.join(os.getcwd(), 'backend', 'logs')
-
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file = os.path.join(log_dir, 'drivers.log')
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
-
 logger = logging.getLogger(__name__)
+log_event = event_logger("drivers")
 
-def log_event(event_type: str, data: dict):
-    log_data = {
-        "timestamp": datetime.now().isoformat(),
-        "event_type": event_type,
-        "data": data
-    }
-    logger.info(json.dumps(log_data))
-
-def get_db():
-    """
-    Dependency function to get a database connection.
-    """
-    conn = get_db_connection()
-    try:
-        yield conn
-    finally:
-        conn.close()
 
 @router.post("/")
 async def create_driver(driver: Driver, conn: Connection = Depends(get_db)):
@@ -83,25 +58,25 @@ async def create_driver(driver: Driver, conn: Connection = Depends(get_db)):
     cur = conn.cursor()
     try:
         # Check if user_id exists
-        cur.execute("SELECT id FROM users WHERE id = %s", (driver.user_id,))
-        user = cur.fetchone()
+        await cur.execute("SELECT id FROM users WHERE id = %s", (driver.user_id,))
+        user = await cur.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="使用者不存在")
 
         # Check if the user is already a driver
-        cur.execute("SELECT id FROM drivers WHERE user_id = %s", (driver.user_id,))
-        existing_driver = cur.fetchone()
+        await cur.execute("SELECT id FROM drivers WHERE user_id = %s", (driver.user_id,))
+        existing_driver = await cur.fetchone()
         if existing_driver:
             raise HTTPException(status_code=409, detail="使用者已經是司機")
 
         # Check if driver_phone already exists
-        cur.execute("SELECT id FROM drivers WHERE driver_phone = %s", (driver.driver_phone,))
-        phone_exists = cur.fetchone()
+        await cur.execute("SELECT id FROM drivers WHERE driver_phone = %s", (driver.driver_phone,))
+        phone_exists = await cur.fetchone()
         if phone_exists:
             raise HTTPException(status_code=409, detail="電話號碼已存在")
 
         # Insert the new driver
-        cur.execute(
+        await cur.execute(
             """
             INSERT INTO drivers (user_id, driver_name, driver_phone)
             VALUES (%s, %s, %s)
@@ -113,8 +88,8 @@ async def create_driver(driver: Driver, conn: Connection = Depends(get_db)):
                 driver.driver_phone,
             )
         )
-        new_driver_id = cur.fetchone()[0]
-        conn.commit()
+        new_driver_id = (await cur.fetchone())[0]
+        await conn.commit()
         log_event("DRIVER_REGISTERED", {
             "driver_id": new_driver_id,
             "user_id": driver.user_id,
@@ -122,17 +97,17 @@ async def create_driver(driver: Driver, conn: Connection = Depends(get_db)):
         })
         return {"status": "success", "driver_id": new_driver_id}
     except HTTPException as he:
-        conn.rollback()
+        await conn.rollback()
         raise he
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("DRIVER_REGISTRATION_ERROR", {
             "user_id": driver.user_id,
             "error": str(e)
         })
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get("/user/{user_id}")
 async def get_driver_by_user(user_id: int, conn: Connection = Depends(get_db)):
@@ -148,7 +123,7 @@ async def get_driver_by_user(user_id: int, conn: Connection = Depends(get_db)):
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             """
             SELECT id, user_id, driver_name, driver_phone
             FROM drivers
@@ -156,7 +131,7 @@ async def get_driver_by_user(user_id: int, conn: Connection = Depends(get_db)):
             """,
             (user_id,)
         )
-        driver = cur.fetchone()
+        driver = await cur.fetchone()
         if not driver:
             raise HTTPException(status_code=404, detail="該使用者不是司機或不存在")
 
@@ -174,7 +149,7 @@ async def get_driver_by_user(user_id: int, conn: Connection = Depends(get_db)):
         logging.error("Error fetching driver by user: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get("/{driver_id}")
 async def get_driver_by_id(driver_id: int, conn: Connection = Depends(get_db)):
@@ -191,7 +166,7 @@ async def get_driver_by_id(driver_id: int, conn: Connection = Depends(get_db)):
     cur = conn.cursor()
     try:
         # Check if driver_id exists in the database
-        cur.execute(
+        await cur.execute(
             """
             SELECT id, user_id, driver_name, driver_phone
             FROM drivers
@@ -199,7 +174,7 @@ async def get_driver_by_id(driver_id: int, conn: Connection = Depends(get_db)):
             """,
             (driver_id,)
         )
-        driver = cur.fetchone()
+        driver = await cur.fetchone()
         
         # Check if driver exists
         if not driver:
@@ -216,15 +191,103 @@ async def get_driver_by_id(driver_id: int, conn: Connection = Depends(get_db)):
         logging.error("Error fetching driver by ID: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
+
+# The driver's whole workload in one statement: necessities orders with their items
+# aggregated as JSON, agricultural orders, and the transfer provenance recorded
+# on driver_orders for both. Dispatcher proposals ('推薦') are not the driver's yet.
+DRIVER_WORKLOAD_QUERY = """
+    SELECT * FROM (
+        SELECT 'necessities' AS service, o.id, o.buyer_id, o.buyer_name, o.buyer_phone,
+            o.location, o.is_urgent, o.total_price, o.order_type, o.order_status, o.note,
+            dro.previous_driver_id, dro.previous_driver_name, dro.previous_driver_phone,
+            o.timestamp,
+            COALESCE((
+                SELECT json_agg(json_build_object(
+                    'item_id', oi.item_id, 'item_name', oi.item_name, 'price', oi.price,
+                    'quantity', oi.quantity, 'img', oi.img, 'location', oi.location,
+                    'category', oi.category) ORDER BY oi.id)
+                FROM order_items oi
+                WHERE oi.order_id = o.id
+            ), '[]'::json) AS items
+        FROM orders o
+        JOIN driver_orders dro ON o.id = dro.order_id
+        WHERE dro.driver_id = %(driver_id)s AND dro.service = 'necessities' AND dro.action <> '推薦'
+        UNION ALL
+        SELECT 'agricultural_product' AS service, agri_p_o.id, agri_p_o.buyer_id, agri_p_o.buyer_name,
+            agri_p_o.buyer_phone, agri_p_o.end_point, FALSE, agri_p.price * agri_p_o.quantity,
+            '購買類', agri_p_o.status, agri_p_o.note,
+            dro.previous_driver_id, dro.previous_driver_name, dro.previous_driver_phone,
+            agri_p_o.timestamp,
+            json_build_array(json_build_object(
+                'item_id', agri_p.id::text, 'item_name', agri_p.name, 'price', agri_p.price,
+                'quantity', agri_p_o.quantity, 'img', agri_p.img_link,
+                'location', agri_p_o.starting_point, 'category', agri_p.category)) AS items
+        FROM agricultural_product_order as agri_p_o
+        JOIN driver_orders as dro ON agri_p_o.id = dro.order_id
+        JOIN agricultural_produce as agri_p ON agri_p.id = agri_p_o.produce_id
+        WHERE dro.driver_id = %(driver_id)s AND dro.service = 'agricultural_product' AND dro.action <> '推薦'
+    ) AS workload
+    WHERE %(status)s::text IS NULL OR workload.order_status = %(status)s
+"""
+
+async def fetch_driver_orders(cur, driver_id: int, status: Optional[str] = None) -> List[dict]:
+    """
+    Load a driver's orders with their items.
+
+    Args:
+        cur (Cursor): The database cursor.
+        driver_id (int): The driver's ID.
+        status (str): Only orders with this status.
+
+    Returns:
+        list: The orders as returned by GET /{driver_id}/orders, without coordinates.
+
+    Raises:
+        HTTPException: 404 if the driver does not exist.
+    """
+    await cur.execute(DRIVER_WORKLOAD_QUERY, {"driver_id": driver_id, "status": status})
+    rows = await cur.fetchall()
+
+    # An empty workload is the only case where the driver might not exist.
+    if not rows:
+        await cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_id,))
+        if not await cur.fetchone():
+            raise HTTPException(status_code=404, detail="司機不存在")
+
+    order_list = []
+    for row in rows:
+        order_list.append({
+            "id": row[1],
+            "buyer_id": row[2],
+            "buyer_name": row[3],
+            "buyer_phone": row[4],
+            "location": row[5], #商品要送達的目的地
+            "is_urgent": row[6], # optional(or default false)
+            "total_price": row[7],
+            "order_type": row[8],
+            "order_status": row[9], #未接單、已接單、已送達
+            "note": row[10],
+            "previous_driver_id": row[11],
+            "previous_driver_name": row[12],
+            "previous_driver_phone": row[13],
+            "service": row[0],
+            "items": row[15], #item location is where the driver picks the goods up
+            "timestamp": row[14]
+        })
+    return order_list
 
 @router.get("/{driver_id}/orders")
-async def get_driver_orders(driver_id: int, conn: Connection = Depends(get_db)):
+async def get_driver_orders(driver_id: int, request: Request, response: Response, status: Optional[str] = None, conn: Connection = Depends(get_db)):
     """
     Get orders assigned to a driver.
+    Answers 304 when the If-None-Match ETag is still current.
 
     Args:
         driver_id (int): The driver's ID.
+        request (Request): The incoming request.
+        response (Response): The outgoing response, used to set ETag.
+        status (str): Only orders with this status, e.g. '接單' for active deliveries.
         conn (Connection): The database connection.
 
     Returns:
@@ -232,103 +295,14 @@ async def get_driver_orders(driver_id: int, conn: Connection = Depends(get_db)):
     """
     cur = conn.cursor()
     try:
-        # Check if driver_id exists
-        cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="司機不存在")
-
-        # Retrieve accepted orders
-        cur.execute("""
-            SELECT orders.*, driver_orders.previous_driver_name, driver_orders.previous_driver_phone
-            FROM orders 
-            JOIN driver_orders ON orders.id = driver_orders.order_id 
-            WHERE driver_orders.driver_id = %s and driver_orders.service = %s 
-        """, (driver_id, 'necessities'))
-        orders = cur.fetchall()
-        order_list = []
-        for order in orders:
-            order_dict = {
-                "id": order[0],
-                "buyer_id": order[1],
-                "buyer_name": order[2],
-                "buyer_phone": order[3],
-                #"seller_id": order[4], # no
-                #"seller_name": order[5], # no
-                #"seller_phone": order[6], # no
-                #"date": order[7].isoformat(), # no
-                #"time": order[8].isoformat(), # no
-                "location": order[9],
-                "is_urgent": order[10], # optional(or default false) 
-                "total_price": order[11],
-                "order_type": order[12],
-                "order_status": order[13],
-                "note": order[14],
-                #"shipment_count": order[15], # no
-                #"required_orders_count": order[16], # no
-                "previous_driver_id": order[17],
-                "previous_driver_name": order[18],
-                "previous_driver_phone": order[19],
-                "service":"necessities",
-                "items": [],
-                "timestamp": order[20]
-            }
-            # Retrieve order items
-            cur.execute("SELECT item_id, item_name, price, quantity, img, location, category FROM order_items WHERE order_id = %s", (order[0],))
-            items = cur.fetchall()
-            order_dict["items"] = [
-                {
-                    "item_id": item[0],
-                    "item_name": item[1],
-                    "price": item[2],
-                    "quantity": item[3],
-                    "img": item[4],
-                    "location": item[5],
-                    "category": item[6]
-                }
-                for item in items
-            ]
-            order_list.append(order_dict)
-
-        #add
-        cur.execute("""
-            SELECT agri_p_o.id, agri_p_o.buyer_id, agri_p_o.buyer_name, agri_p_o.buyer_phone, agri_p_o.end_point, agri_p_o.status, agri_p_o.note, 
-                    driver_o.previous_driver_id, driver_o.previous_driver_name, driver_o.previous_driver_phone, 
-                    agri_p.id, agri_p.name, agri_p.price, agri_p_o.quantity, agri_p.img_link, agri_p_o.starting_point, agri_p.category, agri_p_o.timestamp
-            FROM agricultural_product_order as agri_p_o
-            JOIN driver_orders as driver_o ON agri_p_o.id = driver_o.order_id
-            JOIN agricultural_produce as agri_p on agri_p.id = agri_p_o.produce_id
-            WHERE driver_o.driver_id = %s and driver_o.service = %s 
-        """, (driver_id, 'agricultural_product'))
-        agri_orders = cur.fetchall()
-        for agri_order in agri_orders:
-            total_price = agri_order[12] * agri_order[13] #price*quantity
-            agri_order_dict = {
-                "id": agri_order[0],
-                "buyer_id": agri_order[1],
-                "buyer_name": agri_order[2],
-                "buyer_phone": agri_order[3],
-                "location":agri_order[4], #商品要送達的目的地
-                "is_urgent": False, # optional(or default false) 
-                "total_price": total_price,
-                "order_type": '購買類',
-                "order_status": agri_order[5], #未接單、已接單、已送達
-                "note": agri_order[6],
-                "previous_driver_id": agri_order[7],
-                "previous_driver_name": agri_order[8],
-                "previous_driver_phone": agri_order[9],
-                "service":'agricultural_product',
-                "items": [{
-                    "item_id": agri_order[10],
-                    "item_name": agri_order[11],
-                    "price": agri_order[12],
-                    "quantity": agri_order[13],
-                    "img": agri_order[14],
-                    "location": agri_order[15], #司機拿取農產品的地方
-                    "category": agri_order[16]
-                }],
-                "timestamp":agri_order[17]
-            }
-            order_list.append(agri_order_dict)
+        unchanged = await not_modified(conn, request, response, "driver_orders", ["orders", "products", "drivers", "locations"])
+        if unchanged is not None:
+            return unchanged
+        order_list = await fetch_driver_orders(cur, driver_id, status)
+        versions = await request_versions(conn, request, ["locations"])
+        await distance_matrix.refresh(conn, version=versions.get("locations"))
+        distance_matrix.attach_coordinates(order_list)
+        distance_matrix.attach_distances(order_list)
         return order_list
     except HTTPException as he:
         raise he
@@ -336,7 +310,52 @@ async def get_driver_orders(driver_id: int, conn: Connection = Depends(get_db)):
         logging.error("Error fetching driver orders: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
+
+@router.get("/{driver_id}/route", response_model=DriverRoute)
+async def get_driver_route(driver_id: int, request: Request, response: Response,
+                           lat: Optional[float] = Query(None, ge=-90, le=90),
+                           lng: Optional[float] = Query(None, ge=-180, le=180),
+                           conn: Connection = Depends(get_db)):
+    """
+    Plan the visiting order of a driver's accepted orders.
+    Every pickup comes before the drop-off of its order; places without
+    coordinates yet are listed in `unresolved` instead of being routed.
+    Answers 304 when the If-None-Match ETag is still current.
+
+    Args:
+        driver_id (int): The driver's ID.
+        request (Request): The incoming request.
+        response (Response): The outgoing response, used to set ETag.
+        lat (float): Latitude of the driver's current position.
+        lng (float): Longitude of the driver's current position.
+        conn (Connection): The database connection.
+
+    Returns:
+        DriverRoute: The stops in visiting order with distances in meters and travel times in seconds.
+    """
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="起點需同時提供 lat 與 lng")
+    cur = conn.cursor()
+    try:
+        unchanged = await not_modified(conn, request, response, "driver_route", ["orders", "products", "drivers", "locations"])
+        if unchanged is not None:
+            return unchanged
+        order_list = await fetch_driver_orders(cur, driver_id, "接單")
+        versions = await request_versions(conn, request, ["locations"])
+        await distance_matrix.refresh(conn, version=versions.get("locations"))
+        distance_matrix.attach_coordinates(order_list)
+        origin = {"lat": lat, "lng": lng} if lat is not None else None
+        route = await asyncio.to_thread(plan_route, order_list, origin, distance_matrix)
+        route["driver_id"] = driver_id
+        return route
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logging.error("Error planning driver route: %s", str(e))
+        raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
+    finally:
+        await cur.close()
 
 @router.post("/time")
 async def add_driver_time(driver_time: DriverTime, conn: Connection = Depends(get_db)):
@@ -354,38 +373,52 @@ async def add_driver_time(driver_time: DriverTime, conn: Connection = Depends(ge
     cur = conn.cursor()
     try:
         # Check if driver_id exists
-        cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_time.driver_id,))
-        if not cur.fetchone():
+        await cur.execute(
+            """
+            SELECT d.user_id, d.driver_name, d.driver_phone, u.location
+            FROM drivers d
+            LEFT JOIN users u ON u.id = d.user_id
+            WHERE d.id = %s
+            """,
+            (driver_time.driver_id,)
+        )
+        driver = await cur.fetchone()
+        if not driver:
             raise HTTPException(status_code=404, detail="司機不存在")
 
         # Insert the time slot
-        cur.execute(
+        await cur.execute(
             """
             INSERT INTO driver_time (driver_id, date, start_time, locations)
             VALUES (%s, %s, %s, %s)
-            RETURNING id;
+            RETURNING id, date, start_time;
             """,
             (driver_time.driver_id, driver_time.date, driver_time.start_time, driver_time.locations)
         )
-        new_id = cur.fetchone()[0]
-        conn.commit()
+        new_id, date, start_time = await cur.fetchone()
+        await conn.commit()
+        driver_matching.add_slot(*slot_from_row((new_id, driver_time.driver_id, date, start_time, driver_time.locations, *driver)))
+        geocoder.prefetch([driver_time.locations])
         return {"id": new_id, "status": "success"}
     except HTTPException as he:
-        conn.rollback()
+        await conn.rollback()
         raise he
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error adding driver time: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get("/all/times", response_model=List[DriverTimeDetail])
-async def get_all_drivers_times(conn: Connection = Depends(get_db)):
+async def get_all_drivers_times(request: Request, response: Response, conn: Connection = Depends(get_db)):
     """
     Retrieve available time slots for all driver.
+    Answers 304 when the If-None-Match ETag is still current.
 
     Args:
+        request (Request): The incoming request.
+        response (Response): The outgoing response, used to set ETag.
         conn (Connection): The database connection.
 
     Returns:
@@ -394,14 +427,17 @@ async def get_all_drivers_times(conn: Connection = Depends(get_db)):
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        unchanged = await not_modified(conn, request, response, "driver_times", ["drivers"])
+        if unchanged is not None:
+            return unchanged
+        await cur.execute(
             """
             SELECT dt.id, dt.date, dt.start_time, dt.locations, d.driver_name, d.driver_phone
             FROM driver_time dt
             JOIN drivers d ON dt.driver_id = d.id
             """
         )
-        times = cur.fetchall()
+        times = await cur.fetchall()
         logging.info('start create driver time list')
         time_list:List[DriverTimeDetail] = []
         for time in times:
@@ -421,7 +457,7 @@ async def get_all_drivers_times(conn: Connection = Depends(get_db)):
         logging.error("Error fetching driver times: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
 
 
 
@@ -442,11 +478,11 @@ async def get_driver_times(driver_id: int, conn: Connection = Depends(get_db)):
     cur = conn.cursor()
     try:
         # Check if driver_id exists
-        cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_id,))
-        if not cur.fetchone():
+        await cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_id,))
+        if not await cur.fetchone():
             raise HTTPException(status_code=404, detail="司機不存在")
 
-        cur.execute(
+        await cur.execute(
             """
             SELECT dt.id, dt.date, dt.start_time, dt.locations, d.driver_name, d.driver_phone
             FROM driver_time dt
@@ -455,7 +491,7 @@ async def get_driver_times(driver_id: int, conn: Connection = Depends(get_db)):
             """,
             (driver_id,)
         )
-        times = cur.fetchall()
+        times = await cur.fetchall()
         return [
             {
                 "id": time[0],
@@ -473,7 +509,7 @@ async def get_driver_times(driver_id: int, conn: Connection = Depends(get_db)):
         logging.error("Error fetching driver times: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.delete("/time/{id}")
 async def delete_driver_time(id: int, conn: Connection = Depends(get_db)):
@@ -490,28 +526,29 @@ async def delete_driver_time(id: int, conn: Connection = Depends(get_db)):
     cur = conn.cursor()
     try:
         # Check if the time slot exists
-        cur.execute("SELECT id FROM driver_time WHERE id = %s", (id,))
-        if not cur.fetchone():
+        await cur.execute("SELECT id FROM driver_time WHERE id = %s", (id,))
+        if not await cur.fetchone():
             raise HTTPException(status_code=404, detail="時間段不存在")
 
-        cur.execute(
+        await cur.execute(
             """
             DELETE FROM driver_time
             WHERE id = %s
             """,
             (id,)
         )
-        conn.commit()
+        await conn.commit()
+        driver_matching.remove_slot(id)
         return {"status": "success", "message": f"Deleted time slot with ID {id}"}
     except HTTPException as he:
-        conn.rollback()
+        await conn.rollback()
         raise he
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error deleting driver time: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.delete("/drop_agricultural_order/{driver_id}/{order_id}")
 async def delete_received_agricultural_product(driver_id: int, order_id: int, conn: Connection = Depends(get_db)):
@@ -529,15 +566,15 @@ async def delete_received_agricultural_product(driver_id: int, order_id: int, co
     cur = conn.cursor()
     try:
         # Check if the driver exists
-        cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_id,))
-        if not cur.fetchone():
+        await cur.execute("SELECT id FROM drivers WHERE id = %s", (driver_id,))
+        if not await cur.fetchone():
             raise HTTPException(status_code=404, detail="司機不存在")
         # Check if the agricultural order exists
-        cur.execute("SELECT id FROM agricultural_product_order WHERE id = %s", (order_id,))
-        if not cur.fetchone():
+        await cur.execute("SELECT id FROM agricultural_product_order WHERE id = %s", (order_id,))
+        if not await cur.fetchone():
             raise HTTPException(status_code=404, detail="農產品訂單不存在")
         logging.info("Start delete driver order")
-        cur.execute(
+        await cur.execute(
             """
             DELETE FROM driver_orders
             WHERE driver_id = %s and order_id = %s and service = %s
@@ -547,7 +584,7 @@ async def delete_received_agricultural_product(driver_id: int, order_id: int, co
 
         logging.info("Start change status")
         #change agricultural product status from 接單 to 未接單
-        cur.execute(
+        await cur.execute(
             """
             UPDATE agricultural_product_order
             SET status = %s
@@ -555,14 +592,14 @@ async def delete_received_agricultural_product(driver_id: int, order_id: int, co
             """,
             ('未接單', order_id)
         )
-        conn.commit()
+        await conn.commit()
         return {"status": "success", "message": f"Deleted driver agricultural order"}
     except HTTPException as he:
-        conn.rollback()
+        await conn.rollback()
         raise he
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error drop agricultural driver order: %s", str(e))
         raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
     finally:
-        cur.close()
+        await cur.close()
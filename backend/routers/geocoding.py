@@ -0,0 +1,48 @@
+"""
+Geocoding API using FastAPI and PostgreSQL.
+
+This module resolves the free-text place names used by orders, products,
+driver time slots and users to coordinates, so clients do not have to
+geocode them again on every page load.
+
+Endpoints:
+- POST /resolve: Resolve many place names at once.
+"""
+from fastapi import APIRouter, HTTPException, Depends
+from psycopg import AsyncConnection as Connection
+from backend.models.geocoding import ResolveLocationsRequest, ResolveLocationsResponse
+from backend.database import get_db
+from backend.geocoding import geocoder, normalize_place
+import logging
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("/resolve", response_model=ResolveLocationsResponse)
+async def resolve_locations(req: ResolveLocationsRequest, conn: Connection = Depends(get_db)):
+    """
+    Resolve place names to coordinates.
+    Names seen before are answered from the cache or the coordinate table;
+    only new names are sent to a geocoding provider.
+
+    Args:
+        req (ResolveLocationsRequest): Up to 200 place names.
+        conn (Connection): The database connection.
+
+    Returns:
+        ResolveLocationsResponse: Each requested name with its coordinates, or None if unknown.
+    """
+    try:
+        resolved = await geocoder.resolve_many(conn, req.names)
+        results = {}
+        for name in req.names:
+            coordinates = resolved.get(normalize_place(name))
+            results[name] = coordinates.to_dict() if coordinates else None
+        return {"results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error("Error resolving locations: %s", str(e))
+        raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
@@ -0,0 +1,73 @@
+"""
+Driver matching API using FastAPI and PostgreSQL.
+
+This module ranks the drivers whose announced time slots (`driver_time`)
+fit the orders no driver has accepted yet, for both necessities and
+agricultural product orders.
+
+Endpoints:
+- POST /candidates: Ranked driver candidates for many unaccepted orders at once.
+- POST /dispatch: Run the batch dispatcher once over all unaccepted orders.
+"""
+from fastapi import APIRouter, HTTPException, Depends
+from psycopg import AsyncConnection as Connection
+from typing import List
+from backend.models.matching import MatchRequest, OrderMatches, DispatchRequest, DispatchResult
+from backend.database import get_db
+from backend.matching import driver_matching, order_dispatcher
+from backend.matching.dispatcher import DISPATCH_MODES
+import logging
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("/candidates", response_model=List[OrderMatches])
+async def match_orders(req: MatchRequest, conn: Connection = Depends(get_db)):
+    """
+    Rank drivers for unaccepted orders.
+    Orders that are already accepted or do not exist are left out; orders
+    whose places have no coordinates yet get no candidates.
+
+    Args:
+        req (MatchRequest): The orders to match, or none for all unaccepted orders, and the candidates per order.
+        conn (Connection): The database connection.
+
+    Returns:
+        List[OrderMatches]: Each order with its candidates, best first.
+    """
+    for ref in req.orders or []:
+        if ref.service not in ("necessities", "agricultural_product"):
+            raise HTTPException(status_code=400, detail=f"不支援的服務類型: {ref.service}")
+    try:
+        refs = [(ref.service, ref.order_id) for ref in req.orders] if req.orders is not None else None
+        return await driver_matching.match(conn, refs, req.limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error("Error matching orders: %s", str(e))
+        raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
+
+
+@router.post("/dispatch", response_model=DispatchResult)
+async def dispatch_orders(req: DispatchRequest):
+    """
+    Assign all unaccepted orders across drivers once, as the background
+    dispatcher does every interval.
+
+    Args:
+        req (DispatchRequest): 'propose' to record proposals, 'assign' to accept orders for the drivers, and whether to only plan.
+
+    Returns:
+        DispatchResult: Counts of the run and the chosen driver slots.
+    """
+    if req.mode not in DISPATCH_MODES:
+        raise HTTPException(status_code=400, detail=f"不支援的派單模式: {req.mode}")
+    try:
+        return await order_dispatcher.run_once(req.mode, req.dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error("Error dispatching orders: %s", str(e))
+        raise HTTPException(status_code=500, detail="伺服器內部錯誤") from e
@@ -4,61 +4,43 @@ It includes endpoints for creating orders, fetching orders, accepting orders,
 transferring orders, retrieving specific orders, and completing orders.
 Endpoints:
 - POST /: Create a new order.
-- GET /: Get all unaccepted orders.
+- GET /: Get a page of orders, optionally filtered.
+- GET /events: Stream order events (Server-Sent Events).
 - POST /{service}/{order_id}/accept: Accept an order.
 - POST /{order_id}/transfer: Transfer an order to a new driver.
 - GET /{order_id}: Retrieve a specific order by ID.
 - POST /{service}/{order_id}/complete: Complete an order.
 """
 
-from typing import List
+from typing import List, Optional
+import asyncio
+import base64
 import logging
 from datetime import datetime
 import json
-from backend.handlers.send_message import LineMessageService
-from psycopg2.extensions import connection as Connection
-from fastapi import APIRouter, HTTPException, Depends, Request
+from backend.handlers.notification_outbox import enqueue_notification, notification_dispatcher
+from backend.handlers.order_events import publish_order_event, order_event_broker
+from psycopg import AsyncConnection as Connection
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from backend.models.models import Order, DriverOrder, TransferOrderRequest, DetailedOrder
-from backend.database import get_db_connection
+from backend.database import get_db
+from backend.event_log import event_logger
+from backend.conditional import not_modified, request_versions
+from backend.geocoding import geocoder
+from backend.routing import distance_matrix
 import os
 
-line_service = LineMessageService()
 router = APIRouter()
 
-log_dir = os.path.join(os.getcwd(), 'backend', 'logs')
-
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file = os.path.join(log_dir, 'orders.log')
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
+ORDER_EVENTS_HEARTBEAT = float(os.getenv('ORDER_EVENTS_HEARTBEAT', 15))
+ORDER_EVENTS_RETRY_MS = int(os.getenv('ORDER_EVENTS_RETRY_MS', 3000))
 
 logger = logging.getLogger(__name__)
+log_event = event_logger("orders")
 
-def log_event(event_type: str, data: dict):
-    log_data = {
-        "timestamp": datetime.now().isoformat(),
-        "event_type": event_type,
-        "data": data
-    }
-    logger.info(json.dumps(log_data))
 
 
-def get_db():
-    """
-    Dependency function to get a database connection.
-    """
-    conn = get_db_connection()
-    try:
-        yield conn
-    finally:
-        conn.close()
-
 @router.post("/", response_model=Order)
 async def create_order(order: DetailedOrder, conn: Connection = Depends(get_db), request: Request = None):
     """
@@ -83,22 +65,25 @@ async def create_order(order: DetailedOrder, conn: Connection = Depends(get_db),
             "client_ip": request.client.host if request else "N/A"
         })
             
-        cur.execute(
+        await cur.execute(
             "INSERT INTO orders (buyer_id, buyer_name, buyer_phone, seller_id, seller_name, seller_phone, date, time, location, is_urgent, total_price, order_type, order_status, note, shipment_count, required_orders_count, previous_driver_id, previous_driver_name, previous_driver_phone) "
             "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
             (order.buyer_id, order.buyer_name, order.buyer_phone, order.seller_id, order.seller_name, order.seller_phone, order.date,
              order.time, order.location, order.is_urgent, order.total_price, order.order_type, order.order_status, order.note, order.shipment_count, order.required_orders_count, order.previous_driver_id,
              order.previous_driver_name, order.previous_driver_phone)
         )
-        order_id = cur.fetchone()[0]
+        order_id = (await cur.fetchone())[0]
         for item in order.items:
-            cur.execute(
+            await cur.execute(
                 "INSERT INTO order_items (order_id, item_id, item_name, price, quantity, img, location, category) "
                 "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
                 (order_id, item.item_id, item.item_name, item.price, item.quantity, item.img, item.location, item.category)
             )
-        conn.commit()
+        await publish_order_event(cur, "created", "necessities", order_id,
+                                  location=order.location, is_urgent=order.is_urgent)
+        await conn.commit()
         order.id = order_id
+        geocoder.prefetch([order.location, *(item.location for item in order.items)])
         log_event("ORDER_CREATED", {
             "order_id": order_id,
             "buyer_id": order.buyer_id,
@@ -111,101 +96,182 @@ async def create_order(order: DetailedOrder, conn: Connection = Depends(get_db),
             "error": str(e),
             "buyer_id": order.buyer_id
         })
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
+
+# Necessities orders carry their items as a JSON array aggregated in the database,
+# and agricultural orders are merged into the same result set, so the whole list
+# is fetched in a single round-trip regardless of how many orders exist.
+ORDER_LIST_QUERY = """
+    SELECT 'necessities' AS service, o.id, o.buyer_id, o.buyer_name, o.buyer_phone,
+        o.location, o.is_urgent, o.total_price, o.order_type, o.order_status, o.note,
+        o.timestamp, NULL::boolean AS is_put,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'item_id', oi.item_id, 'item_name', oi.item_name, 'price', oi.price,
+                'quantity', oi.quantity, 'img', oi.img, 'location', oi.location,
+                'category', oi.category) ORDER BY oi.id)
+            FROM order_items oi
+            WHERE oi.order_id = o.id
+        ), '[]'::json) AS items
+    FROM orders o
+    UNION ALL
+    SELECT 'agricultural_product' AS service, agri_p_o.id, agri_p_o.buyer_id, agri_p_o.buyer_name,
+        agri_p_o.buyer_phone, agri_p_o.end_point, FALSE, agri_p.price * agri_p_o.quantity,
+        '購買類', agri_p_o.status, agri_p_o.note, agri_p_o.timestamp, agri_p_o.is_put,
+        json_build_array(json_build_object(
+            'item_id', agri_p.id::text, 'item_name', agri_p.name, 'price', agri_p.price,
+            'quantity', agri_p_o.quantity, 'img', agri_p.img_link,
+            'location', agri_p_o.starting_point, 'category', agri_p.category)) AS items
+    FROM agricultural_product_order as agri_p_o
+    JOIN agricultural_produce as agri_p ON agri_p.id = agri_p_o.produce_id
+"""
+
+def order_row_to_dict(row) -> dict:
+    """
+    Convert a row of ORDER_LIST_QUERY into the order payload.
+    Args:
+        row (tuple): The result row.
+    Returns:
+        dict: The order data.
+    """
+    service = row[0]
+    if service == 'necessities':
+        items = [{
+            "item_id": item["item_id"],
+            "item_name": item["item_name"],
+            "price": float(item["price"]),
+            "quantity": int(item["quantity"]),
+            "img": str(item["img"]),
+            "location": str(item["location"]),
+            "category": str(item["category"])} for item in row[13]]
+    else:
+        items = row[13]
+    order = {
+        "id": row[1],
+        "buyer_id": row[2],
+        "buyer_name": row[3],
+        "buyer_phone": row[4],
+        "location": row[5],  # 商品要送達的目的地
+        "is_urgent": bool(row[6]),
+        "total_price": float(row[7]),
+        "order_type": row[8],
+        "order_status": row[9],  # 未接單、已接單、已送達
+        "note": row[10],
+        "timestamp": row[11],
+        "service": service,
+        "items": items
+    }
+    if service == 'agricultural_product':
+        order["is_put"] = row[12]
+    return order
+
+def encode_order_cursor(order: dict) -> str:
+    """
+    Encode the keyset position of an order as an opaque cursor.
+    Args:
+        order (dict): The last order of a page.
+    Returns:
+        str: The cursor for the following page.
+    """
+    position = [order["timestamp"].isoformat(), order["id"], order["service"]]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_order_cursor(cursor: str) -> tuple:
+    """
+    Decode a cursor produced by encode_order_cursor.
+    Args:
+        cursor (str): The opaque cursor.
+    Returns:
+        tuple: The (timestamp, id, service) keyset position.
+    """
+    try:
+        timestamp, order_id, service = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(order_id), str(service)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="無效的分頁游標") from e
 
 @router.get("/", response_model=List[Order])
-async def get_orders(conn: Connection = Depends(get_db), request: Request = None):
+async def get_orders(
+    response: Response,
+    order_status: Optional[str] = None,
+    service: Optional[str] = None,
+    location: Optional[str] = None,
+    is_urgent: Optional[bool] = None,
+    buyer_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    conn: Connection = Depends(get_db),
+    request: Request = None):
     """
-    Get all unaccepted orders.
+    Get orders, newest first, one page at a time.
+    Orders are paginated by keyset on (timestamp, id); when more orders follow,
+    the cursor for the next page is returned in the X-Next-Cursor header.
+    Answers 304 when the If-None-Match ETag is still current.
     Args:
+        response (Response): The outgoing response, used to set X-Next-Cursor and ETag.
+        order_status (str): Only orders with this status, e.g. '未接單'.
+        service (str): Only 'necessities' or 'agricultural_product' orders.
+        location (str): Only orders delivered to this location.
+        is_urgent (bool): Only urgent or non-urgent orders.
+        buyer_id (int): Only orders placed by this buyer.
+        since (datetime): Only orders created at or after this time.
+        until (datetime): Only orders created before this time.
+        cursor (str): The X-Next-Cursor value of the previous page.
+        limit (int): The page size.
         conn (Connection): The database connection.
         request (Request): The incoming request.
     Returns:
-        List[Order]: A list of unaccepted orders.
+        List[Order]: A page of orders.
+    """
+    conditions = []
+    params = []
+    for column, value in (("order_status", order_status), ("service", service), ("location", location),
+                          ("is_urgent", is_urgent), ("buyer_id", buyer_id)):
+        if value is not None:
+            conditions.append(f"feed.{column} = %s")
+            params.append(value)
+    if since is not None:
+        conditions.append("feed.timestamp >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("feed.timestamp < %s")
+        params.append(until)
+    if cursor:
+        conditions.append("(feed.timestamp, feed.id, feed.service) < (%s, %s, %s)")
+        params.extend(decode_order_cursor(cursor))
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    query = f"""
+        SELECT * FROM ({ORDER_LIST_QUERY}) AS feed
+        {where}
+        ORDER BY feed.timestamp DESC, feed.id DESC, feed.service DESC
+        LIMIT %s
     """
+    # One extra row tells whether another page follows.
+    params.append(limit + 1)
+
     cur = conn.cursor()
     try:
         log_event("FETCH_ORDERS_STARTED", {
             "endpoint": str(request.url) if request else "N/A",
             "client_ip": request.client.host if request else "N/A"
         })
-        cur.execute("""
-            SELECT id, buyer_id, buyer_name, buyer_phone, location, is_urgent, total_price, 
-                order_type, order_status, note, timestamp
-            FROM orders
-        """)
-        orders = cur.fetchall()
-        order_list = []
-        for order in orders:
-            cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order[0],))
-            items = cur.fetchall()
-            order_list.append({
-                "id": order[0],
-                "buyer_id": order[1],
-                "buyer_name": order[2], 
-                "buyer_phone": order[3], 
-                "location": order[4],
-                "is_urgent": bool(order[5]),  
-                "total_price": float(order[6]),  
-                "order_type": order[7],
-                "order_status": order[8],
-                "note": order[9],
-                "timestamp": order[10],
-                "service":'necessities',
-                "items": [{
-                    #"order_id": item[1], 
-                    "item_id": item[2], 
-                    "item_name": item[3], 
-                    "price": float(item[4]), 
-                    "quantity": int(item[5]), 
-                    "img": str(item[6]), 
-                    "location": str(item[7]),
-                    "category":str(item[8])} for item in items]  
-            })
-        # Add agricultural_product orders
-        cur.execute("""
-            SELECT agri_p_o.id, agri_p_o.buyer_id, agri_p_o.buyer_name, agri_p_o.buyer_phone, agri_p_o.end_point, agri_p_o.status, agri_p_o.note, 
-                    agri_p.id, agri_p.name, agri_p.price, agri_p_o.quantity, agri_p.img_link, agri_p_o.starting_point, agri_p.category, agri_p_o.is_put,agri_p_o.timestamp
-            FROM agricultural_product_order as agri_p_o
-            JOIN agricultural_produce as agri_p ON agri_p.id = agri_p_o.produce_id
-        """)
-        agri_orders = cur.fetchall()
-        for agri_order in agri_orders:
-            try:
-                total_price = agri_order[9] * agri_order[10] #price*quantity
-            except (ValueError, TypeError) as ve:
-                logging.error(f"Invalid price or quantity for agricultural order {agri_order[0]}: {agri_order[9]}, {agri_order[10]}")
-                raise HTTPException(status_code=500, detail="Invalid price or quantity data.")
-            
-            agri_order_dict = {
-                "id": agri_order[0],
-                "buyer_id": agri_order[1],
-                "buyer_name": agri_order[2],
-                "buyer_phone": agri_order[3],
-                "location":agri_order[4], #商品要送達的目的地
-                "is_urgent": False, 
-                "total_price": total_price,
-                "order_type": '購買類',
-                "order_status": agri_order[5], #未接單、已接單、已送達
-                "note": agri_order[6],
-                "service":'agricultural_product',
-                "items": [{
-                    "item_id": str(agri_order[7]),
-                    "item_name": agri_order[8],
-                    "price": agri_order[9],
-                    "quantity": agri_order[10],
-                    "img": agri_order[11],
-                    "location": agri_order[12], #司機拿取農產品的地方
-                    "category": agri_order[13]
-                }],
-                "is_put": agri_order[14],
-                "timestamp": agri_order[15]
-
-            }
-            order_list.append(agri_order_dict)
+        unchanged = await not_modified(conn, request, response, "orders", ["orders", "products", "locations"])
+        if unchanged is not None:
+            return unchanged
+        await cur.execute(query, params)
+        rows = await cur.fetchall()
+        order_list = [order_row_to_dict(row) for row in rows[:limit]]
+        if len(rows) > limit:
+            response.headers["X-Next-Cursor"] = encode_order_cursor(order_list[-1])
+        versions = await request_versions(conn, request, ["locations"])
+        await distance_matrix.refresh(conn, version=versions.get("locations"))
+        distance_matrix.attach_coordinates(order_list)
+        distance_matrix.attach_distances(order_list)
         log_event("FETCH_ORDERS_SUCCESS", {
             "total_orders": len(order_list)
         })
@@ -217,7 +283,41 @@ async def get_orders(conn: Connection = Depends(get_db), request: Request = None
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
+
+@router.get("/events")
+async def stream_order_events(request: Request, service: Optional[str] = None):
+    """
+    Stream order events as Server-Sent Events.
+    Each event is named after what happened to the order (created, accepted,
+    transferred, completed) and carries a JSON body with the service and
+    order_id. A 'resync' event means events may have been missed and the
+    client should refetch its lists.
+    Args:
+        request (Request): The incoming request.
+        service (str): Only events of 'necessities' or 'agricultural_product' orders.
+    Returns:
+        StreamingResponse: The text/event-stream response.
+    """
+    async def event_stream():
+        async with order_event_broker.subscribe() as queue:
+            yield f"retry: {ORDER_EVENTS_RETRY_MS}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=ORDER_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle stream
+                    yield ": ping\n\n"
+                    continue
+                if service is not None and event.get("service") not in (None, service):
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/{service}/{order_id}/accept")
 async def accept_order(service: str, order_id: int, driver_order: DriverOrder, conn: Connection = Depends(get_db), request: Request = None):
@@ -247,7 +347,7 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
 
         if service == 'necessities':
             # Get order details with items
-            cur.execute("""
+            await cur.execute("""
                 SELECT o.id, o.buyer_id, o.buyer_name, o.buyer_phone, o.location, 
                        o.is_urgent, o.total_price, o.order_type, o.order_status, 
                        o.note, o.timestamp,
@@ -259,7 +359,7 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
                 WHERE o.id = %s
                 FOR UPDATE OF o
             """, (driver_order.driver_id, order_id))
-            order_data = cur.fetchall()
+            order_data = await cur.fetchall()
 
             if not order_data:
                 raise HTTPException(status_code=404, detail="訂單未找到")
@@ -291,17 +391,15 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
             message += "─────────────\n"
             message += f"總計: ${total_price}"
 
-            # Send notification to buyer
-            success = await line_service.send_message_to_user(buyer_id, message)
-            if not success:
-                logger.warning(f"買家 (ID: {buyer_id}) 未綁定 LINE 帳號或發送通知失敗")
+            # Queue notification to buyer; it is sent after the transaction commits
+            await enqueue_notification(cur, buyer_id, message)
 
             # Update order status
-            cur.execute("UPDATE orders SET order_status = %s WHERE id = %s", ('接單', order_id))
+            await cur.execute("UPDATE orders SET order_status = %s WHERE id = %s", ('接單', order_id))
 
         elif service == 'agricultural_product':
             # Get order details with items
-            cur.execute("""
+            await cur.execute("""
                 SELECT o.id, o.buyer_id, o.buyer_name, o.buyer_phone, o.end_point,
                        o.status, o.note, 
                        p.id, p.name, p.price, o.quantity,
@@ -313,7 +411,7 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
                 WHERE o.id = %s 
                 FOR UPDATE OF o
             """, (driver_order.driver_id, order_id))
-            order_data = cur.fetchall()
+            order_data = await cur.fetchall()
 
             if not order_data:
                 raise HTTPException(status_code=404, detail="訂單未找到")
@@ -347,22 +445,28 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
             message += f"總計: ${total_price} 元"
 
 
-            # Send notification to buyer
-            success = await line_service.send_message_to_user(buyer_id, message)
-            if not success:
-                logger.warning(f"買家 (ID: {buyer_id}) 未綁定 LINE 帳號或發送通知失敗")
+            # Queue notification to buyer; it is sent after the transaction commits
+            await enqueue_notification(cur, buyer_id, message)
 
             # Update order status
-            cur.execute("UPDATE agricultural_product_order SET status = %s WHERE id = %s", ('接單', order_id))
+            await cur.execute("UPDATE agricultural_product_order SET status = %s WHERE id = %s", ('接單', order_id))
+
+        # Dispatcher proposals of the order to any driver are settled now
+        await cur.execute(
+            "DELETE FROM driver_orders WHERE order_id = %s AND service = %s AND action = '推薦'",
+            (order_id, service)
+        )
 
         # Insert driver_orders record
-        cur.execute(
+        await cur.execute(
             "INSERT INTO driver_orders (driver_id, order_id, action, timestamp, previous_driver_id, previous_driver_name, previous_driver_phone, service) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
             (driver_order.driver_id, order_id, '接單', driver_order.timestamp, driver_order.previous_driver_id, 
              driver_order.previous_driver_name, driver_order.previous_driver_phone, driver_order.service)
         )
+        await publish_order_event(cur, "accepted", service, order_id, driver_id=driver_order.driver_id)
 
-        conn.commit()
+        await conn.commit()
+        notification_dispatcher.wake()
         log_event("ORDER_ACCEPTED", {
             "order_id": order_id,
             "driver_id": driver_order.driver_id,
@@ -372,7 +476,7 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
         return {"status": "success", "message": f"訂單 {order_id} 已成功被接受"}
 
     except HTTPException as e:
-        conn.rollback()
+        await conn.rollback()
         if e.status_code == 400:
             logging.error("訂單已被接")
             log_event("ORDER_ACCEPTANCE_FAILED", {
@@ -391,7 +495,7 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
             })
         raise e
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("ORDER_ACCEPTANCE_ERROR", {
             "order_id": order_id,
             "driver_id": driver_order.driver_id,
@@ -400,7 +504,7 @@ async def accept_order(service: str, order_id: int, driver_order: DriverOrder, c
         })
         raise HTTPException(status_code=500, detail="伺服器內部錯誤，請稍後再試") from e
     finally:
-        cur.close()
+        await cur.close()
 
 
 @router.post("/{order_id}/transfer")
@@ -427,11 +531,11 @@ async def transfer_order(order_id: int, transfer_request: TransferOrderRequest,
         })
 
         # Get current driver details
-        cur.execute(
+        await cur.execute(
             "SELECT driver_name, driver_phone FROM drivers WHERE id = %s",
             (transfer_request.current_driver_id,)
         )
-        current_driver = cur.fetchone()
+        current_driver = await cur.fetchone()
         if not current_driver:
             raise HTTPException(status_code=404, detail="找不到原始司機資訊")
         
@@ -440,8 +544,8 @@ async def transfer_order(order_id: int, transfer_request: TransferOrderRequest,
 
         
         # Find new driver by phone
-        cur.execute("SELECT id, user_id, driver_name, driver_phone FROM drivers WHERE driver_phone = %s", (transfer_request.new_driver_phone,))
-        new_driver = cur.fetchone()
+        await cur.execute("SELECT id, user_id, driver_name, driver_phone FROM drivers WHERE driver_phone = %s", (transfer_request.new_driver_phone,))
+        new_driver = await cur.fetchone()
 
         if not new_driver:
             raise HTTPException(status_code=404, detail="新司機未註冊")
@@ -451,40 +555,42 @@ async def transfer_order(order_id: int, transfer_request: TransferOrderRequest,
             raise HTTPException(status_code=400, detail="不能將訂單轉給自己")
 
         if new_driver:
-            # Send notification to new driver
+            # Queue notification to new driver; it is sent after the transaction commits
             notification_message = (
                 f"您有一筆新的轉單訂單 (訂單編號: {order_id})\n"
                 f"轉單來自司機: {current_driver_name}\n"
                 f"聯絡電話: {current_driver_phone}"
             )
             
-            success = await line_service.send_message_to_user(
+            await enqueue_notification(
+                cur,
                 new_driver[1],  # new_driver[1]=user_id
                 notification_message
             )
-            if not success:
-                logger.warning(f"司機 (ID: {new_driver[1]}) 未綁定 LINE 帳號或發送通知失敗")
 
         # Ensure current driver is assigned to the order
-        cur.execute("SELECT driver_id FROM driver_orders WHERE order_id = %s AND action = '接單' FOR UPDATE", (order_id,))
-        order = cur.fetchone()
+        await cur.execute("SELECT driver_id, service FROM driver_orders WHERE order_id = %s AND action = '接單' FOR UPDATE", (order_id,))
+        order = await cur.fetchone()
         if not order or order[0] != transfer_request.current_driver_id:
             raise HTTPException(status_code=400, detail="當前司機無法轉交此訂單")
 
         # Get current driver details again for logging
-        cur.execute("SELECT driver_name, driver_phone FROM drivers WHERE id = %s", (transfer_request.current_driver_id,))
-        current_driver = cur.fetchone()
+        await cur.execute("SELECT driver_name, driver_phone FROM drivers WHERE id = %s", (transfer_request.current_driver_id,))
+        current_driver = await cur.fetchone()
         
         # Update driver_orders with new driver details
-        cur.execute(
+        await cur.execute(
             "UPDATE driver_orders SET driver_id = %s, previous_driver_id = %s, previous_driver_name = %s, "
             "previous_driver_phone = %s WHERE order_id = %s AND driver_id = %s AND action = '接單'", 
             (new_driver_id, transfer_request.current_driver_id, current_driver[0], current_driver[1], order_id, transfer_request.current_driver_id)
         )
-        conn.commit()
+        await publish_order_event(cur, "transferred", order[1], order_id,
+                                  driver_id=new_driver_id, previous_driver_id=transfer_request.current_driver_id)
+        await conn.commit()
+        notification_dispatcher.wake()
         return {"status": "success", "message": "訂單已成功轉移給新司機"}
     except HTTPException as e:
-        conn.rollback()
+        await conn.rollback()
         if e.status_code == 400:
             logging.error("當前司機無法轉交此訂單")
             log_event("ORDER_TRANSFER_FAILED", {
@@ -503,7 +609,7 @@ async def transfer_order(order_id: int, transfer_request: TransferOrderRequest,
             })
         raise e
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("ORDER_TRANSFER_ERROR", {
             "order_id": order_id,
             "current_driver_id": transfer_request.current_driver_id,
@@ -512,7 +618,7 @@ async def transfer_order(order_id: int, transfer_request: TransferOrderRequest,
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get("/{order_id}")
 async def get_order(order_id: int, conn: Connection = Depends(get_db), request: Request = None):
@@ -532,13 +638,13 @@ async def get_order(order_id: int, conn: Connection = Depends(get_db), request:
             "endpoint": str(request.url) if request else "N/A",
             "client_ip": request.client.host if request else "N/A"
         })
-        cur.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
-        order = cur.fetchone()
+        await cur.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
+        order = await cur.fetchone()
         if not order:
             raise HTTPException(status_code=404, detail="訂單不存在")
 
-        cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
-        items = cur.fetchall()
+        await cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
+        items = await cur.fetchall()
 
         order_data = {
             "id": order[0],
@@ -564,6 +670,9 @@ async def get_order(order_id: int, conn: Connection = Depends(get_db), request:
             "items": [{"order_id": item[1], "item_id": item[2], "item_name": item[3], "price": float(item[4]), "quantity": int(item[5]), 
                        "img": str(item[6]),"location": str(item[7]),"category":str(item[8])} for item in items]
         }
+        await geocoder.attach_coordinates(conn, [order_data])
+        await distance_matrix.refresh(conn)
+        distance_matrix.attach_distances([order_data])
         log_event("FETCH_ORDER_SUCCESS", {
             "order_id": order_id,
             "status": "success"
@@ -582,7 +691,7 @@ async def get_order(order_id: int, conn: Connection = Depends(get_db), request:
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 
 @router.post("/{service}/{order_id}/complete")
@@ -608,7 +717,7 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
         
         if service == 'necessities':
             # Check if order exists and get driver info
-            cur.execute("""
+            await cur.execute("""
                 SELECT 
                     o.id, o.buyer_id, o.buyer_name, o.buyer_phone, 
                     o.seller_id, o.seller_name, o.seller_phone,
@@ -618,11 +727,11 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
                     d.driver_phone as driver_phone
                 FROM orders o
                 LEFT JOIN order_items oi ON o.id = oi.order_id
-                LEFT JOIN driver_orders dro ON o.id = dro.order_id AND dro.service = 'necessities'
+                LEFT JOIN driver_orders dro ON o.id = dro.order_id AND dro.service = 'necessities' AND dro.action = '接單'
                 LEFT JOIN drivers d ON dro.driver_id = d.id
                 WHERE o.id = %s
             """, (order_id,))
-            order_data = cur.fetchall()
+            order_data = await cur.fetchall()
             
             if not order_data:
                 raise HTTPException(status_code=404, detail="訂單不存在")
@@ -654,21 +763,20 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
             message += "─────────────\n"
             message += f"總計: ${total_price} 元"
             
-            success = await line_service.send_message_to_user(buyer_id, message)
-            if not success:
-                logger.warning(f"買家 (ID: {buyer_id}) 未綁定 LINE 帳號或發送通知失敗")
+            # Queue notification to buyer; it is sent after the transaction commits
+            await enqueue_notification(cur, buyer_id, message)
             
-            cur.execute("UPDATE orders SET order_status = '已完成' WHERE id = %s", (order_id,))
+            await cur.execute("UPDATE orders SET order_status = '已完成' WHERE id = %s", (order_id,))
             
-            cur.execute("""
+            await cur.execute("""
                 UPDATE driver_orders dro
                 SET action = '完成'
-                WHERE order_id = %s and service = %s
+                WHERE order_id = %s and service = %s AND action = '接單'
             """, (order_id, 'necessities'))
             
         elif service == 'agricultural_product':
             # Check if order exists and get driver info
-            cur.execute("""
+            await cur.execute("""
                 SELECT 
                     o.id, o.buyer_id, o.buyer_name, o.buyer_phone,
                     o.end_point, o.status, o.is_put,
@@ -677,11 +785,11 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
                     d.driver_phone as driver_phone
                 FROM agricultural_product_order o
                 LEFT JOIN agricultural_produce p ON p.id = o.produce_id
-                LEFT JOIN driver_orders dro ON o.id = dro.order_id AND dro.service = 'agricultural_product'
+                LEFT JOIN driver_orders dro ON o.id = dro.order_id AND dro.service = 'agricultural_product' AND dro.action = '接單'
                 LEFT JOIN drivers d ON dro.driver_id = d.id
                 WHERE o.id = %s
             """, (order_id,))
-            order_data = cur.fetchall()
+            order_data = await cur.fetchall()
             
             if not order_data:
                 raise HTTPException(status_code=404, detail="訂單不存在")
@@ -711,19 +819,20 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
             message += "─────────────\n"
             message += f"總計: ${total_price} 元"
             
-            success = await line_service.send_message_to_user(buyer_id, message)
-            if not success:
-                logger.warning(f"買家 (ID: {buyer_id}) 未綁定 LINE 帳號或發送通知失敗")
+            # Queue notification to buyer; it is sent after the transaction commits
+            await enqueue_notification(cur, buyer_id, message)
             
-            cur.execute("UPDATE agricultural_product_order SET status = '已送達' WHERE id = %s", (order_id,))
+            await cur.execute("UPDATE agricultural_product_order SET status = '已送達' WHERE id = %s", (order_id,))
             
-            cur.execute("""
+            await cur.execute("""
                 UPDATE driver_orders dro
                 SET action = '完成'
-                WHERE order_id = %s and service = %s
+                WHERE order_id = %s and service = %s AND action = '接單'
             """, (order_id, 'agricultural_product'))
-        
-        conn.commit()
+
+        await publish_order_event(cur, "completed", service, order_id)
+        await conn.commit()
+        notification_dispatcher.wake()
         log_event("ORDER_COMPLETED", {
             "order_id": order_id,
             "service": service,
@@ -732,7 +841,7 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
         return {"status": "success", "message": "訂單已完成"}
         
     except HTTPException as e:
-        conn.rollback()
+        await conn.rollback()
         if e.status_code == 400:
             logging.error("訂單狀態不正確，無法完成訂單")
             log_event("ORDER_COMPLETION_FAILED", {
@@ -754,7 +863,7 @@ async def complete_order(service: str, order_id: int, conn: Connection = Depends
             "service": service,
             "error": str(e)
         })
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
@@ -2,10 +2,11 @@
 Seller management API using FastAPI and PostgreSQL.
 
 This module provides endpoints to create and retrieve seller information.
-It uses FastAPI for defining the API routes and psycopg2 for database interactions.
+It uses FastAPI for defining the API routes and psycopg (async) for database interactions.
 
 Endpoints:
 - POST /upload_image: Upload photo which is base 64 data
+- POST /upload_image/file: Upload photo as a multipart file
 - POST /: Upload item
 - GET /{sellerId}: Get seller's product information with {sellerId}
 - GET /product/{productId}: Get seller's product information with {productId}
@@ -14,14 +15,25 @@ Endpoints:
 - DELETE /{productId}: Delete product with {productId}.
 - PATCH /product/offshelf_date/{productId}: Update offshelf date with id {productId}
 """
-from fastapi import APIRouter, HTTPException, Depends, Request
-from psycopg2.extensions import connection as Connection
+from fastapi import APIRouter, HTTPException, Depends, Request, UploadFile, File
+from psycopg import AsyncConnection as Connection
 from backend.models.seller import UploadImageResponse, UploadImageRequset, UploadItemRequest, ProductBasicInfo, ProductInfo, ProductOrderInfo, IsPutRequest, UpdateOffShelfDateRequest
-from backend.database import get_db_connection
+from backend.database import get_db
+from backend.event_log import event_logger
+from backend.geocoding import geocoder
+from backend.images import (
+    ImageStorageError,
+    ImageTooLargeError,
+    detect_content_type,
+    get_image_storage,
+    max_base64_length,
+    read_upload,
+    save_image,
+)
+from PIL import Image, UnidentifiedImageError
 from dotenv import load_dotenv
-import os
-import requests
-import json
+import base64
+import binascii
 import logging
 import datetime
 from typing import List
@@ -29,45 +41,69 @@ from typing import List
 router = APIRouter()
 load_dotenv()
 
-log_dir = os.path.join(os.getcwd(), 'backend', 'logs')
-
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file = os.path.join(log_dir, 'sellers.log')
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
-
-
 logger = logging.getLogger(__name__)
+log_event = event_logger("sellers")
 
-def log_event(event_type: str, data: dict):
-    log_data = {
-        "timestamp": datetime.datetime.now().isoformat(),
-        "event_type": event_type,
-        "data": data
-    }
-    logger.info(json.dumps(log_data))
 
-def get_db():
+async def store_image(data: bytes, conn: Connection):
     """
-    Get a database connection.
-    
-    Yields:
-        psycopg2.extensions.connection: A PostgreSQL database connection.
+    Store validated image bytes and their variants with the configured storage backend.
+
+    Args:
+        data (bytes): The decoded image.
+        conn (Connection): The database connection.
+
+    Returns:
+        dict: The image ID, link and variant links.
     """
-    conn = get_db_connection()
+    content_type = detect_content_type(data)
+    if content_type is None:
+        log_event("IMAGE_UPLOAD_FAILED", {
+            "status_code": 415,
+            "error": "Unsupported image format"
+        })
+        raise HTTPException(status_code=415, detail="上傳的檔案非圖片")
+
+    cur = conn.cursor()
     try:
-        yield conn
+        img_id, img_link, variants, reused = await save_image(cur, data, content_type)
+        await conn.commit()
+    except ImageStorageError as e:
+        await conn.rollback()
+        log_event("IMAGE_UPLOAD_FAILED", {
+            "status_code": e.status_code,
+            "error": e.detail
+        })
+        raise HTTPException(status_code=e.status_code, detail=e.detail) from e
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        await conn.rollback()
+        log_event("IMAGE_UPLOAD_FAILED", {
+            "status_code": 415,
+            "error": str(e)
+        })
+        raise HTTPException(status_code=415, detail="上傳的檔案非圖片") from e
+    except Exception as e:
+        await conn.rollback()
+        log_event("IMAGE_UPLOAD_ERROR", {
+            "error": str(e)
+        })
+        raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        conn.close()
+        await cur.close()
+
+    log_event("IMAGE_UPLOADED", {
+        "img_id": img_id,
+        "reused": reused,
+        "status": "success"
+    })
+    return {
+        "img_id": img_id,
+        "img_link": img_link,
+        "variants": variants
+    }
 
 @router.post("/upload_image", response_model=UploadImageResponse)
-async def upload_image(request: UploadImageRequset, req: Request):
+async def upload_image(request: UploadImageRequset, req: Request, conn: Connection = Depends(get_db)):
     """
     Upload photo which is base 64 data
 
@@ -78,49 +114,47 @@ async def upload_image(request: UploadImageRequset, req: Request):
     Returns:
         dict: The image data.
     """
-    logging.info(f"Received request: {req.method} {req.url} Headers: {req.headers}")
-    api_key = os.environ.get('IMGBB_API_KEY')
-    if not api_key:
-        raise HTTPException(status_code=500, detail="IMGBB_API_KEY not set")
-    url = "https://api.imgbb.com/1/upload"
     img = request.img
 
     if img.startswith('data:image'):
-        img = img.split(',')[1]
+        img = img.split(',', 1)[1]
+
+    log_event("IMAGE_UPLOAD_STARTED", {
+        "image_size": len(img) if img else 0
+    })
+    # Reject oversized payloads before spending time and memory on decoding
+    if len(img) > max_base64_length():
+        raise HTTPException(status_code=413, detail="圖片檔案過大")
+    try:
+        data = base64.b64decode(img, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise HTTPException(status_code=400, detail="圖片格式錯誤") from e
+    del img
+    return await store_image(data, conn)
+
+@router.post("/upload_image/file", response_model=UploadImageResponse)
+async def upload_image_file(file: UploadFile = File(...), conn: Connection = Depends(get_db)):
+    """
+    Upload photo as a multipart file
 
+    Args:
+        file(UploadFile): The photo file
+        conn(Connection): The database connection.
+
+    Returns:
+        dict: The image data.
+    """
+    log_event("IMAGE_UPLOAD_STARTED", {
+        "filename": file.filename,
+        "content_type": file.content_type
+    })
     try:
-        import base64
-        base64.b64decode(img, validate=True)  
-        log_event("IMAGE_UPLOAD_STARTED", {
-            "image_size": len(img) if img else 0
-        })
-        response = requests.post(url, data={
-            'key': api_key,
-            'image': img
-        })
-        response_data = response.json()
-        logging.info(f"ImgBB API response: {response.text}")
-        if response.status_code == 200 and response_data.get("data"):
-            log_event("IMAGE_UPLOADED", {
-                "img_id": response_data["data"]["id"],
-                "status": "success"
-            })
-            return {
-                "img_id": response_data["data"]["id"],
-                "img_link": response_data["data"]["url"]
-            }
-        else:
-            error_msg = response_data.get("error", {}).get("message", "Unknown ImgBB API error")
-            log_event("IMAGE_UPLOAD_FAILED", {
-                "status_code": response.status_code,
-                "error": error_msg
-            })
-            raise HTTPException(status_code=response.status_code, detail=f"ImgBB API error: {error_msg}")
-    except requests.RequestException as e:
-        log_event("IMAGE_UPLOAD_ERROR", {
-            "error": f"Network error: {str(e)}"
-        })
-        raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
+        data = await read_upload(file)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail="圖片檔案過大") from e
+    finally:
+        await file.close()
+    return await store_image(data, conn)
 
 @router.post('/')
 async def upload_item(req: UploadItemRequest, conn: Connection = Depends(get_db)):
@@ -146,12 +180,13 @@ async def upload_item(req: UploadItemRequest, conn: Connection = Depends(get_db)
             "quantity": req.total_quantity
         })
 
-        cur.execute(
+        await cur.execute(
             """INSERT INTO agricultural_produce (name, price, total_quantity, category, upload_date, off_shelf_date, img_link, img_id, seller_id, unit, location) 
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
             (req.name, req.price, req.total_quantity, req.category, str(datetime.date.today()), req.off_shelf_date, req.img_link, req.img_id, req.seller_id, req.unit, req.location)
         )
-        conn.commit()
+        await conn.commit()
+        geocoder.prefetch([req.location])
         log_event("ITEM_UPLOADED", {
             "seller_id": req.seller_id,
             "name": req.name,
@@ -160,7 +195,7 @@ async def upload_item(req: UploadItemRequest, conn: Connection = Depends(get_db)
         })
         return "item create successfully"
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("ITEM_UPLOAD_ERROR", {
             "seller_id": req.seller_id,
             "name": req.name,
@@ -168,7 +203,7 @@ async def upload_item(req: UploadItemRequest, conn: Connection = Depends(get_db)
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get('/{sellerId}', response_model=List[ProductBasicInfo])
 async def get_seller_item(sellerId: int, conn: Connection=Depends(get_db)):
@@ -185,9 +220,9 @@ async def get_seller_item(sellerId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Get user  whose id is %s uploaded product information.", sellerId)
-        cur.execute("SELECT id, name, upload_date, off_shelf_date FROM agricultural_produce WHERE seller_id = %s", (sellerId,))
+        await cur.execute("SELECT id, name, upload_date, off_shelf_date FROM agricultural_produce WHERE seller_id = %s", (sellerId,))
 
-        products = cur.fetchall()
+        products = await cur.fetchall()
         logging.info('start create product list')
         product_list:List[ProductBasicInfo] = []
         for product in products:
@@ -199,11 +234,11 @@ async def get_seller_item(sellerId: int, conn: Connection=Depends(get_db)):
             })
         return product_list
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.get('/product/{productId}', response_model=ProductInfo)
 async def get_product_info(productId: int, conn: Connection=Depends(get_db)):
@@ -220,11 +255,11 @@ async def get_product_info(productId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Get item information with id is %s.", productId)
-        cur.execute(
+        await cur.execute(
             """SELECT id, name, price, category, total_quantity, upload_date, off_shelf_date, img_link, img_id, unit, location
             FROM agricultural_produce WHERE id = %s""", (productId,))
  
-        product = cur.fetchone()
+        product = await cur.fetchone()
         _product = {
             "id":product[0],
             "name": product[1],
@@ -240,11 +275,11 @@ async def get_product_info(productId: int, conn: Connection=Depends(get_db)):
         }
         return _product
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 
 @router.get('/product/order/{productId}', response_model=List[ProductOrderInfo])
@@ -262,13 +297,13 @@ async def get_product_order(productId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Get orders of item with id %s.", productId)
-        cur.execute(
+        await cur.execute(
             """SELECT o.id, o.buyer_name, o.quantity, produce.price, o.status, o.timestamp, o.is_put
             FROM agricultural_product_order as o
             JOIN agricultural_produce as produce ON o.produce_id=produce.id
             WHERE produce_id = %s""", (productId,))
 
-        items = cur.fetchall()
+        items = await cur.fetchall()
         logging.info('start create product order list')
         item_order_list:List[ProductOrderInfo] = []
         for item in items:
@@ -283,11 +318,11 @@ async def get_product_order(productId: int, conn: Connection=Depends(get_db)):
             })
         return item_order_list
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.post('/agricultural_product/is_put')
 async def check_is_put(req: IsPutRequest, conn = Depends(get_db)):
@@ -306,31 +341,32 @@ async def check_is_put(req: IsPutRequest, conn = Depends(get_db)):
             "order_ids": req.order_ids
         })
 
-        for id in req.order_ids:
-            # Check if order exists
-            cur.execute("SELECT * FROM agricultural_product_order WHERE id = %s", (id,))
-            order = cur.fetchone()
-            if not order:
-                raise HTTPException(status_code=404, detail="訂單不存在")
-            
-            # Update the order status
-            cur.execute("UPDATE agricultural_product_order SET is_put = %s WHERE id = %s", (True, id,))
-    
-        conn.commit()
+        order_ids = list(set(req.order_ids))
+        await cur.execute(
+            "UPDATE agricultural_product_order SET is_put = %s WHERE id = ANY(%s) RETURNING id",
+            (True, order_ids)
+        )
+        if len(await cur.fetchall()) != len(order_ids):
+            raise HTTPException(status_code=404, detail="訂單不存在")
+
+        await conn.commit()
         log_event("PRODUCT_PUT_CHECKED", {
             "order_ids": req.order_ids,
             "status": "success"
         })
         return {"status": "success", "message": "訂單已放置"}
+    except HTTPException as e:
+        await conn.rollback()
+        raise e
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         log_event("PRODUCT_PUT_CHECK_ERROR", {
             "order_ids": req.order_ids,
             "error": str(e)
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 @router.delete('/{productId}')
 async def delete_agri_product(productId: int, conn: Connection=Depends(get_db)):
     """
@@ -346,17 +382,17 @@ async def delete_agri_product(productId: int, conn: Connection=Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Delete product with id %s.", productId)
-        cur.execute(
+        await cur.execute(
             """DELETE FROM agricultural_produce
             WHERE id = %s""", (productId, ))
-        conn.commit()
+        await conn.commit()
         return {"success":"delete"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.patch("/product/offshelf_date/{productId}")
 async def update_offshelf_date(productId: int, req: UpdateOffShelfDateRequest, conn: Connection = Depends(get_db)):
@@ -373,21 +409,21 @@ async def update_offshelf_date(productId: int, req: UpdateOffShelfDateRequest, c
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             "UPDATE agricultural_produce SET off_shelf_date = %s WHERE id = %s",
             ( req.date, productId )
         )
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Item not found")
         
-        conn.commit()
+        await conn.commit()
         return {"status": "success"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error updating user nearest location: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 
 
@@ -2,7 +2,7 @@
 User management API using FastAPI and PostgreSQL.
 
 This module provides endpoints to create and retrieve user information.
-It uses FastAPI for defining the API routes and psycopg2 for database interactions.
+It uses FastAPI for defining the API routes and psycopg (async) for database interactions.
 
 Endpoints:
 - POST /login: Login user by phone number.
@@ -14,57 +14,24 @@ Endpoints:
 """
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from psycopg2.extensions import connection as Connection
+from psycopg import AsyncConnection as Connection
 from backend.models.user import User, UpdateLocationRequest, LineBindingRequest
-from backend.database import get_db_connection
+from backend.database import get_db
+from backend.event_log import event_logger
+from backend.handlers.send_message import line_user_id_cache
+from backend.geocoding import geocoder
+from backend.matching import driver_matching
 import logging
-import json
-from datetime import datetime
-import os
-
-
-log_dir = os.path.join(os.getcwd(), 'backend', 'logs')
-
-
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-# Set up logging
-log_file = os.path.join(log_dir, 'users.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
 
 
 logger = logging.getLogger(__name__)
-
-def log_event(event_type: str, data: dict):
-    log_data = {
-        "timestamp": datetime.now().isoformat(),
-        "event_type": event_type,
-        "data": data
-    }
-    logger.info(json.dumps(log_data))
+log_event = event_logger("users")
 
 class LoginRequest(BaseModel):
     phone: str
 
 router = APIRouter()
 
-def get_db():
-    """
-    Get a database connection.
-    
-    Yields:
-        psycopg2.extensions.connection: A PostgreSQL database connection.
-    """
-    conn = get_db_connection()
-    try:
-        yield conn
-    finally:
-        conn.close()
 
 @router.post("/login", response_model=User)
 async def login(request: LoginRequest, conn: Connection = Depends(get_db)):
@@ -86,8 +53,8 @@ async def login(request: LoginRequest, conn: Connection = Depends(get_db)):
     try:
         phone = request.phone
         logging.info("Logging in user with phone number %s", phone)
-        cur.execute("SELECT id, name, phone, location, is_driver FROM users WHERE phone = %s", (phone,))
-        user = cur.fetchone()
+        await cur.execute("SELECT id, name, phone, location, is_driver FROM users WHERE phone = %s", (phone,))
+        user = await cur.fetchone()
         if not user:
             logging.warning("User with phone number %s not found", phone)
             raise HTTPException(status_code=404, detail="User not found")
@@ -105,7 +72,7 @@ async def login(request: LoginRequest, conn: Connection = Depends(get_db)):
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.post("/", response_model=User)
 async def create_user(user: User, conn: Connection = Depends(get_db)):
@@ -122,20 +89,20 @@ async def create_user(user: User, conn: Connection = Depends(get_db)):
     cur = conn.cursor()
     try:
         logging.info("Checking if user with phone number %s already exists", user.phone)
-        cur.execute("SELECT id FROM users WHERE phone = %s", (user.phone,))
-        existing_user = cur.fetchone()
+        await cur.execute("SELECT id FROM users WHERE phone = %s", (user.phone,))
+        existing_user = await cur.fetchone()
         if existing_user:
             logging.warning("User with phone number %s already exists", user.phone)
             # phonenumber already exists
             raise HTTPException(status_code=409, detail=f"電話號碼 {user.phone} 已存在，請更換電話號碼")
         
         logging.info("Inserting new user with name %s and phone %s", user.name, user.phone)
-        cur.execute(
+        await cur.execute(
             "INSERT INTO users (name, phone, location,is_driver) VALUES (%s, %s, %s, %s) RETURNING id",
             (user.name, user.phone, '未選擇', False)
         )
-        user_id = cur.fetchone()[0]
-        conn.commit()
+        user_id = (await cur.fetchone())[0]
+        await conn.commit()
         log_event("USER_REGISTRATION_STARTED", {
             "name": user.name,
             "phone": user.phone
@@ -149,7 +116,7 @@ async def create_user(user: User, conn: Connection = Depends(get_db)):
         })
         return {**user.dict(), "id": user_id}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error occurred: %s", str(e))
         log_event("USER_REGISTRATION_ERROR", {
             "name": user.name,
@@ -158,7 +125,7 @@ async def create_user(user: User, conn: Connection = Depends(get_db)):
         })
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.post("/bind-line", response_model=dict)
 async def bind_line_account(request: LineBindingRequest, conn: Connection = Depends(get_db)):
@@ -168,23 +135,24 @@ async def bind_line_account(request: LineBindingRequest, conn: Connection = Depe
     cur = conn.cursor()
     try:
         # Check if user exists
-        cur.execute("SELECT id FROM users WHERE id = %s", (request.user_id,))
-        user = cur.fetchone()
+        await cur.execute("SELECT id FROM users WHERE id = %s", (request.user_id,))
+        user = await cur.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Check if LINE account is already bound to another user
-        cur.execute("SELECT id FROM users WHERE line_user_id = %s", (request.line_user_id,))
-        existing_binding = cur.fetchone()
+        await cur.execute("SELECT id FROM users WHERE line_user_id = %s", (request.line_user_id,))
+        existing_binding = await cur.fetchone()
         if existing_binding:
             raise HTTPException(status_code=409, detail="LINE account already bound to another user")
         
         # Update user with LINE account
-        cur.execute(
+        await cur.execute(
             "UPDATE users SET line_user_id = %s WHERE id = %s",
             (request.line_user_id, request.user_id)
         )
-        conn.commit()
+        await conn.commit()
+        line_user_id_cache.invalidate(request.user_id)
         
         log_event("LINE_ACCOUNT_BINDING", {
             "user_id": request.user_id,
@@ -193,11 +161,11 @@ async def bind_line_account(request: LineBindingRequest, conn: Connection = Depe
         
         return {"status": "success", "message": "LINE account bound successfully"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error binding LINE account: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 
 
@@ -215,8 +183,8 @@ async def get_user(user_id: int, conn: Connection = Depends(get_db)):
     """
     cur = conn.cursor()
     try:
-        cur.execute("SELECT id, name, phone, location , is_driver FROM users WHERE id = %s", (user_id,))
-        user = cur.fetchone()
+        await cur.execute("SELECT id, name, phone, location , is_driver FROM users WHERE id = %s", (user_id,))
+        user = await cur.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         return {"id": user[0], "name": user[1], "phone": user[2], "location":user[3], "is_driver": user[4]}
@@ -224,7 +192,7 @@ async def get_user(user_id: int, conn: Connection = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.patch("/location/{userId}")
 async def update_nearest_location(userId: str, req: UpdateLocationRequest, conn: Connection = Depends(get_db)):
@@ -241,21 +209,23 @@ async def update_nearest_location(userId: str, req: UpdateLocationRequest, conn:
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             "UPDATE users SET location = %s WHERE id = %s",
             ( req.location, userId )
         )
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="User not found")
         
-        conn.commit()
+        await conn.commit()
+        driver_matching.set_home(int(userId), req.location)
+        geocoder.prefetch([req.location])
         return {"status": "success"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         logging.error("Error updating user nearest location: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e)) from e
     finally:
-        cur.close()
+        await cur.close()
 
 @router.patch("/driver/{user_id}", response_model=dict)
 async def update_is_driver(user_id: int, conn: Connection = Depends(get_db)):
@@ -264,16 +234,16 @@ async def update_is_driver(user_id: int, conn: Connection = Depends(get_db)):
     """
     cur = conn.cursor()
     try:
-        cur.execute(
+        await cur.execute(
             "UPDATE users SET is_driver = TRUE WHERE id = %s", (user_id,)
         )
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="User not found")
 
-        conn.commit()
+        await conn.commit()
         return {"status": "success"}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating user to driver: {str(e)}") from e
     finally:
-        cur.close()
+        await cur.close()
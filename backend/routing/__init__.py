@@ -0,0 +1,12 @@
+"""
+Route planning for drivers.
+
+`distance` computes great-circle distance matrices with NumPy, `matrix`
+keeps the persisted distances and travel times between all known places,
+`solver` orders stops under pickup-before-dropoff constraints and `planner`
+builds the stops of a driver's orders and returns the planned route.
+"""
+from backend.routing.distance import EARTH_RADIUS_M, haversine_matrix
+from backend.routing.matrix import DistanceMatrix, distance_matrix, travel_seconds
+from backend.routing.solver import plan_stops, route_cost
+from backend.routing.planner import Stop, order_stops, plan_route
@@ -0,0 +1,29 @@
+"""
+Vectorized great-circle distances between coordinates.
+"""
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_matrix(lat, lng, lat2=None, lng2=None) -> np.ndarray:
+    """
+    Pairwise great-circle distances in meters, computed in one NumPy pass.
+
+    Args:
+        lat, lng (array-like): Coordinates of the row points, in degrees.
+        lat2, lng2 (array-like): Coordinates of the column points; the row
+            points when omitted, giving a square symmetric matrix.
+
+    Returns:
+        np.ndarray: float64 matrix of shape (len(lat), len(lat2)).
+    """
+    phi1 = np.radians(np.asarray(lat, dtype=np.float64))[:, None]
+    lam1 = np.radians(np.asarray(lng, dtype=np.float64))[:, None]
+    if lat2 is None:
+        phi2, lam2 = phi1.T, lam1.T
+    else:
+        phi2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+        lam2 = np.radians(np.asarray(lng2, dtype=np.float64))[None, :]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
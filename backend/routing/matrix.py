@@ -0,0 +1,415 @@
+"""
+Pairwise distance and travel-time matrix over every geocoded place.
+
+Pickup points (seller and supermarket locations) and destinations are a
+small, stable set, so their distances are computed once and kept in two
+float32 NumPy matrices indexed by normalized place name. Lookups are a dict
+access plus an array index. The matrix grows in place when this process
+geocodes a new place (see `GeocodingService.subscribe`) and catches up with
+places resolved by other workers from `location_coordinates`, checking the
+`locations` resource version at most every ROUTE_MATRIX_REFRESH seconds,
+or as soon as a list endpoint's ETag shows it moved.
+It is persisted to ROUTE_MATRIX_PATH (.npz) so a restart only adds what is
+new since the last save.
+
+Travel time is estimated from the great-circle distance with a road detour
+factor and an average speed (ROUTE_ROAD_FACTOR, ROUTE_SPEED_KMH), which
+suits the mountain roads between the tribes and the city better than a
+straight line.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from backend import metrics
+from backend.geocoding import Coordinates, geocoder, normalize_place
+from backend.routing.distance import haversine_matrix
+
+logger = logging.getLogger(__name__)
+
+ROUTE_MATRIX_PATH = os.getenv(
+    'ROUTE_MATRIX_PATH', os.path.join(os.getcwd(), 'backend', 'data', 'distance_matrix.npz')
+)
+ROUTE_MATRIX_REFRESH = float(os.getenv('ROUTE_MATRIX_REFRESH', 10))
+ROUTE_ROAD_FACTOR = float(os.getenv('ROUTE_ROAD_FACTOR', 1.4))
+ROUTE_SPEED_KMH = float(os.getenv('ROUTE_SPEED_KMH', 40))
+
+# Rows resolved this long before the newest one seen are read again, so a
+# transaction that committed late is not missed.
+_OVERLAP_SECONDS = 300
+
+VERSION_QUERY = "SELECT version FROM resource_versions WHERE resource = 'locations'"
+
+CHANGES_QUERY = """
+    SELECT name, lat, lng, EXTRACT(EPOCH FROM resolved_at)
+    FROM location_coordinates
+    WHERE lat IS NOT NULL AND resolved_at > to_timestamp(%s)
+"""
+
+_updates = metrics.counter(
+    "route_matrix_updates_total", "Places added to or moved in the distance matrix, by source.", ["source"])
+
+
+def travel_seconds(meters):
+    """
+    Estimated driving time for a great-circle distance.
+    """
+    return meters * ROUTE_ROAD_FACTOR / (ROUTE_SPEED_KMH / 3.6)
+
+
+class DistanceMatrix:
+    """
+    Distances (meters) and travel times (seconds) between all known places.
+
+    Args:
+        path (str): The .npz file the matrix is persisted to; None to keep it in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = ROUTE_MATRIX_PATH):
+        self.path = path
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self._lat = np.empty(0)
+        self._lng = np.empty(0)
+        self._distance = np.empty((0, 0), dtype=np.float32)
+        self._duration = np.empty((0, 0), dtype=np.float32)
+        self._watermark = 0.0  # newest resolved_at (epoch seconds) read from the table
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._save_task = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return normalize_place(name) in self.index
+
+    def index_of(self, name: str) -> Optional[int]:
+        return self.index.get(normalize_place(name)) if name else None
+
+    def distance(self, origin: str, destination: str) -> Optional[float]:
+        """
+        Great-circle distance in meters, or None if either place is unknown.
+        """
+        i, j = self.index_of(origin), self.index_of(destination)
+        if i is None or j is None:
+            return None
+        return float(self._distance[i, j])
+
+    def duration(self, origin: str, destination: str) -> Optional[float]:
+        """
+        Estimated travel time in seconds, or None if either place is unknown.
+        """
+        i, j = self.index_of(origin), self.index_of(destination)
+        if i is None or j is None:
+            return None
+        return float(self._duration[i, j])
+
+    def submatrix(self, origins: Iterable[str], destinations: Iterable[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Distances and travel times between two lists of places.
+
+        Returns:
+            tuple: (distance, duration) arrays of shape (len(origins), len(destinations)),
+            or None if any place is unknown.
+        """
+        rows = [self.index_of(name) for name in origins]
+        cols = [self.index_of(name) for name in destinations]
+        if None in rows or None in cols:
+            return None
+        grid = np.ix_(np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp))
+        return self._distance[grid], self._duration[grid]
+
+    def indexes(self, names: Iterable[str]) -> np.ndarray:
+        """
+        Matrix indexes of the places, -1 for unknown ones.
+        """
+        return np.asarray([self.index.get(normalize_place(name), -1) if name else -1 for name in names], dtype=np.intp)
+
+    def detours(self, origins: Iterable[str], destinations: Iterable[str], pickup: str, dropoff: str) -> np.ndarray:
+        """
+        Extra meters of driving origin -> pickup -> dropoff -> destination
+        instead of origin -> destination, for many routes at once.
+
+        Args:
+            origins (list): Route start of each route.
+            destinations (list): Route end of each route.
+            pickup (str): Where the goods are picked up.
+            dropoff (str): Where the goods are delivered.
+
+        Returns:
+            np.ndarray: One detour per route; NaN where any place is unknown.
+        """
+        origin, destination = self.indexes(origins), self.indexes(destinations)
+        result = np.full(len(origin), np.nan)
+        p, q = self.index_of(pickup), self.index_of(dropoff)
+        if p is None or q is None:
+            return result
+        known = (origin >= 0) & (destination >= 0)
+        o, b = origin[known], destination[known]
+        d = self._distance
+        result[known] = d[o, p] + d[p, q] + d[q, b] - d[o, b]
+        return result
+
+    def detour_matrix(self, origins: Iterable[str], destinations: Iterable[str],
+                      pickups: Iterable[str], dropoffs: Iterable[str]) -> np.ndarray:
+        """
+        `detours` of many routes for many pickup and drop-off pairs at once.
+
+        Returns:
+            np.ndarray: (routes, pairs) detours in meters; NaN where any place is unknown.
+        """
+        o, b = self.indexes(origins), self.indexes(destinations)
+        p, q = self.indexes(pickups), self.indexes(dropoffs)
+        if not len(self.names):
+            return np.full((len(o), len(p)), np.nan)
+        d = self._distance
+        result = (d[o[:, None], p[None, :]] + d[p, q][None, :] + d[q[None, :], b[:, None]]
+                  - d[o, b][:, None]).astype(np.float64)
+        result[((o < 0) | (b < 0))[:, None] | ((p < 0) | (q < 0))[None, :]] = np.nan
+        return result
+
+    def coordinates(self, name: str) -> Optional[Coordinates]:
+        i = self.index_of(name)
+        return Coordinates(float(self._lat[i]), float(self._lng[i])) if i is not None else None
+
+    def update(self, places: Dict[str, Coordinates], source: str = "geocoder") -> int:
+        """
+        Add places, or move places whose coordinates changed, computing only
+        their rows and columns.
+
+        Args:
+            places (dict): Normalized name -> Coordinates.
+            source (str): Metric label of where the places came from.
+
+        Returns:
+            int: The number of places added or moved.
+        """
+        changed, added = [], []
+        for name, coordinates in places.items():
+            i = self.index.get(name)
+            if i is None:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+                added.append(coordinates)
+                changed.append(self.index[name])
+            elif (self._lat[i], self._lng[i]) != (coordinates.lat, coordinates.lng):
+                self._lat[i], self._lng[i] = coordinates.lat, coordinates.lng
+                changed.append(i)
+        if not changed:
+            return 0
+        if added:
+            self._lat = np.concatenate((self._lat, [c.lat for c in added]))
+            self._lng = np.concatenate((self._lng, [c.lng for c in added]))
+
+        n = len(self.names)
+        if len(self._distance) < n:
+            self._distance = self._grow(self._distance, n)
+            self._duration = self._grow(self._duration, n)
+        rows = np.asarray(changed, dtype=np.intp)
+        block = haversine_matrix(self._lat[rows], self._lng[rows], self._lat, self._lng).astype(np.float32)
+        self._distance[rows, :n] = block
+        self._distance[:n, rows] = block.T
+        self._duration[rows, :n] = travel_seconds(block)
+        self._duration[:n, rows] = travel_seconds(block).T
+        _updates.inc(len(changed), source=source)
+        self._schedule_save()
+        return len(changed)
+
+    @staticmethod
+    def _grow(matrix: np.ndarray, n: int) -> np.ndarray:
+        """
+        Copy into a larger buffer, doubling so repeated additions stay amortized O(n) per place.
+        """
+        capacity = max(n, 2 * len(matrix), 16)
+        grown = np.zeros((capacity, capacity), dtype=matrix.dtype)
+        grown[:len(matrix), :len(matrix)] = matrix
+        return grown
+
+    async def refresh(self, conn, force: bool = False, version=None):
+        """
+        Read places other workers resolved since the last refresh.
+        At most one version check per ROUTE_MATRIX_REFRESH seconds, unless
+        the caller already read the `locations` version: then the changes are
+        read as soon as it moved, so a response tagged with that version
+        carries its distances.
+
+        Args:
+            conn (Connection): The database connection.
+            force (bool): Check now regardless of the interval.
+            version (int): The `locations` version the caller read, if any.
+        """
+        def current():
+            if force:
+                return False
+            if version is not None:
+                return version == self._version
+            return time.monotonic() - self._checked_at < ROUTE_MATRIX_REFRESH
+
+        if current():
+            return
+        async with self._lock:
+            if current():
+                return
+            self._checked_at = time.monotonic()
+            cur = conn.cursor()
+            try:
+                if version is None:
+                    await cur.execute(VERSION_QUERY)
+                    row = await cur.fetchone()
+                    version = row[0] if row else None
+                    if version == self._version and not force:
+                        return
+                await cur.execute(CHANGES_QUERY, (max(self._watermark - _OVERLAP_SECONDS, 0),))
+                rows = await cur.fetchall()
+            finally:
+                await cur.close()
+            self._version = version
+            if rows:
+                self._watermark = max(self._watermark, max(float(row[3]) for row in rows))
+                self.update({name: Coordinates(lat, lng) for name, lat, lng, _ in rows}, source="table")
+
+    def load(self):
+        """
+        Load the persisted matrix, if any. A file built with other travel-time
+        settings, or unreadable, is ignored and the matrix is rebuilt from the table.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                settings = (float(data["road_factor"]), float(data["speed_kmh"]))
+                if settings != (ROUTE_ROAD_FACTOR, ROUTE_SPEED_KMH):
+                    logger.info("Distance matrix built with other travel settings %s; rebuilding", settings)
+                    return
+                names = [str(name) for name in data["names"]]
+                n = len(names)
+                self.names = names
+                self.index = {name: i for i, name in enumerate(names)}
+                self._lat = data["lat"].astype(np.float64)
+                self._lng = data["lng"].astype(np.float64)
+                self._distance = data["distance"][:n, :n].astype(np.float32)
+                self._duration = data["duration"][:n, :n].astype(np.float32)
+                self._watermark = float(data["watermark"])
+        except Exception:
+            logger.exception("Error loading distance matrix from %s", self.path)
+            return
+        logger.info("Loaded distance matrix of %d places from %s", len(self.names), self.path)
+
+    def save(self):
+        """
+        Write the matrix atomically (temporary file, then rename).
+        """
+        if not self.path:
+            return
+        n = len(self.names)
+        snapshot = {
+            "names": np.asarray(self.names, dtype=str),
+            "lat": self._lat.copy(),
+            "lng": self._lng.copy(),
+            "distance": self._distance[:n, :n].copy(),
+            "duration": self._duration[:n, :n].copy(),
+            "watermark": np.float64(self._watermark),
+            "road_factor": np.float64(ROUTE_ROAD_FACTOR),
+            "speed_kmh": np.float64(ROUTE_SPEED_KMH),
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(temporary, **snapshot)
+        os.replace(temporary, self.path)
+
+    def _schedule_save(self):
+        """
+        Save once the current burst of updates is over, off the event loop.
+        """
+        if not self.path or (self._save_task and not self._save_task.done()):
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_soon())
+        except RuntimeError:
+            self.save()
+
+    async def _save_soon(self):
+        await asyncio.sleep(1)
+        try:
+            await asyncio.to_thread(self.save)
+        except Exception:
+            logger.exception("Error saving distance matrix to %s", self.path)
+
+    def attach_coordinates(self, orders: List[dict]) -> List[dict]:
+        """
+        Add `coordinates` to each order payload and each of its items, like
+        `GeocodingService.attach_coordinates` but from the matrix alone, so
+        the polled list endpoints run no lookup queries. Places not in the
+        matrix get None and are geocoded in the background; they show up
+        once the `locations` version moves.
+
+        Args:
+            orders (list): Order dicts as returned by the list endpoints.
+
+        Returns:
+            list: The same orders.
+        """
+        unknown = set()
+
+        def coordinates_of(name):
+            i = self.index_of(name)
+            if i is None:
+                if name:
+                    unknown.add(name)
+                return None
+            return {"lat": float(self._lat[i]), "lng": float(self._lng[i])}
+
+        for order in orders:
+            order["coordinates"] = coordinates_of(order.get("location"))
+            for item in order.get("items") or []:
+                item["coordinates"] = coordinates_of(item.get("location"))
+        if unknown:
+            geocoder.prefetch(unknown)
+        return orders
+
+    def attach_distances(self, orders: List[dict]) -> List[dict]:
+        """
+        Add `distance_m` and `duration_s` to each order payload: the longest
+        pickup-to-destination leg among its items, or None if no leg is known.
+
+        Args:
+            orders (list): Order dicts as returned by the list endpoints.
+
+        Returns:
+            list: The same orders.
+        """
+        for order in orders:
+            destination = self.index_of(order.get("location"))
+            legs = []
+            if destination is not None:
+                for item in order.get("items") or []:
+                    pickup = self.index_of(item.get("location"))
+                    if pickup is not None:
+                        legs.append(pickup)
+            if legs:
+                leg = max(legs, key=lambda pickup: self._distance[pickup, destination])
+                order["distance_m"] = round(float(self._distance[leg, destination]), 1)
+                order["duration_s"] = round(float(self._duration[leg, destination]))
+            else:
+                order["distance_m"] = None
+                order["duration_s"] = None
+        return orders
+
+    async def close(self):
+        """
+        Write pending changes.
+        """
+        if self._save_task and not self._save_task.done():
+            self._save_task.cancel()
+            await asyncio.gather(self._save_task, return_exceptions=True)
+            await asyncio.to_thread(self.save)
+
+
+distance_matrix = DistanceMatrix()
+geocoder.subscribe(distance_matrix.update)
+
+metrics.gauge("route_matrix_locations", "Places in the distance matrix.", callback=lambda: len(distance_matrix))
@@ -0,0 +1,128 @@
+"""
+Turn a driver's orders into pickup and drop-off stops and order them.
+"""
+from typing import List, NamedTuple, Optional
+import numpy as np
+from backend.geocoding import normalize_place
+from backend.routing.distance import haversine_matrix
+from backend.routing.matrix import travel_seconds
+from backend.routing.solver import plan_stops
+
+# Item locations the order endpoints render for items without one.
+_NO_PLACE = {"", "None", "null"}
+
+
+class Stop(NamedTuple):
+    order_id: int
+    service: str
+    kind: str  # 'pickup' or 'dropoff'
+    location: str
+    coordinates: Optional[dict]
+
+
+def order_stops(orders: List[dict]):
+    """
+    Stops of the orders and the pickup-before-dropoff pairs between them.
+
+    Each order is dropped off at its `location`; each distinct item location
+    is a pickup. Pickups at the drop-off place itself are left out. Orders
+    are expected to carry `coordinates` from `attach_coordinates`.
+
+    Returns:
+        tuple: (stops with coordinates, (pickup, dropoff) index pairs, stops without coordinates)
+    """
+    stops, precedence, unresolved = [], [], []
+    for order in orders:
+        dropoff = Stop(order["id"], order["service"], "dropoff", order["location"], order.get("coordinates"))
+        pickups = {}
+        for item in order.get("items") or []:
+            place = item.get("location")
+            if place is None or place in _NO_PLACE:
+                continue
+            key = normalize_place(place)
+            if key == normalize_place(dropoff.location) or key in pickups:
+                continue
+            pickups[key] = Stop(order["id"], order["service"], "pickup", place, item.get("coordinates"))
+
+        if dropoff.coordinates is None:
+            unresolved.append(dropoff)
+            dropoff_index = None
+        else:
+            dropoff_index = len(stops)
+            stops.append(dropoff)
+        for pickup in pickups.values():
+            if pickup.coordinates is None:
+                unresolved.append(pickup)
+                continue
+            stops.append(pickup)
+            if dropoff_index is not None:
+                precedence.append((len(stops) - 1, dropoff_index))
+    return stops, precedence, unresolved
+
+
+def plan_route(orders: List[dict], origin: Optional[dict] = None, matrix=None) -> dict:
+    """
+    Visiting order of all pickups and drop-offs of the orders.
+
+    Args:
+        orders (list): Order dicts with coordinates attached.
+        origin (dict): The driver's position as {"lat", "lng"}, if known.
+        matrix (DistanceMatrix): Precomputed distances between places; stop
+            distances are computed from their coordinates when it lacks any of them.
+
+    Returns:
+        dict: `stops` in visiting order with leg and cumulative distances in
+        meters and travel times in seconds, the totals, and `unresolved`
+        stops without coordinates.
+    """
+    stops, precedence, unresolved = order_stops(orders)
+    result = {
+        "origin": origin,
+        "stops": [],
+        "total_distance_m": 0.0,
+        "total_duration_s": 0.0,
+        "unresolved": [{"order_id": s.order_id, "service": s.service, "kind": s.kind, "location": s.location}
+                       for s in unresolved],
+    }
+    if not stops:
+        return result
+
+    lat = np.array([s.coordinates["lat"] for s in stops])
+    lng = np.array([s.coordinates["lng"] for s in stops])
+    names = [s.location for s in stops]
+    known = matrix.submatrix(names, names) if matrix is not None else None
+    if known is not None:
+        distances, durations = known
+    else:
+        distances = haversine_matrix(lat, lng)
+        durations = travel_seconds(distances)
+    start = haversine_matrix([origin["lat"]], [origin["lng"]], lat, lng)[0] if origin else None
+    visit = plan_stops(distances, precedence, start)
+
+    total = total_time = 0.0
+    previous = None
+    for index in visit:
+        if previous is not None:
+            leg, leg_time = float(distances[previous, index]), float(durations[previous, index])
+        elif start is not None:
+            leg, leg_time = float(start[index]), float(travel_seconds(start[index]))
+        else:
+            leg = leg_time = 0.0
+        total += leg
+        total_time += leg_time
+        stop = stops[index]
+        result["stops"].append({
+            "order_id": stop.order_id,
+            "service": stop.service,
+            "kind": stop.kind,
+            "location": stop.location,
+            "coordinates": stop.coordinates,
+            "leg_distance_m": round(leg, 1),
+            "cumulative_distance_m": round(total, 1),
+            "leg_duration_s": round(leg_time),
+            "cumulative_duration_s": round(total_time),
+        })
+        previous = index
+    result["total_distance_m"] = round(total, 1)
+    result["total_duration_s"] = round(total_time)
+    return result
@@ -0,0 +1,173 @@
+"""
+Stop ordering for a single vehicle with pickup-before-dropoff constraints.
+
+The route is an open path: it starts at the driver's position (or at any stop
+when the position is unknown) and ends at the last stop. A greedy
+nearest-feasible-neighbour tour is improved by 2-opt segment reversals and
+single-stop relocations until no move shortens it. Every move keeps all
+precedence pairs in order, and the cost of all candidate moves for one stop
+is evaluated in a single vectorized NumPy expression, so a round over n stops
+costs O(n²) array work instead of O(n³) Python loops.
+"""
+import os
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+ROUTE_MAX_ROUNDS = int(os.getenv('ROUTE_MAX_ROUNDS', 100))
+
+_EPS = 1e-9
+
+
+def route_cost(distances: np.ndarray, order: Sequence[int], start: Optional[np.ndarray] = None) -> float:
+    """
+    Length of visiting the stops in the given order.
+
+    Args:
+        distances (np.ndarray): Stop-to-stop costs, shape (n, n).
+        order (list): Stop indexes in visiting order.
+        start (np.ndarray): Cost from the origin to each stop, if there is one.
+    """
+    if not len(order):
+        return 0.0
+    order = np.asarray(order, dtype=np.intp)
+    cost = float(distances[order[:-1], order[1:]].sum())
+    if start is not None:
+        cost += float(start[order[0]])
+    return cost
+
+
+def plan_stops(distances: np.ndarray, precedence: Sequence[Tuple[int, int]] = (),
+               start: Optional[np.ndarray] = None, max_rounds: int = ROUTE_MAX_ROUNDS) -> List[int]:
+    """
+    Order stops to minimize the path length while visiting each
+    `before` stop ahead of its `after` stop.
+
+    Args:
+        distances (np.ndarray): Stop-to-stop costs, shape (n, n); need not be symmetric.
+        precedence (list): (before, after) stop index pairs, e.g. (pickup, dropoff).
+        start (np.ndarray): Cost from the origin to each stop; the path may start
+            anywhere when omitted.
+        max_rounds (int): Upper bound on local search rounds.
+
+    Returns:
+        list: Stop indexes in visiting order.
+
+    Raises:
+        ValueError: If the precedence pairs contain a cycle.
+    """
+    n = len(distances)
+    if n == 0:
+        return []
+    # Node 0 is the origin and node n + 1 a free end, so both path ends
+    # behave like any other edge in the moves below.
+    d = np.zeros((n + 2, n + 2))
+    d[1:n + 1, 1:n + 1] = distances
+    if start is not None:
+        d[0, 1:n + 1] = start
+    pairs = np.asarray(precedence, dtype=np.intp).reshape(-1, 2) + 1
+
+    route = _construct(d, pairs, n)
+    preds = [pairs[pairs[:, 1] == node, 0] for node in range(n + 2)]
+    succs = [pairs[pairs[:, 0] == node, 1] for node in range(n + 2)]
+    for _ in range(max_rounds):
+        improved = _two_opt(d, route, pairs)
+        route, moved = _relocate(d, route, preds, succs)
+        if not (improved or moved):
+            break
+    return [int(node) - 1 for node in route[1:-1]]
+
+
+def _construct(d: np.ndarray, pairs: np.ndarray, n: int) -> np.ndarray:
+    """
+    Nearest feasible neighbour: repeatedly go to the closest stop whose
+    predecessors have all been visited.
+    """
+    indegree = np.bincount(pairs[:, 1], minlength=n + 2) if len(pairs) else np.zeros(n + 2, dtype=np.intp)
+    successors = [[] for _ in range(n + 2)]
+    for before, after in pairs:
+        successors[before].append(after)
+    available = np.zeros(n + 2, dtype=bool)
+    available[1:n + 1] = indegree[1:n + 1] == 0
+
+    route = [0]
+    current = 0
+    for _ in range(n):
+        if not available.any():
+            raise ValueError("Precedence constraints contain a cycle")
+        current = int(np.argmin(np.where(available, d[current], np.inf)))
+        available[current] = False
+        route.append(current)
+        for after in successors[current]:
+            indegree[after] -= 1
+            if indegree[after] == 0:
+                available[after] = True
+    route.append(n + 1)
+    return np.asarray(route, dtype=np.intp)
+
+
+def _two_opt(d: np.ndarray, route: np.ndarray, pairs: np.ndarray) -> bool:
+    """
+    Reverse route[i..j] where that shortens the path, in place.
+
+    A reversal is feasible unless it contains both stops of a pair, i.e. for a
+    given i, j must stay below the earliest `after` whose `before` is at or
+    past i. Segment costs come from prefix sums in both directions, so
+    asymmetric costs are handled exactly.
+    """
+    m = len(route)
+    improved = False
+    pos = np.empty(m, dtype=np.intp)
+    pos[route] = np.arange(m)
+    forward = np.concatenate(([0.0], np.cumsum(d[route[:-1], route[1:]])))
+    backward = np.concatenate(([0.0], np.cumsum(d[route[1:], route[:-1]])))
+    for i in range(1, m - 2):
+        limit = m - 1
+        if len(pairs):
+            after = pos[pairs[:, 1]][pos[pairs[:, 0]] >= i]
+            if len(after):
+                limit = min(limit, int(after.min()))
+        if limit <= i + 1:
+            continue
+        j = np.arange(i + 1, limit)
+        a, b = route[i - 1], route[i]
+        delta = (d[a, route[j]] + d[b, route[j + 1]] + (backward[j] - backward[i])
+                 - d[a, b] - d[route[j], route[j + 1]] - (forward[j] - forward[i]))
+        k = int(np.argmin(delta))
+        if delta[k] < -_EPS:
+            end = int(j[k])
+            route[i:end + 1] = route[i:end + 1][::-1].copy()
+            pos[route] = np.arange(m)
+            forward = np.concatenate(([0.0], np.cumsum(d[route[:-1], route[1:]])))
+            backward = np.concatenate(([0.0], np.cumsum(d[route[1:], route[:-1]])))
+            improved = True
+    return improved
+
+
+def _relocate(d: np.ndarray, route: np.ndarray, preds: list, succs: list):
+    """
+    Move single stops to the cheapest feasible gap: after all of their
+    predecessors and before all of their successors.
+
+    Returns:
+        tuple: (new route, whether any stop moved).
+    """
+    moved = False
+    for node in route[1:-1].tolist():
+        i = int(np.flatnonzero(route == node)[0])
+        a, b = route[i - 1], route[i + 1]
+        gain = d[a, node] + d[node, b] - d[a, b]
+        rest = np.delete(route, i)
+        pos = np.empty(len(d), dtype=np.intp)
+        pos[rest] = np.arange(len(rest))
+        # Gap k lies between rest[k] and rest[k + 1].
+        lo = int(pos[preds[node]].max()) if len(preds[node]) else 0
+        hi = int(pos[succs[node]].min()) - 1 if len(succs[node]) else len(rest) - 2
+        if hi < lo:
+            continue
+        k = np.arange(lo, hi + 1)
+        cost = d[rest[k], node] + d[node, rest[k + 1]] - d[rest[k], rest[k + 1]]
+        best = int(np.argmin(cost))
+        if cost[best] < gain - _EPS:
+            route = np.insert(rest, k[best] + 1, node)
+            moved = True
+    return route, moved
@@ -27,9 +27,12 @@ import { Alert, AlertDescription } from "@/components/ui/alert";
 export default function Page() {
   const ITEM_PER_PAGE = 16
   const [user, setUser] = useState<User | null>(null); 
-  const [onShelfProducts, setOnShelfProducts] = useState<ProductInfo[]>()
   const [mapItems, setMapItems] = useState<ProductInfo[]>()
   const [searchContent, setSearchContent] = useState('')
+  // What the loaded pages show: a category of the catalog or a search text
+  const [category, setCategory] = useState<string | undefined>(undefined)
+  const [searchQuery, setSearchQuery] = useState('')
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [currentPage, setCurrentPage] = useState(1);
   const [cartMessage, setCartMessage] = useState('empty')
   
@@ -44,11 +47,27 @@ export default function Page() {
   }, []);
   
 
-  const get_on_sell_product = async() => {
+  /**
+   * Load the first page of products, or append the page after `cursor`.
+   * @param _category - Only products of this category.
+   * @param query - Search text; searches instead of listing the catalog when not empty.
+   * @param cursor - The nextCursor of the loaded pages, or null to start over.
+   */
+  const get_on_sell_product = async(_category?: string, query: string = '', cursor: string | null = null) => {
     try{
-      const products = await ConsumerService.get_on_sell_product()
-      setMapItems(products)
-      setOnShelfProducts(products)
+      const page = query
+        ? await ConsumerService.search_products(query, cursor)
+        : await ConsumerService.get_on_sell_product({ category: _category }, cursor)
+      if(cursor){
+        setMapItems((prev) => [...(prev ?? []), ...page.products])
+      }
+      else{
+        setMapItems(page.products)
+        setCurrentPage(1)
+      }
+      setCategory(_category)
+      setSearchQuery(query)
+      setNextCursor(page.nextCursor)
     }
     catch(e){
       console.log('Show agricultural produce error occur')
@@ -57,18 +76,17 @@ export default function Page() {
     
   }
   const handleSelect = (value: string) => {
-    const products = onShelfProducts?.filter((product) => product.category == value)
-    if(products != undefined){
-      setMapItems(products)
-    }
+    get_on_sell_product(value)
   }
   const handleSearchRegion: React.ChangeEventHandler<HTMLInputElement> = (event) => {
     setSearchContent(event.target.value);
   }
   const handleSearchButton = () => {
-    const products = onShelfProducts?.filter((product) => product.name.includes(searchContent))
-    if(products != undefined){
-      setMapItems(products)
+    get_on_sell_product(undefined, searchContent.trim())
+  }
+  const handleLoadMore = () => {
+    if(nextCursor){
+      get_on_sell_product(category, searchQuery, nextCursor)
     }
   }
   const handleAddCart = async (produceId: Number, unit: string) => {
@@ -172,7 +190,7 @@ export default function Page() {
         {currentData!= undefined && currentData.map((product) => (  
           <div key={product.id.toString()} className="w-full lg:h-[550px] h-[250px] bg-white border-gray-200 border-4 text-center lg:p-5 p-1">
             <img 
-              src={product.img_link} 
+              src={product.img_variants?.list ?? product.img_link} 
               alt={product.name} 
               width={500} 
               height={500} 
@@ -210,6 +228,16 @@ export default function Page() {
         currentPage={currentPage}
         onPageChange={setCurrentPage}
       />
+      {nextCursor && (
+        <div className="flex justify-center pb-10">
+          <Button
+            variant="outline"
+            className="lg:text-2xl text-md bg-white"
+            onClick={handleLoadMore}>
+            載入更多商品
+          </Button>
+        </div>
+      )}
       
     </div>
   )
@@ -11,6 +11,7 @@ import { Sheet, SheetContent, SheetHeader, SheetTitle, SheetClose } from "@/comp
 import { useRouter } from 'next/navigation';
 import UserService from '@/services/user/user'; 
 import DriverService  from '@/services/driver/driver';
+import OrderService from '@/services/order/order';
 import { Driver } from '@/interfaces/driver/driver'; 
 import { Order } from '@/interfaces/tribe_resident/buyer/order';
 import { DriverOrder } from '@/interfaces/driver/driver';
@@ -20,6 +21,7 @@ const DriverPage: React.FC = () => {
     const [showRegisterForm, setShowRegisterForm] = useState(false);
     const [showDriverOrders, setShowDriverOrders] = useState(false);
     const [unacceptedOrders, setUnacceptedOrders] = useState<Order[]>([]);
+    const [unacceptedCursor, setUnacceptedCursor] = useState<string | null>(null);
     const [acceptedOrders, setAcceptedOrders] = useState<Order[]>([]);
     const [driverData, setDriverData] = useState<Driver | null>(null);
     const router = useRouter();
@@ -86,24 +88,48 @@ const DriverPage: React.FC = () => {
         }
     }, [isClient, user]);
 
+    // Refresh the order lists when the server pushes an order event
+    useEffect(() => {
+        if (!driverData) return;
+        const source = new EventSource('/api/orders/events');
+        const refresh = () => {
+            handleFetchUnacceptedOrders();
+            handleFetchDriverOrders(driverData.id);
+        };
+        ['created', 'accepted', 'transferred', 'completed', 'resync'].forEach((type) =>
+            source.addEventListener(type, refresh)
+        );
+        return () => source.close();
+    }, [driverData]);
+
 
 
     /**
-     * Fetch unaccepted orders.
+     * Fetch the first page of unaccepted orders.
      */
     const handleFetchUnacceptedOrders = async () => {
         try {
-            const response = await fetch(`/api/orders`);
-            if (!response.ok) {
-                throw new Error('Failed to fetch unaccepted orders');
-            }
-            
-            let data: Order[] = await response.json();
-            data = data.filter((order) => 
-                order.order_status === "未接單")
-                .sort((a, b) => (b.is_urgent ? 1 : 0) - (a.is_urgent ? 1 : 0));
+            const page = await OrderService.get_orders({ order_status: "未接單" });
+            const data = page.orders.sort((a, b) => (b.is_urgent ? 1 : 0) - (a.is_urgent ? 1 : 0));
                 
             setUnacceptedOrders(data);
+            setUnacceptedCursor(page.nextCursor);
+        } catch (error) {
+            console.error('Error fetching unaccepted orders:', error);
+        }
+    };
+
+    /**
+     * Append the next page of unaccepted orders.
+     */
+    const handleLoadMoreUnacceptedOrders = async () => {
+        if (!unacceptedCursor) return;
+        try {
+            const page = await OrderService.get_orders({ order_status: "未接單" }, unacceptedCursor);
+            setUnacceptedOrders(prev =>
+                [...prev, ...page.orders].sort((a, b) => (b.is_urgent ? 1 : 0) - (a.is_urgent ? 1 : 0))
+            );
+            setUnacceptedCursor(page.nextCursor);
         } catch (error) {
             console.error('Error fetching unaccepted orders:', error);
         }
@@ -401,6 +427,16 @@ const DriverPage: React.FC = () => {
                                     onComplete={handleCompleteOrder}
                                     driverId={driverData?.id || 0}
                                 />
+                                {unacceptedCursor && (
+                                    <div className="flex justify-center mt-4">
+                                        <Button
+                                            className="px-6 py-3 text-lg font-bold border-2 border-black text-black bg-white hover:bg-blue-500 hover:text-white"
+                                            onClick={handleLoadMoreUnacceptedOrders}
+                                        >
+                                            載入更多訂單
+                                        </Button>
+                                    </div>
+                                )}
                             </div>
                         )}
 
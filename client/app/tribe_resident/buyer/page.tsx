@@ -14,6 +14,7 @@ import { FontAwesomeIcon } from "@fortawesome/react-fontawesome";
 import { faShoppingCart } from "@fortawesome/free-solid-svg-icons";
 import { useMediaQuery } from "react-responsive";
 import UserService from "@/services/user/user";
+import OrderService from "@/services/order/order";
 import { Product } from "@/interfaces/tribe_resident/buyer/buyer";
 import { CartItem } from "@/interfaces/tribe_resident/buyer/buyer";
 import { Order } from "@/interfaces/tribe_resident/buyer/order";
@@ -51,6 +52,7 @@ const BuyerPage: React.FC = () => {
   const [isAddItemFormOpen, setIsAddItemFormOpen] = useState(false);
   const [user, setUser] = useState(UserService.getLocalStorageUser());
   const [orders, setOrders] = useState<Order[]>([]);
+  const [ordersCursor, setOrdersCursor] = useState<string | null>(null);
   const [isFormOpen, setIsFormOpen] = useState(false);
 
   // Media query hooks to detect the device type
@@ -77,20 +79,36 @@ const BuyerPage: React.FC = () => {
   };
 
   /**
-   * Fetches order data from the server and updates the state
+   * Fetches the first page of the user's orders and updates the state
    */
   const fetchOrders = useCallback(async () => {
     try {
-      const response = await fetch("/api/orders");
-      if (!response.ok) {
-        throw new Error("Failed to fetch orders");
+      if (!user || user.id === 0) {
+        return;
       }
-      const allOrders: Order[] = await response.json();
-      setOrders(allOrders);
+      const page = await OrderService.get_orders({ buyer_id: user.id });
+      setOrders(page.orders);
+      setOrdersCursor(page.nextCursor);
     } catch (error) {
       console.error("Error fetching orders:", error);
     }
-  }, []);
+  }, [user]);
+
+  /**
+   * Appends the next page of the user's orders
+   */
+  const loadMoreOrders = useCallback(async () => {
+    try {
+      if (!user || user.id === 0 || !ordersCursor) {
+        return;
+      }
+      const page = await OrderService.get_orders({ buyer_id: user.id }, ordersCursor);
+      setOrders((prevOrders) => [...prevOrders, ...page.orders]);
+      setOrdersCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Error fetching orders:", error);
+    }
+  }, [user, ordersCursor]);
 
   /**
    * Sets up an event listener to handle changes in user data
@@ -358,6 +376,8 @@ const BuyerPage: React.FC = () => {
             onClose={() => setIsFormOpen(false)}
             orders={orders}
             fetchOrders={fetchOrders}
+            hasMoreOrders={ordersCursor !== null}
+            onLoadMore={loadMoreOrders}
           />
         </div>
       </div>
@@ -45,6 +45,7 @@ import { LatLng, Route, Leg } from "@/interfaces/navigation/navigation";
 import { Driver,DriverOrder } from "@/interfaces/driver/driver";
 import { Order } from "@/interfaces/tribe_resident/buyer/order";
 import DriverService  from '@/services/driver/driver';
+import GeocodingService from '@/services/geocoding/geocoding';
 import { Popover, PopoverTrigger, PopoverContent } from "@/components/ui/popover";
 import MapContent from "@/components/navigation/MapContent";
 
@@ -72,25 +73,6 @@ const getDistanceInMeters = (loc1: LatLng, loc2: LatLng): number => {
   return distance;
 };
 
-// Function to fetch coordinates based on place name
-const fetchCoordinates = async (placeName: string) => {
-  try {
-    const response = await fetch(
-      `https://maps.googleapis.com/maps/api/geocode/json?address=${encodeURIComponent(
-        placeName
-      )}&key=${process.env.NEXT_PUBLIC_GOOGLE_MAPS_API_KEY}`
-    );
-    const data = await response.json();
-    if (data.results && data.results.length > 0) {
-      const location = data.results[0].geometry.location;
-      return location;
-    }
-  } catch (error) {
-    console.error("Error fetching coordinates:", error);
-  }
-  return null;
-};
-
 // Custom hook for debouncing input values
 const useDebounce = (value: string, delay: number) => {
   const [debouncedValue, setDebouncedValue] = useState(value);
@@ -224,7 +206,8 @@ const MapComponentContent: React.FC = () => {
       if (!driverData) {
         throw new Error('Driver data is null');
       }
-      const response = await fetch(`/api/drivers/${driverData.id}/orders`);
+      // Only active deliveries are routed on the map.
+      const response = await fetch(`/api/drivers/${driverData.id}/orders?status=${encodeURIComponent('接單')}`);
       if (!response.ok) {
         throw new Error('無法獲取司機訂單');
       }
@@ -282,26 +265,21 @@ const MapComponentContent: React.FC = () => {
     if (waypointsParam) {
       try {
         const waypoints = JSON.parse(decodeURIComponent(waypointsParam));
-        // Fetch coordinates for each waypoint
-        Promise.all(waypoints.map(async (location: string) => {
-          const coords = await fetchCoordinates(location);
-          if (coords) {
-            return {
-              name: location,
-              location: coords
-            };
-          }
-          return null;
-        })).then(validDestinations => {
-          // Filter out null destinations
-          const filteredDestinations = validDestinations.filter((dest): dest is { name: string; location: { lat: number; lng: number } } => dest !== null);
-          
+        // Resolve coordinates of all waypoints in one request
+        GeocodingService.resolve(waypoints).then(results => {
+          // Drop places without coordinates
+          const filteredDestinations = waypoints
+            .filter((location: string) => results[location])
+            .map((location: string) => ({ name: location, location: results[location] as LatLng }));
+
           setDestinations(prev => {
             // Remove the last destination (terminal)
             const terminal = prev[prev.length - 1];
             // Add the new waypoints
             return [...filteredDestinations, terminal];
           });
+        }).catch(error => {
+          console.error("Error fetching coordinates:", error);
         });
       } catch (error) {
         console.error("解析中間點時出錯:", error);
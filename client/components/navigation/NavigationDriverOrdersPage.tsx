@@ -38,7 +38,7 @@ const NavigationDriverOrdersPage: React.FC<DriverOrdersPageProps> = ({
    */
   const fetchDriverOrders = useCallback(async () => {
     try {
-      const response = await fetch(`/api/drivers/${driverData.id}/orders`);
+      const response = await fetch(`/api/drivers/${driverData.id}/orders?status=${encodeURIComponent(orderStatus)}`);
       if (!response.ok) {
         throw new Error('Failed to fetch driver orders');
       }
@@ -48,7 +48,7 @@ const NavigationDriverOrdersPage: React.FC<DriverOrdersPageProps> = ({
       console.error('Error fetching driver orders:', error);
       setError('獲取訂單失敗');
     }
-  }, [driverData.id]);
+  }, [driverData.id, orderStatus]);
 
   /**
    * Fetch orders when the component mounts or driverData changes.
@@ -147,7 +147,6 @@ const NavigationDriverOrdersPage: React.FC<DriverOrdersPageProps> = ({
             variant={orderStatus === "接單" ? "default" : "outline"}
             onClick={() => {
               setOrderStatus("接單");
-              fetchDriverOrders(); 
             }}
           >
             接單
@@ -156,7 +155,6 @@ const NavigationDriverOrdersPage: React.FC<DriverOrdersPageProps> = ({
             variant={orderStatus === "已完成" ? "default" : "outline"}
             onClick={() => {
               setOrderStatus("已完成");
-              fetchDriverOrders(); 
             }}
           >
             已完成
@@ -15,9 +15,11 @@ interface OrderManagementProps {
   onClose: () => void;
   orders: Order[]; // List of orders passed as props
   fetchOrders: () => void; // Function to refetch orders
+  hasMoreOrders: boolean; // Whether the server has another page of orders
+  onLoadMore: () => void; // Function to append the next page of orders
 }
 
-const OrderManagement: React.FC<OrderManagementProps> = ({ isOpen, onClose, orders, fetchOrders }) => {
+const OrderManagement: React.FC<OrderManagementProps> = ({ isOpen, onClose, orders, fetchOrders, hasMoreOrders, onLoadMore }) => {
   const [filteredOrders, setFilteredOrders] = useState<Order[]>([]);
   const [user, setUser] = useState(UserService.getLocalStorageUser());
 
@@ -118,6 +120,15 @@ const OrderManagement: React.FC<OrderManagementProps> = ({ isOpen, onClose, orde
             <p className="mt-4 text-center"> 沒有相關的訂單</p>
           )}
 
+          {/* Load the next page of orders on demand */}
+          {hasMoreOrders && (
+            <div className="w-full flex justify-center mt-4">
+              <Button variant="outline" onClick={onLoadMore}>
+                載入更多訂單
+              </Button>
+            </div>
+          )}
+
           {/* Display error message if needed */}
           {error && <div className="text-red-600 mt-2 text-center">{error}</div>}
         </div>
@@ -43,6 +43,7 @@ const useDebounce = (value: string, delay: number) => {
 };
 export const SellerDialog = () => {
   const [imgBase64, setImgBase64] = useState('')
+  const [imgFile, setImgFile] = useState<File | null>(null)
   const [date, setDate] = useState<Date>()
   const [itemName, setItemName] = useState('')
   const [itemPrice, setItemPrice] = useState('')
@@ -144,7 +145,10 @@ export const SellerDialog = () => {
 
     setIsUploading(true);
     try {
-      const res_img = await SellerService.upload_image(imgBase64);
+      // Send the file as multipart to avoid base64 overhead; fall back to base64
+      const res_img = imgFile
+        ? await SellerService.upload_image_file(imgFile)
+        : await SellerService.upload_image(imgBase64);
       const item: UploadItem = {
         name: itemName,
         price: itemPrice,
@@ -300,7 +304,7 @@ export const SellerDialog = () => {
             <Input id="unit" className="col-span-3" onChange={handleUnitButton}/>
           </div>
           <CategorySelector handleIsOpen={handleSelector}/>
-          <UploadRegion handleSendImg={setImgBase64} handleSendType={setFileType} handleSendError={setErrorMessage} selectorStatus={isSelectorOpen}/>
+          <UploadRegion handleSendImg={setImgBase64} handleSendFile={setImgFile} handleSendType={setFileType} handleSendError={setErrorMessage} selectorStatus={isSelectorOpen}/>
           <div className="grid grid-cols-4 items-center gap-4">
             <Label htmlFor="quantity" className="text-left lg:text-2xl text-md">
               放置地點
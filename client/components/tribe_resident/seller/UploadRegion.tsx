@@ -4,6 +4,7 @@ import { Label } from '@/components/ui/label'
 
 interface middleProps {
   handleSendImg: (img: string) => void
+  handleSendFile?: (file: File | null) => void
   handleSendType: (fileType: string) => void
   handleSendError: (error: string) => void
   selectorStatus:boolean
@@ -12,10 +13,11 @@ export const UploadRegion: React.FC<middleProps> = (prop) => {
   const [img, setImg] = useState<string | null>(null)
   const allowedFileTypes = ["image/png", "image/jpeg", "image/jpg"]
   
-  const { handleSendImg, handleSendType, handleSendError} = prop
+  const { handleSendImg, handleSendFile, handleSendType, handleSendError} = prop
   const handleChange = (event: React.ChangeEvent<HTMLInputElement>) => {
     handleSendError('')
     setImg(null)
+    handleSendFile?.(null)
     const file = event.target.files?.[0]; //get file
     if(file == undefined){
       handleSendType('')
@@ -23,6 +25,7 @@ export const UploadRegion: React.FC<middleProps> = (prop) => {
     }
     else if(file?.type != undefined &&  allowedFileTypes.includes(file?.type)){
       handleSendType(file?.type)
+      handleSendFile?.(file)
       const fileData = new FileReader();
       const base64Prefix: string = "base64,";
       fileData.addEventListener("load", async() => {
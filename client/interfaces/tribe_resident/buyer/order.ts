@@ -1,3 +1,5 @@
+import { LatLng } from '@/interfaces/navigation/navigation';
+
 
 
 export interface Order {
@@ -25,6 +27,9 @@ export interface Order {
     items: OrderItem[];
     is_put?: boolean; //for agricultural product
     timestamp?: string;
+    coordinates?: LatLng | null; // of location, filled in by the server
+    distance_m?: number | null; // longest pickup-to-location leg, filled in by the server
+    duration_s?: number | null; // estimated driving time of that leg
 }
 
 
@@ -36,4 +41,5 @@ export interface OrderItem {
     img: string;
     location?: string; 
     category?: string;
+    coordinates?: LatLng | null; // of location, filled in by the server
 }
\ No newline at end of file
@@ -44,6 +44,7 @@ export interface UploadItem {
     img_link: string
     img_id: string  
     unit: string
+    img_variants?: { [variant: string]: string }
   }
   
   export interface ProductOrderInfo {
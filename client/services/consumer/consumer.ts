@@ -1,17 +1,58 @@
 import { AddCartRequest, PurchasedProductRequest } from '@/interfaces/consumer/consumer';
+import { ProductInfo } from '@/interfaces/tribe_resident/seller/seller';
+
+export interface CatalogFilters {
+  category?: string;
+  location?: string;
+  min_price?: number;
+  max_price?: number;
+}
+
+export interface ProductPage {
+  products: ProductInfo[];
+  nextCursor: string | null;
+}
+
 class ConsumerService{
-  async get_on_sell_product(){
-    const res = await fetch('/api/consumer',{
+  /**
+   * Fetch one page of the on-sale products matching the filters.
+   * @param filters - Server-side filters applied to GET /api/consumer.
+   * @param cursor - The nextCursor of the previous page, or null for the first page.
+   * @returns The products of the page and the cursor of the next one (null on the last page).
+   */
+  async get_on_sell_product(filters: CatalogFilters = {}, cursor: string | null = null): Promise<ProductPage>{
+    const params = new URLSearchParams()
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== undefined && value !== null)
+        params.append(key, String(value))
+    })
+    if (cursor)
+      params.append('cursor', cursor)
+    return this.get_product_page(`/api/consumer?${params.toString()}`)
+  }
+  /**
+   * Fetch one page of on-sale products matching a search text, best matches first.
+   * @param q - The search text.
+   * @param cursor - The nextCursor of the previous page, or null for the first page.
+   * @returns The products of the page and the cursor of the next one (null on the last page).
+   */
+  async search_products(q: string, cursor: string | null = null): Promise<ProductPage>{
+    const params = new URLSearchParams({ q })
+    if (cursor)
+      params.append('cursor', cursor)
+    return this.get_product_page(`/api/consumer/search?${params.toString()}`)
+  }
+  private async get_product_page(url: string): Promise<ProductPage>{
+    const res = await fetch(url,{
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
       },
     })
     const data = await res.json()
-    
     if(!res.ok)
       throw new Error(`Error: ${data.detail}`)
-    return data
+    return { products: data, nextCursor: res.headers.get('X-Next-Cursor') }
   }
   async add_shopping_cart(req: AddCartRequest){
     const res = await fetch('/api/consumer/cart',{///cart
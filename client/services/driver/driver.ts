@@ -53,5 +53,20 @@ class DriverService{
       }
       return data
     }
+    // Planned visiting order of the driver's accepted orders, starting from the given position
+    async get_driver_route(driver_id: Number, origin?: { lat: number; lng: number }){
+      const query = origin ? `?lat=${origin.lat}&lng=${origin.lng}` : ''
+      const res = await fetch(`/api/drivers/${driver_id}/route${query}`,{
+        method: 'GET',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+      })
+      const data = await res.json()
+
+      if(!res.ok)
+        throw new Error(`Error: ${data.detail}`)
+      return data
+    }
   }
   export default new DriverService()
\ No newline at end of file
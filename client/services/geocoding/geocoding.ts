@@ -0,0 +1,20 @@
+import { LatLng } from '@/interfaces/navigation/navigation';
+
+class GeocodingService{
+    // Resolve many place names in one request; unknown places map to null
+    async resolve(names: string[]): Promise<Record<string, LatLng | null>>{
+      const res = await fetch('/api/geocoding/resolve',{
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({names: names})
+      })
+      const data = await res.json()
+
+      if(!res.ok)
+        throw new Error(`Error: ${data.detail}`)
+      return data.results
+    }
+}
+export default new GeocodingService()
@@ -0,0 +1,45 @@
+import { Order } from '@/interfaces/tribe_resident/buyer/order';
+
+export interface OrderFilters {
+  order_status?: string;
+  service?: string;
+  location?: string;
+  is_urgent?: boolean;
+  buyer_id?: number;
+  since?: string;
+  until?: string;
+}
+
+export interface OrderPage {
+  orders: Order[];
+  nextCursor: string | null;
+}
+
+class OrderService{
+  /**
+   * Fetch one page of the orders matching the filters.
+   * @param filters - Server-side filters applied to GET /api/orders.
+   * @param cursor - The nextCursor of the previous page, or null for the first page.
+   * @returns The orders of the page and the cursor of the next one (null on the last page).
+   */
+  async get_orders(filters: OrderFilters = {}, cursor: string | null = null): Promise<OrderPage>{
+    const params = new URLSearchParams()
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== undefined && value !== null)
+        params.append(key, String(value))
+    })
+    if (cursor)
+      params.append('cursor', cursor)
+    const res = await fetch(`/api/orders?${params.toString()}`,{
+      method: 'GET',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+    })
+    const data = await res.json()
+    if(!res.ok)
+      throw new Error(`Error: ${data.detail}`)
+    return { orders: data, nextCursor: res.headers.get('X-Next-Cursor') }
+  }
+}
+export default new OrderService()
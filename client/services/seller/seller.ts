@@ -22,6 +22,26 @@ class SellerService {
     const data = await res.json();
     return data;
   }
+  async upload_image_file(file: File) {
+    const form = new FormData();
+    form.append('file', file);
+    const res = await fetch('/api/seller/upload_image/file', {
+      method: 'POST',
+      body: form,
+    });
+    if (!res.ok) {
+      let errorMessage = 'Unknown error';
+      try {
+        const data = await res.json();
+        errorMessage = data.detail || `HTTP ${res.status} error`;
+      } catch (e) {
+        errorMessage = await res.text(); // 處理非 JSON 回應
+      }
+      throw new Error(`Error: ${errorMessage}`);
+    }
+    const data = await res.json();
+    return data;
+  }
   async upload_item(req: UploadItem){
     const res = await fetch('/api/seller/',{
     method: 'POST',